@@ -23,12 +23,24 @@ import logging
 class ProcessPool:
     """A simple wrapper of multiprocessing.pool."""
 
-    def __init__(self, size=0, maxtasksperchild=10000):
+    def __init__(self, size=0, maxtasksperchild=10000, initializer=None, initargs=()):
+        """
+        :param size: number of worker processes, cpu count by default
+        :param maxtasksperchild: tasks after which a worker is replaced
+        :param initializer: called with `initargs` when a worker starts,
+            objects which can only be shared by inheritance (for example
+            a ProcessClassicEventWriter) are passed to workers this way
+        :param initargs: params of initializer
+        """
+
         if size <= 0:
             size = multiprocessing.cpu_count()
         self.size = size
         self._pool = multiprocessing.Pool(
-            processes=size, maxtasksperchild=maxtasksperchild
+            processes=size,
+            initializer=initializer,
+            initargs=initargs,
+            maxtasksperchild=maxtasksperchild,
         )
         self._stopped = False
 
@@ -17,20 +17,49 @@
 
 from splunklib.modularinput.argument import Argument
 
-from .checkpointer import CheckpointerException, FileCheckpointer, KVStoreCheckpointer
-from .event import EventException, HECEvent, XMLEvent
-from .event_writer import ClassicEventWriter, HECEventWriter
+from .async_checkpointer import (
+    AsyncCheckpointer,
+    AsyncKVStoreCheckpointer,
+    AsyncSQLiteCheckpointer,
+)
+from .checkpointer import (
+    CheckpointerException,
+    FileCheckpointer,
+    KVStoreCheckpointer,
+    SQLiteCheckpointer,
+)
+from .dedup import Deduplicator
+from .event import EventColumns, EventException, HECEvent, XMLEvent
+from .event_writer import (
+    AsyncHECEventWriter,
+    ClassicEventWriter,
+    HECEventWriter,
+    HECEventWriterException,
+    ProcessClassicEventWriter,
+)
+from .hec_spool import HECSpool, HECSpoolException
 from .modular_input import ModularInput, ModularInputException
 
 __all__ = [
     "EventException",
+    "EventColumns",
     "XMLEvent",
     "HECEvent",
     "ClassicEventWriter",
+    "ProcessClassicEventWriter",
     "HECEventWriter",
+    "AsyncHECEventWriter",
+    "HECEventWriterException",
+    "HECSpool",
+    "HECSpoolException",
     "CheckpointerException",
     "KVStoreCheckpointer",
+    "SQLiteCheckpointer",
     "FileCheckpointer",
+    "AsyncCheckpointer",
+    "AsyncKVStoreCheckpointer",
+    "AsyncSQLiteCheckpointer",
+    "Deduplicator",
     "Argument",
     "ModularInputException",
     "ModularInput",
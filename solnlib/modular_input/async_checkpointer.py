@@ -0,0 +1,647 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""This module provides asyncio checkpointers: AsyncKVStoreCheckpointer,
+AsyncSQLiteCheckpointer for modular inputs written on asyncio."""
+
+import asyncio
+import io
+import json
+import logging
+import re
+import ssl
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from collections.abc import Iterable
+from urllib.parse import quote, urlencode
+
+from splunklib import binding
+
+from ..splunkenv import get_splunkd_access_info
+from .checkpointer import (
+    _DELTA,
+    SQLiteCheckpointer,
+    _decode_state,
+    _delta_key,
+    _delta_seq,
+    _encode_state,
+    _merge_deltas,
+)
+
+__all__ = [
+    "AsyncCheckpointer",
+    "AsyncKVStoreCheckpointer",
+    "AsyncSQLiteCheckpointer",
+]
+
+
+class AsyncCheckpointer(metaclass=ABCMeta):
+    """Base class of asyncio checkpointer.
+
+    Updates issued while a write is in progress, or by coroutines running
+    in the same event loop iteration, are coalesced into one write, and
+    `update` returns once its state is written. Only the latest state of a
+    key is written, and `get` returns states which are waiting to be
+    written.
+
+    States must not be modified until `update` returns.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._pending_future = None
+        self._writing = {}
+        self._write_lock = None
+
+    async def update(self, key: str, state: Any) -> None:
+        """Updates the checkpoint of `key`.
+
+        Arguments:
+            key: Checkpoint key.
+            state: Checkpoint state.
+        """
+        await self._coalesce({key: state})
+
+    async def batch_update(self, states: Iterable[dict[str, Any]]) -> None:
+        """Updates multiple checkpoints.
+
+        Arguments:
+            states: Iterable that contains dicts with "_key" and "state"
+                keys.
+        """
+        await self._coalesce({state["_key"]: state["state"] for state in states})
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Gets the checkpoint of `key`.
+
+        Arguments:
+            key: Checkpoint key.
+
+        Returns:
+            Checkpoint state or `None` in case of no checkpoint.
+        """
+        return (await self.get_many([key]))[key]
+
+    async def get_many(self, keys: Iterable[str]) -> dict:
+        """Gets the checkpoints of `keys`.
+
+        Arguments:
+            keys: Checkpoint keys.
+
+        Returns:
+            Dict of key to checkpoint state, `None` for keys with no
+            checkpoint.
+        """
+        keys = list(keys)
+        states = {}
+        for key in keys:
+            if key in self._pending:
+                states[key] = self._pending[key]
+            elif key in self._writing:
+                states[key] = self._writing[key]
+        missing = [key for key in keys if key not in states]
+        if missing:
+            found = await self._get_many(missing)
+            for key in missing:
+                states[key] = found.get(key)
+        return states
+
+    async def delete(self, key: str) -> None:
+        """Deletes the checkpoint of `key`.
+
+        Arguments:
+            key: Checkpoint key.
+        """
+        # A write in progress must not write the key back
+        async with self._lock():
+            self._pending.pop(key, None)
+            await self._delete(key)
+
+    async def close(self) -> None:
+        """Waits for the writes in progress and releases resources."""
+        while self._pending_future is not None:
+            try:
+                await asyncio.shield(self._pending_future)
+            except Exception:
+                # raised to the callers of update
+                pass
+        async with self._lock():
+            pass
+
+    @abstractmethod
+    async def _write(self, states: dict):
+        """Writes a dict of key to state."""
+
+    @abstractmethod
+    async def _get_many(self, keys: list) -> dict:
+        """Reads the states of `keys`, missing keys can be left out."""
+
+    @abstractmethod
+    async def _delete(self, key: str):
+        """Deletes the state of `key`."""
+
+    def _lock(self):
+        # Created in the event loop of the checkpointer
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    async def _coalesce(self, states):
+        if not states:
+            return
+        self._pending.update(states)
+        future = self._pending_future
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending_future = loop.create_future()
+            loop.create_task(self._write_pending(future))
+        await asyncio.shield(future)
+
+    async def _write_pending(self, future):
+        async with self._lock():
+            # Updates issued until the lock is acquired are written together
+            states = self._writing = self._pending
+            self._pending = {}
+            self._pending_future = None
+            try:
+                if states:
+                    await self._write(states)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+            finally:
+                self._writing = {}
+
+
+class _AsyncSplunkdClient:
+    """Minimal HTTP/1.1 client of splunkd on asyncio streams, with a pool
+    of keep-alive connections."""
+
+    def __init__(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        session_key: str,
+        verify: bool = False,
+        max_connections: int = 10,
+        timeout: Optional[float] = 60.0,
+    ):
+        self._host = host
+        self._port = port
+        self._session_key = session_key
+        self._ssl = None
+        if scheme == "https":
+            self._ssl = ssl.create_default_context()
+            if not verify:
+                self._ssl.check_hostname = False
+                self._ssl.verify_mode = ssl.CERT_NONE
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._slots = None
+        self._idle = []
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        query: dict = None,
+        body: bytes = b"",
+        content_type: str = "application/json",
+    ):
+        """Send a request to splunkd.
+
+        Returns:
+            Tuple of status, reason, list of headers and body.
+
+        Raises:
+            asyncio.TimeoutError: If the request and its response took more
+                than `timeout` seconds.
+        """
+        if query:
+            path += "?" + urlencode(query)
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self._host}:{self._port}\r\n"
+            f"Authorization: Splunk {self._session_key}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode("utf-8")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_connections)
+        async with self._slots:
+            # The connection is closed when the exchange is cancelled
+            return await asyncio.wait_for(self._exchange(head + body), self._timeout)
+
+    async def _exchange(self, request):
+        while True:
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(
+                    self._host, self._port, ssl=self._ssl
+                )
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, reason, headers, data, keep_alive = await self._read(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    # closed by splunkd while idle
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, reason, headers, data
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    @staticmethod
+    async def _read(reader):
+        status_line = await reader.readuntil(b"\r\n")
+        _, status, reason = (
+            status_line.decode("latin-1").strip().split(" ", 2) + [""]
+        )[:3]
+        headers = []
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers.append((name.strip().lower(), value.strip()))
+        fields = dict(headers)
+
+        if fields.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # trailers
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in fields:
+            data = await reader.readexactly(int(fields["content-length"]))
+        else:
+            data = await reader.read()
+            fields["connection"] = "close"
+        keep_alive = fields.get("connection", "").lower() != "close"
+        return int(status), reason, headers, data, keep_alive
+
+
+class AsyncKVStoreCheckpointer(AsyncCheckpointer):
+    """asyncio KVStore checkpointer.
+
+    Talks to KV Store with non-blocking requests on asyncio streams, keys
+    of `get_many` are read by concurrent queries and concurrent updates are
+    written with one `batch_save` request. States are encoded like the ones
+    of `KVStoreCheckpointer`, both can share a collection: set and counter
+    states written by `KVStoreCheckpointer.add_to_set` and `increment` are
+    merged with their delta documents. `update` does not maintain the
+    versions of `KVStoreCheckpointer.update_if`.
+
+    Examples:
+        >>> from solnlib.modular_input import async_checkpointer
+        >>> async def collect():
+        >>>     checkpoint = async_checkpointer.AsyncKVStoreCheckpointer(
+        >>>         "unique_addon_checkpoints",
+        >>>         "session_key",
+        >>>         "unique_addon",
+        >>>     )
+        >>>     states = await checkpoint.get_many(partitions)
+        >>>     await asyncio.gather(
+        >>>         *(checkpoint.update(p, {"offset": 10}) for p in partitions)
+        >>>     )
+        >>>     await checkpoint.close()
+    """
+
+    # Max keys looked up by one query of `get_many`
+    query_keys = 100
+    # Max delta documents read by one query
+    query_page_size = 10000
+    # Max documents saved by one request
+    max_documents_per_batch_save = 1000
+    # Retries of requests which failed with a server error
+    retries = 3
+
+    def __init__(
+        self,
+        collection_name: str,
+        session_key: str,
+        app: str,
+        owner: Optional[str] = "nobody",
+        scheme: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        verify: bool = False,
+        max_connections: int = 10,
+        codec: str = "json",
+        timeout: Optional[float] = 60.0,
+    ):
+        """Initializes AsyncKVStoreCheckpointer, the collection is created
+        on first use if it is missing.
+
+        Arguments:
+            collection_name: Collection name of kvstore checkpointer.
+            session_key: Splunk access token.
+            app: App name of namespace.
+            owner: (optional) Owner of namespace, default is `nobody`.
+            scheme: (optional) The access scheme, default is None.
+            host: (optional) The host name, default is None which reads
+                the splunkd access info (a blocking call).
+            port: (optional) The port number, default is None.
+            verify: (optional) Verify the certificate of splunkd, default
+                is False.
+            max_connections: (optional) Max number of concurrent requests,
+                default is 10.
+            codec: (optional) Codec of the states written, see
+                `KVStoreCheckpointer`, default is `json`.
+            timeout: (optional) Max seconds of a request and its response,
+                `asyncio.TimeoutError` is raised when it is exceeded, None
+                waits forever, default is 60.0.
+        """
+        super().__init__()
+        if not all([scheme, host, port]):
+            scheme, host, port = get_splunkd_access_info(session_key)
+        self._client = _AsyncSplunkdClient(
+            scheme, host, port, session_key, verify, max_connections, timeout
+        )
+        self._codec = codec
+        self._collection_name = re.sub(r"[^\w]+", "_", collection_name)
+        self._namespace = "/servicesNS/{}/{}/storage/collections".format(
+            quote(owner, safe=""), quote(app, safe="")
+        )
+        self._data_path = "{}/data/{}".format(
+            self._namespace, quote(self._collection_name, safe="")
+        )
+        self._collection_ready = None
+
+    async def close(self) -> None:
+        """Waits for the writes in progress and closes the connections."""
+        await super().close()
+        await self._client.close()
+
+    async def _write(self, states):
+        records = [
+            {"_key": key, "state": _encode_state(state, self._codec)}
+            for key, state in states.items()
+        ]
+        limit = self.max_documents_per_batch_save
+        await asyncio.gather(
+            *(
+                self._request(
+                    "POST",
+                    self._data_path + "/batch_save",
+                    body=json.dumps(records[i : i + limit]).encode("utf-8"),
+                )
+                for i in range(0, len(records), limit)
+            )
+        )
+
+    async def _get_many(self, keys):
+        queries = [
+            {"$or": [{"_key": key} for key in keys[i : i + self.query_keys]]}
+            for i in range(0, len(keys), self.query_keys)
+        ]
+        results = await asyncio.gather(
+            *(
+                self._request(
+                    "GET",
+                    self._data_path,
+                    {"query": json.dumps(query), "fields": "_key,state"},
+                )
+                for query in queries
+            )
+        )
+        records = [record for _, body in results for record in json.loads(body)]
+        states = await asyncio.gather(
+            *(self._decode_merged(record) for record in records)
+        )
+        return {record["_key"]: state for record, state in zip(records, states)}
+
+    async def _decode_merged(self, record):
+        """Decode the state of `record`, merged with its delta documents
+        like `KVStoreCheckpointer` does."""
+        key = record["_key"]
+        stale_seq = None
+        while True:
+            state = _decode_state(record["state"])
+            if not (isinstance(state, dict) and _DELTA in state):
+                return state
+            deltas = await self._query_deltas(key, state["seq"])
+            if (
+                deltas
+                and _delta_seq(deltas[0]) != state["seq"] + 1
+                and state["seq"] != stale_seq
+            ):
+                # The base was read before a compaction which deleted the
+                # deltas following it, read the new base
+                stale_seq = state["seq"]
+                status, body = await self._request(
+                    "GET",
+                    "{}/{}".format(self._data_path, quote(key, safe="")),
+                    ok=(404,),
+                )
+                if status == 404:
+                    return None
+                record = json.loads(body)
+                continue
+            return _merge_deltas(
+                state[_DELTA],
+                state["base"],
+                (_decode_state(delta["state"])["data"] for delta in deltas),
+            )
+
+    async def _query_deltas(self, key, after):
+        query = json.dumps(
+            {"_key": {"$gt": _delta_key(key, after), "$lt": key + "#d$"}}
+        )
+        deltas = []
+        while True:
+            _, body = await self._request(
+                "GET",
+                self._data_path,
+                {
+                    "query": query,
+                    "sort": "_key",
+                    "fields": "_key,state",
+                    "limit": self.query_page_size,
+                    "skip": len(deltas),
+                },
+            )
+            page = json.loads(body)
+            deltas.extend(page)
+            if len(page) < self.query_page_size:
+                return deltas
+
+    async def _delete(self, key):
+        await self._request(
+            "DELETE", "{}/{}".format(self._data_path, quote(key, safe="")), ok=(404,)
+        )
+
+    async def _ensure_collection(self):
+        if self._collection_ready is None:
+            self._collection_ready = asyncio.ensure_future(self._create_collection())
+        try:
+            await asyncio.shield(self._collection_ready)
+        except Exception:
+            # tried again by the next request
+            self._collection_ready = None
+            raise
+
+    async def _create_collection(self):
+        status, _ = await self._request(
+            "GET",
+            "{}/config/{}".format(
+                self._namespace, quote(self._collection_name, safe="")
+            ),
+            {"output_mode": "json"},
+            ok=(404,),
+            ensure_collection=False,
+        )
+        if status == 404:
+            await self._request(
+                "POST",
+                self._namespace + "/config",
+                {"output_mode": "json"},
+                body=urlencode(
+                    {
+                        "name": self._collection_name,
+                        "field.state": "string",
+                        "field.version": "number",
+                    }
+                ).encode("utf-8"),
+                content_type="application/x-www-form-urlencoded",
+                ensure_collection=False,
+            )
+
+    async def _request(
+        self,
+        method,
+        path,
+        query=None,
+        body=b"",
+        content_type="application/json",
+        ok=(),
+        ensure_collection=True,
+    ):
+        """Send a request, retrying server errors like `utils.retry`.
+
+        Returns:
+            Tuple of status and body.
+
+        Raises:
+            binding.HTTPError: If the response status is an error which is
+                not in `ok`.
+        """
+        if ensure_collection:
+            await self._ensure_collection()
+        for i in range(self.retries + 1):
+            status, reason, headers, data = await self._client.request(
+                method, path, query, body, content_type
+            )
+            if status < 400 or status in ok:
+                return status, data
+            if status < 500 or i == self.retries:
+                break
+            logging.warning(
+                "%s %s failed with status %d, retrying.", method, path, status
+            )
+            await asyncio.sleep(2**i)
+        raise binding.HTTPError(
+            binding.record(
+                {
+                    "status": status,
+                    "reason": reason,
+                    "headers": headers,
+                    "body": io.BytesIO(data),
+                }
+            )
+        )
+
+
+class AsyncSQLiteCheckpointer(AsyncCheckpointer):
+    """asyncio checkpointer in a local SQLite database file.
+
+    Runs a `SQLiteCheckpointer` in a thread of its own instead of the
+    default executor of the event loop. Concurrent updates are written in
+    one transaction and `get_many` reads every key in one call.
+
+    Examples:
+        >>> from solnlib.modular_input import async_checkpointer
+        >>> async def collect():
+        >>>     checkpoint = async_checkpointer.AsyncSQLiteCheckpointer(
+        >>>         '/opt/splunk/var/...')
+        >>>     await checkpoint.update("input_1", {"offset": 10})
+        >>>     await checkpoint.close()
+    """
+
+    def __init__(self, checkpoint_dir: str, file_name: str = "checkpoints.sqlite"):
+        """Initializes AsyncSQLiteCheckpointer.
+
+        Arguments:
+            checkpoint_dir: Checkpoint directory.
+            file_name: (optional) Name of the database file in
+                `checkpoint_dir`, default is `checkpoints.sqlite`.
+        """
+        super().__init__()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="AsyncSQLiteCheckpointer"
+        )
+        self._checkpointer = self._executor.submit(
+            SQLiteCheckpointer, checkpoint_dir, file_name
+        ).result()
+
+    async def close(self) -> None:
+        """Waits for the writes in progress and closes the database."""
+        await super().close()
+        await self._run(self._checkpointer.close)
+        self._executor.shutdown(wait=True)
+
+    async def _write(self, states):
+        await self._run(
+            self._checkpointer.batch_update,
+            [{"_key": key, "state": state} for key, state in states.items()],
+        )
+
+    async def _get_many(self, keys):
+        return await self._run(
+            lambda: {key: self._checkpointer.get(key) for key in keys}
+        )
+
+    async def _delete(self, key):
+        await self._run(self._checkpointer.delete, key)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
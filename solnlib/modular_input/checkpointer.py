@@ -13,31 +13,177 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-"""This module provides two kinds of checkpointer: KVStoreCheckpointer,
-FileCheckpointer for modular input to save checkpoint."""
+"""This module provides three kinds of checkpointer: KVStoreCheckpointer,
+SQLiteCheckpointer, FileCheckpointer for modular input to save checkpoint."""
 
 import base64
+import binascii
 import json
 import logging
 import os
 import os.path as op
+import sqlite3
+import threading
+import time
 import traceback
 import warnings
+import weakref
+import zlib
 from abc import ABCMeta, abstractmethod
-from typing import Any, Optional
-from collections.abc import Iterable
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from collections.abc import Iterable, Iterator
 
 from splunklib import binding
 
-from solnlib import _utils, utils
+from solnlib import _utils, conf_manager, utils
 
-__all__ = ["CheckpointerException", "KVStoreCheckpointer", "FileCheckpointer"]
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = [
+    "CheckpointerException",
+    "KVStoreCheckpointer",
+    "SQLiteCheckpointer",
+    "FileCheckpointer",
+    "register_state_codec",
+]
 
 
 class CheckpointerException(Exception):
     pass
 
 
+# States encoded by other codecs than `json` start with this header, JSON
+# text never starts with `$`
+_CODEC_HEADER = "$codec:"
+
+
+def _json_zlib_encode(state: Any) -> str:
+    return base64.b64encode(zlib.compress(json.dumps(state).encode("utf-8"))).decode(
+        "ascii"
+    )
+
+
+def _json_zlib_decode(data: str) -> Any:
+    return json.loads(zlib.decompress(base64.b64decode(data)))
+
+
+def _msgpack_encode(state: Any) -> str:
+    return base64.b64encode(msgpack.packb(state, use_bin_type=True)).decode("ascii")
+
+
+def _msgpack_decode(data: str) -> Any:
+    return msgpack.unpackb(base64.b64decode(data), raw=False)
+
+
+_state_codecs = {
+    "json": (json.dumps, json.loads),
+    "json_zlib": (_json_zlib_encode, _json_zlib_decode),
+}
+if msgpack is not None:
+    _state_codecs["msgpack"] = (_msgpack_encode, _msgpack_decode)
+
+
+def register_state_codec(
+    name: str, encode: Callable[[Any], str], decode: Callable[[str], Any]
+):
+    """Register a codec of checkpoint states.
+
+    States are stored with a header naming their codec, so they are
+    decoded with the codec they were encoded with whatever the codec of
+    the checkpointer reading them is. The codec must be registered by
+    every process reading the states.
+
+    Arguments:
+        name: Codec name, passed as `codec` to the checkpointer.
+        encode: Function encoding a state to a string.
+        decode: Function decoding a string returned by `encode`.
+
+    Raises:
+        ValueError: If `name` is empty or contains `$`.
+
+    Examples:
+       >>> from solnlib.modular_input import checkpointer
+       >>> checkpointer.register_state_codec(
+       >>>     'json_bz2',
+       >>>     lambda state: base64.b64encode(bz2.compress(json.dumps(state).encode())).decode(),
+       >>>     lambda data: json.loads(bz2.decompress(base64.b64decode(data))))
+    """
+    if not name or "$" in name:
+        raise ValueError("Invalid state codec name: %s." % name)
+    _state_codecs[name] = (encode, decode)
+
+
+def _get_state_codec(name):
+    try:
+        return _state_codecs[name]
+    except KeyError:
+        raise ValueError("State codec %s is not available." % name)
+
+
+def _encode_state(state: Any, codec: str = "json") -> str:
+    encode, _ = _get_state_codec(codec)
+    if codec == "json":
+        # readable by the checkpointers which do not know about codecs
+        return encode(state)
+    return f"{_CODEC_HEADER}{codec}${encode(state)}"
+
+
+def _decode_state(data: str) -> Any:
+    if data.startswith(_CODEC_HEADER):
+        end = data.find("$", len(_CODEC_HEADER))
+        codec = data[len(_CODEC_HEADER) : end]
+        if end < 0 or codec not in _state_codecs:
+            raise CheckpointerException("Unknown state codec: %s." % codec)
+        return _state_codecs[codec][1](data[end + 1 :])
+    return json.loads(data)
+
+
+# States of delta checkpoints are dicts with this key, set to the kind of
+# the checkpoint
+_DELTA = "$delta"
+
+
+def _delta_key(key: str, seq: int) -> str:
+    # zero padded so deltas sort by sequence number
+    return "%s#d#%012d" % (key, seq)
+
+
+def _delta_seq(record: dict) -> int:
+    return int(record["_key"].rsplit("#", 1)[1])
+
+
+def _merge_deltas(kind: str, base: Any, deltas: Iterable) -> Any:
+    if kind == "set":
+        merged = set(base)
+        for items in deltas:
+            merged.update(items)
+    else:
+        merged = dict(base)
+        for counts in deltas:
+            for name, count in counts.items():
+                merged[name] = merged.get(name, 0) + count
+    return merged
+
+
+class _DeltaLog:
+    """Delta documents written by this process for one key."""
+
+    __slots__ = ("lock", "kind", "seq", "compacted", "compacting")
+
+    def __init__(self, kind):
+        self.lock = threading.Lock()
+        self.kind = kind
+        # Last sequence number written and last one merged into the base
+        self.seq = None
+        self.compacted = None
+        self.compacting = False
+
+
 class Checkpointer(metaclass=ABCMeta):
     """Base class of checkpointer."""
 
@@ -58,6 +204,10 @@ class Checkpointer(metaclass=ABCMeta):
     def delete(self, key: str):
         """Deletes document with an id that equals to `key`."""
 
+    def close(self):
+        """Writes pending updates if any and releases resources, called by
+        `ModularInput.execute` when `do_run` returns."""
+
 
 class KVStoreCheckpointer(Checkpointer):
     """KVStore checkpointer.
@@ -77,8 +227,61 @@ class KVStoreCheckpointer(Checkpointer):
         >>> checkpoint.update("input_1", {"timestamp": 1638043093})
         >>> checkpoint.get("input_1")
         >>> # returns {"timestamp": 1638043093}
+
+        With `write_behind`, updates are kept in memory and written in one
+        request per `flush_interval` seconds or `flush_count` keys:
+
+        >>> checkpoint = checkpointer.KVStoreCheckpointer(
+                "unique_addon_checkpoints",
+                "session_key",
+                "unique_addon",
+                write_behind=True,
+            )
+        >>> checkpoint.update("input_1", {"timestamp": 1638043093})
+        >>> checkpoint.close()
+
+        Checkpoints of many keys are read with a few requests and cached
+        for `cache_ttl` seconds by `preload` and `get_many`:
+
+        >>> checkpoint.preload("input_")
+        >>> checkpoint.get("input_1")
+        >>> checkpoint.get_many(["input_1", "input_2"])
+        >>> # returns {"input_1": {"timestamp": 1638043093}, "input_2": None}
+
+        Workers sharing keys update them only if nobody else did since
+        they read them:
+
+        >>> state, version = checkpoint.get_with_version("input_1")
+        >>> if not checkpoint.update_if("input_1", version, new_state):
+        >>>     ... # updated by another worker, read it again
+
+        Large states are stored compressed with `codec`, states written
+        with the default `json` codec are still read:
+
+        >>> checkpoint = checkpointer.KVStoreCheckpointer(
+                "unique_addon_checkpoints",
+                "session_key",
+                "unique_addon",
+                codec="json_zlib",
+            )
+
+        Set and counter states which grow a little per update are written
+        as small delta documents, merged by `get`:
+
+        >>> checkpoint.add_to_set("input_1_seen", ["id1", "id2"])
+        >>> checkpoint.increment("input_1_stats", {"events": 10})
+        >>> checkpoint.get("input_1_seen")
+        >>> # returns {"id1", "id2"}
     """
 
+    # Max documents returned by one query of `preload`
+    query_page_size = 10000
+    # Max keys looked up by one query of `get_many`
+    query_keys = 100
+    # Documents saved by one request when the limit of KV Store can not be
+    # read from limits.conf
+    default_max_documents_per_batch_save = 1000
+
     def __init__(
         self,
         collection_name: str,
@@ -88,6 +291,14 @@ class KVStoreCheckpointer(Checkpointer):
         scheme: Optional[str] = None,
         host: Optional[str] = None,
         port: Optional[int] = None,
+        write_behind: bool = False,
+        flush_interval: float = 5.0,
+        flush_count: int = 1000,
+        cache_ttl: float = 60.0,
+        max_documents_per_batch_save: Optional[int] = None,
+        batch_save_workers: int = 1,
+        codec: str = "json",
+        delta_compact_count: int = 100,
         **context: Any,
     ):
         """Initializes KVStoreCheckpointer.
@@ -100,13 +311,38 @@ class KVStoreCheckpointer(Checkpointer):
             scheme: (optional) The access scheme, default is None.
             host: (optional) The host name, default is None.
             port: (optional) The port number, default is None.
+            write_behind: (optional) Keep the latest state of updated keys
+                in memory and write them to KV Store later, default is
+                False.
+            flush_interval: (optional) Max seconds an update waits to be
+                written in write behind mode, default is 5.0.
+            flush_count: (optional) Number of updated keys after which
+                updates are written in write behind mode, default is 1000.
+            cache_ttl: (optional) Seconds the checkpoints read by `preload`
+                and `get_many` are cached, default is 60.0.
+            max_documents_per_batch_save: (optional) Max documents saved
+                by one request, default is None which reads
+                `max_documents_per_batch_save` of the `kvstore` stanza of
+                limits.conf when documents are first saved.
+            batch_save_workers: (optional) Number of requests saving the
+                chunks of a batch concurrently, default is 1.
+            codec: (optional) Codec of the states written: `json`,
+                `json_zlib` (zlib compressed JSON), `msgpack` when installed
+                or a codec registered with `register_state_codec`, default
+                is `json`. States written with any codec are read.
+            delta_compact_count: (optional) Number of delta documents of a
+                key written by `add_to_set` or `increment` after which they
+                are merged into its state in the background, default is 100.
             context: Other configurations for Splunk rest client.
 
         Raises:
             binding.HTTPError: HTTP error different from 404, for example 503
                 when KV Store is initializing and not ready to serve requests.
             CheckpointerException: If init KV Store checkpointer failed.
+            ValueError: If `codec` is not available.
         """
+        _get_state_codec(codec)
+        self._codec = codec
         try:
             if not context.get("pool_connections"):
                 context["pool_connections"] = 5
@@ -120,13 +356,48 @@ class KVStoreCheckpointer(Checkpointer):
                 scheme,
                 host,
                 port,
-                {"state": "string"},
+                {"state": "string", "version": "number"},
                 **context,
             )
         except KeyError:
             raise CheckpointerException("Get KV Store checkpointer failed.")
 
-    @utils.retry(exceptions=[binding.HTTPError])
+        self._conf_manager_args = (session_key, app, owner, scheme, host, port)
+        self._context = context
+        self._max_documents_per_batch_save = max_documents_per_batch_save
+        self._batch_save_workers = batch_save_workers
+        self._write_behind = write_behind
+        self._flush_count = flush_count
+        # Encoded state of the keys updated by this process, and of the
+        # keys among them not written to KV Store yet
+        self._written = {}
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Locks of the keys being written, and the version of the last
+        # document written by this process per key
+        self._key_locks = weakref.WeakValueDictionary()
+        self._key_locks_lock = threading.Lock()
+        self._versions = {}
+        self._flusher = None
+        self._closed = threading.Event()
+        self._cache_ttl = cache_ttl
+        # Key to (expiration time, document or None if there is none), and
+        # prefix to expiration time of the prefixes read by preload
+        self._cache = {}
+        self._preloaded = {}
+        self._delta_compact_count = delta_compact_count
+        self._delta_logs = {}
+        self._compactor = None
+        if write_behind:
+            self._flusher = threading.Thread(
+                target=self._run_flusher,
+                args=(flush_interval,),
+                name="KVStoreCheckpointerFlusher",
+                daemon=True,
+            )
+            self._flusher.start()
+
     def update(self, key: str, state: Any) -> None:
         """Updates document with an id that equals to `key` and `state` as
         document data.
@@ -140,13 +411,16 @@ class KVStoreCheckpointer(Checkpointer):
             binding.HTTPError: when an error occurred in Splunk, for example,
                 when Splunk is restarting and KV Store is not yet initialized.
         """
-        record = {"_key": key, "state": json.dumps(state)}
-        self._collection_data.batch_save(record)
+        record = {"_key": key, "state": _encode_state(state, self._codec)}
+        self._write_versioned([record])
 
-    @utils.retry(exceptions=[binding.HTTPError])
     def batch_update(self, states: Iterable[dict[str, Any]]) -> None:
         """Updates multiple documents.
 
+        Documents are saved with one request per
+        `max_documents_per_batch_save` documents, each request is retried
+        on its own.
+
         Arguments:
             states: Iterable that contains documents to update. Document should
                 be a dict with at least "state" key.
@@ -155,11 +429,51 @@ class KVStoreCheckpointer(Checkpointer):
             binding.HTTPError: when an error occurred in Splunk, for example,
                 when Splunk is restarting and KV Store is not yet initialized.
         """
-        for state in states:
-            state["state"] = json.dumps(state["state"])
-        self._collection_data.batch_save(*states)
+        records = [
+            dict(state, state=_encode_state(state["state"], self._codec))
+            for state in states
+        ]
+        self._write_versioned(records)
+
+    def flush(self) -> None:
+        """Writes the updates kept in memory in write behind mode.
+
+        Raises:
+            binding.HTTPError: when an error occurred in Splunk, the updates
+                are kept and written by the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty = self._dirty
+                self._dirty = {}
+            if not dirty:
+                return
+            try:
+                self._save(*dirty.values())
+            except Exception:
+                with self._lock:
+                    for key, record in dirty.items():
+                        self._dirty.setdefault(key, record)
+                raise
+
+    def close(self) -> None:
+        """Waits for the compaction of delta documents in progress, stops
+        the flusher thread and writes the updates kept in memory in write
+        behind mode.
+
+        Raises:
+            binding.HTTPError: when an error occurred in Splunk.
+        """
+        if self._compactor is not None:
+            self._compactor.shutdown(wait=True)
+            self._compactor = None
+        if self._flusher is None:
+            return
+        self._closed.set()
+        self._flusher.join()
+        self._flusher = None
+        self.flush()
 
-    @utils.retry(exceptions=[binding.HTTPError])
     def get(self, key: str) -> Optional[Any]:
         """Gets document with an id that equals to `key`.
 
@@ -174,14 +488,170 @@ class KVStoreCheckpointer(Checkpointer):
         Returns:
             Document data under `key` or `None` in case of no data.
         """
-        try:
-            record = self._collection_data.query_by_id(key)
-        except binding.HTTPError as e:
-            if e.status != 404:
-                logging.error(f"Get checkpoint failed: {traceback.format_exc()}.")
-                raise
-            return None
-        return json.loads(record["state"])
+        found, record = self._lookup(key)
+        if not found:
+            record = self._query_by_id(key)
+        return self._decode_merged(key, record)
+
+    def get_with_version(self, key: str) -> tuple[Optional[Any], int]:
+        """Gets document with an id that equals to `key` and its version,
+        to be passed to `update_if`. The document is always read from KV
+        Store, or from memory in write behind mode if it was updated by
+        this process.
+
+        Arguments:
+            key: `id` of the document to get.
+
+        Raises:
+            binding.HTTPError: When an error occurred in Splunk (not 404 code).
+
+        Returns:
+            Tuple of document data (`None` in case of no data) and version,
+            0 in case of no data.
+        """
+        record = self._current_record(key)
+        return self._decode_merged(key, record), self._version(record)
+
+    def update_if(self, key: str, expected_version: int, state: Any) -> bool:
+        """Updates document with an id that equals to `key` if its version
+        is still `expected_version`, and increments the version.
+
+        Versions are compared and updated under a per key lock of this
+        checkpointer object, KV Store has no conditional writes: workers
+        must share the checkpointer object, updates by other processes
+        between the read and the write are not detected. `update` and
+        `batch_update` increment the version too.
+
+        Arguments:
+            key: `id` of the document to update.
+            expected_version: Version returned by `get_with_version`.
+            state: Document data to update.
+
+        Raises:
+            binding.HTTPError: When an error occurred in Splunk.
+
+        Returns:
+            True if the document was updated, False if its version changed.
+        """
+        with self._locked([key]):
+            version = self._version(self._current_record(key))
+            if version != expected_version:
+                return False
+            record = {
+                "_key": key,
+                "state": _encode_state(state, self._codec),
+                "version": version + 1,
+            }
+            self._write([record])
+            return True
+
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """Gets documents with ids in `keys`, the documents which are not
+        cached are read with one query per `query_keys` keys and cached.
+
+        Arguments:
+            keys: `id` of the documents to get.
+
+        Raises:
+            binding.HTTPError: When an error occurred in Splunk.
+
+        Returns:
+            Dict of key to document data, `None` for keys with no data.
+        """
+        states = {}
+        missing = []
+        for key in keys:
+            found, record = self._lookup(key)
+            if found:
+                states[key] = self._decode_merged(key, record)
+            else:
+                missing.append(key)
+
+        for i in range(0, len(missing), self.query_keys):
+            keys = missing[i : i + self.query_keys]
+            records = {
+                record["_key"]: record
+                for record in self._query(
+                    {"$or": [{"_key": key} for key in keys]}, limit=len(keys)
+                )
+            }
+            expires = time.time() + self._cache_ttl
+            for key in keys:
+                record = records.get(key)
+                self._cache[key] = (expires, record)
+                states[key] = self._decode_merged(key, record)
+        return states
+
+    def preload(self, prefix: str = None) -> int:
+        """Reads every document of the collection, or the documents with an
+        id starting with `prefix`, into the cache with paginated queries.
+
+        Until the cache expires, `get` and `get_many` answer from the cache
+        and return `None` for preloaded prefixes without a document.
+
+        Arguments:
+            prefix: (optional) Prefix of the ids of the documents to read,
+                default is None which reads all documents.
+
+        Raises:
+            binding.HTTPError: When an error occurred in Splunk.
+
+        Returns:
+            Number of documents read.
+        """
+        query = {}
+        if prefix:
+            query = {"_key": {"$gte": prefix, "$lt": prefix + "\U0010ffff"}}
+        else:
+            prefix = ""
+        # Documents and the prefix expire together, a document read by the
+        # first page must not expire before the prefix
+        expires = time.time() + self._cache_ttl
+        count = 0
+        for records in self._query_pages(query):
+            for record in records:
+                if record["_key"].startswith(prefix):
+                    self._cache[record["_key"]] = (expires, record)
+            count += len(records)
+        self._preloaded[prefix] = expires
+        return count
+
+    def add_to_set(self, key: str, items: Iterable) -> None:
+        """Adds `items` to the set state of `key`, by writing a delta
+        document instead of the whole set. `get` returns the set.
+
+        Delta documents are merged into the state in the background every
+        `delta_compact_count` updates. Keys updated with `add_to_set` must
+        not be updated by `update` or by several processes.
+
+        Arguments:
+            key: `id` of the document to update.
+            items: Items to add, strings or numbers.
+
+        Raises:
+            binding.HTTPError: When an error occurred in Splunk.
+            CheckpointerException: If the state of `key` is not a set state
+                written by `add_to_set`.
+        """
+        self._write_delta(key, "set", list(items))
+
+    def increment(self, key: str, counts: dict[str, int]) -> None:
+        """Adds `counts` to the counter state of `key`, by writing a delta
+        document instead of the whole state. `get` returns the dict of
+        counters.
+
+        Delta documents are merged like the ones of `add_to_set`.
+
+        Arguments:
+            key: `id` of the document to update.
+            counts: Dict of counter name to the number to add.
+
+        Raises:
+            binding.HTTPError: When an error occurred in Splunk.
+            CheckpointerException: If the state of `key` is not a counter
+                state written by `increment`.
+        """
+        self._write_delta(key, "counter", dict(counts))
 
     @utils.retry(exceptions=[binding.HTTPError])
     def delete(self, key: str) -> None:
@@ -195,6 +665,108 @@ class KVStoreCheckpointer(Checkpointer):
                 can be 503 code, when Splunk is restarting and KV Store is not
                 yet initialized.
         """
+        if self._write_behind:
+            # A flush in progress must not write the key back
+            with self._flush_lock:
+                with self._lock:
+                    self._written.pop(key, None)
+                    self._dirty.pop(key, None)
+                self._delete(key)
+        else:
+            self._delete(key)
+        self._refresh_cached([{"_key": key}], deleted=True)
+        if self._delta_logs.pop(key, None) is not None:
+            self._delete_deltas(key)
+
+    @utils.retry(exceptions=[binding.HTTPError])
+    def _query_by_id(self, key):
+        try:
+            return self._collection_data.query_by_id(key)
+        except binding.HTTPError as e:
+            if e.status != 404:
+                logging.error(f"Get checkpoint failed: {traceback.format_exc()}.")
+                raise
+            return None
+
+    def _locked(self, keys):
+        """Context manager holding the locks of `keys`, acquired in key
+        order."""
+        with self._key_locks_lock:
+            locks = []
+            for key in sorted(set(keys)):
+                lock = self._key_locks.get(key)
+                if lock is None:
+                    lock = self._key_locks[key] = threading.Lock()
+                locks.append(lock)
+        stack = ExitStack()
+        for lock in locks:
+            stack.enter_context(lock)
+        return stack
+
+    def _write_versioned(self, records):
+        """Write `records` with the version of their key incremented, the
+        stored version is read once for keys not written by this process."""
+        with self._locked(record["_key"] for record in records):
+            unknown = [
+                record["_key"]
+                for record in records
+                if record["_key"] not in self._versions
+            ]
+            versions = self._current_versions(unknown) if unknown else {}
+            for record in records:
+                key = record["_key"]
+                version = self._versions.get(key, versions.get(key, 0))
+                record["version"] = version + 1
+            self._write(records)
+
+    def _write(self, records):
+        # The locks of the keys of records are held
+        try:
+            if self._write_behind:
+                self._update_later(records)
+            else:
+                self._save(*records)
+                self._refresh_cached(records)
+        except Exception:
+            # Some documents may be written, read their version again
+            for record in records:
+                self._versions.pop(record["_key"], None)
+            raise
+        for record in records:
+            self._versions[record["_key"]] = record["version"]
+
+    def _current_versions(self, keys):
+        versions = {}
+        missing = []
+        for key in keys:
+            record = self._written.get(key) if self._write_behind else None
+            if record is not None:
+                versions[key] = self._version(record)
+            else:
+                missing.append(key)
+        for i in range(0, len(missing), self.query_keys):
+            chunk = missing[i : i + self.query_keys]
+            for record in self._query(
+                {"$or": [{"_key": key} for key in chunk]}, limit=len(chunk)
+            ):
+                versions[record["_key"]] = self._version(record)
+        return versions
+
+    def _current_record(self, key):
+        if self._write_behind:
+            record = self._written.get(key)
+            if record is not None:
+                return record
+        return self._query_by_id(key)
+
+    @staticmethod
+    def _version(record):
+        if record is None:
+            return 0
+        # KV Store returns numbers as floats
+        return int(record.get("version") or 0)
+
+    def _delete(self, key):
         try:
             self._collection_data.delete_by_id(key)
         except binding.HTTPError as e:
@@ -202,6 +774,460 @@ class KVStoreCheckpointer(Checkpointer):
                 logging.error(f"Delete checkpoint failed: {traceback.format_exc()}.")
                 raise
 
+    def _save(self, *records):
+        if len(records) <= 1:
+            self._save_chunk(records)
+            return
+        limit = self._batch_save_limit()
+        chunks = [records[i : i + limit] for i in range(0, len(records), limit)]
+        if len(chunks) > 1 and self._batch_save_workers > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(self._batch_save_workers, len(chunks))
+            ) as executor:
+                # list() raises the error of the first chunk which failed
+                list(executor.map(self._save_chunk, chunks))
+        else:
+            for chunk in chunks:
+                self._save_chunk(chunk)
+
+    @utils.retry(exceptions=[binding.HTTPError])
+    def _save_chunk(self, records):
+        self._collection_data.batch_save(*records)
+
+    def _batch_save_limit(self):
+        if self._max_documents_per_batch_save is None:
+            limit = self.default_max_documents_per_batch_save
+            try:
+                cfm = conf_manager.ConfManager(
+                    *self._conf_manager_args, **self._context
+                )
+                limit = int(
+                    cfm.get_conf("limits")
+                    .get("kvstore")
+                    .get("max_documents_per_batch_save", limit)
+                )
+            except Exception:
+                logging.warning(
+                    "Get max_documents_per_batch_save from limits.conf failed,"
+                    f" using {limit}: {traceback.format_exc()}."
+                )
+            self._max_documents_per_batch_save = max(limit, 1)
+        return self._max_documents_per_batch_save
+
+    @utils.retry(exceptions=[binding.HTTPError])
+    def _query(self, query, **params):
+        return self._collection_data.query(
+            query=query, sort="_key", fields="_key,state,version", **params
+        )
+
+    @staticmethod
+    def _decode(record):
+        if record is None:
+            return None
+        return _decode_state(record["state"])
+
+    def _lookup(self, key):
+        """Look up `key` in memory.
+
+        Returns:
+            Tuple of True and the document (None if there is none) if the
+            key is in memory, (False, None) otherwise.
+        """
+        if self._write_behind:
+            record = self._written.get(key)
+            if record is not None:
+                return True, record
+        now = time.time()
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > now:
+                return True, cached[1]
+            # The document may exist, its preloaded prefix must not answer
+            self._cache.pop(key, None)
+            return False, None
+        for prefix, expires in list(self._preloaded.items()):
+            if expires <= now:
+                self._preloaded.pop(prefix, None)
+            elif key.startswith(prefix):
+                return True, None
+        return False, None
+
+    def _refresh_cached(self, records, deleted=False):
+        """Update cached documents of keys which were written, or are under
+        a preloaded prefix, so the cache does not return stale data."""
+        if not self._cache and not self._preloaded:
+            return
+        expires = time.time() + self._cache_ttl
+        for record in records:
+            key = record["_key"]
+            if key in self._cache or any(
+                key.startswith(prefix) for prefix in self._preloaded
+            ):
+                self._cache[key] = (expires, None if deleted else record)
+
+    def _update_later(self, records):
+        with self._lock:
+            for record in records:
+                self._written[record["_key"]] = record
+                self._dirty[record["_key"]] = record
+            flush = len(self._dirty) >= self._flush_count
+        if flush:
+            self.flush()
+
+    def _query_pages(self, query):
+        skip = 0
+        while True:
+            records = self._query(query, limit=self.query_page_size, skip=skip)
+            yield records
+            skip += len(records)
+            if len(records) < self.query_page_size:
+                break
+
+    def _query_deltas(self, key, after, upto=None):
+        query = {"$gt": _delta_key(key, after)}
+        if upto is None:
+            query["$lt"] = key + "#d$"
+        else:
+            query["$lte"] = _delta_key(key, upto)
+        for records in self._query_pages({"_key": query}):
+            yield from records
+
+    @utils.retry(exceptions=[binding.HTTPError])
+    def _delete_deltas(self, key, upto=None):
+        query = {"$gt": key + "#d#"}
+        if upto is None:
+            query["$lt"] = key + "#d$"
+        else:
+            query["$lte"] = _delta_key(key, upto)
+        self._collection_data.delete(query=json.dumps({"_key": query}))
+
+    def _decode_merged(self, key, record):
+        stale_seq = None
+        while True:
+            state = self._decode(record)
+            if not (isinstance(state, dict) and _DELTA in state):
+                return state
+            deltas = list(self._query_deltas(key, state["seq"]))
+            if (
+                deltas
+                and _delta_seq(deltas[0]) != state["seq"] + 1
+                and state["seq"] != stale_seq
+            ):
+                # The base was read before a compaction which deleted the
+                # deltas following it, read the new base
+                stale_seq = state["seq"]
+                record = self._query_by_id(key)
+                if record is not None:
+                    self._refresh_cached([record])
+                continue
+            return _merge_deltas(
+                state[_DELTA],
+                state["base"],
+                (self._decode(delta)["data"] for delta in deltas),
+            )
+
+    def _save_delta_base(self, key, kind, base, seq):
+        if kind == "set":
+            base = list(base)
+        record = {
+            "_key": key,
+            "state": _encode_state(
+                {_DELTA: kind, "base": base, "seq": seq}, self._codec
+            ),
+        }
+        # Deltas are deleted once the base is saved, it is never written
+        # behind
+        self._save(record)
+        self._refresh_cached([record])
+        if self._write_behind:
+            with self._lock:
+                if key in self._written:
+                    self._written[key] = record
+                self._dirty.pop(key, None)
+
+    def _delta_log(self, key, kind):
+        with self._lock:
+            log = self._delta_logs.get(key)
+            if log is None:
+                log = self._delta_logs[key] = _DeltaLog(kind)
+        if log.kind != kind:
+            raise CheckpointerException(
+                f"Checkpoint {key} is a {log.kind} checkpoint, not a {kind} one."
+            )
+        return log
+
+    def _write_delta(self, key, kind, data):
+        if not data:
+            return
+        log = self._delta_log(key, kind)
+        # Deltas of a key are written in sequence order, the deltas up to
+        # the sequence number read by a compaction are all written
+        with log.lock:
+            if log.seq is None:
+                self._load_delta_log(key, log)
+            seq = log.seq + 1
+            self._save(
+                {
+                    "_key": _delta_key(key, seq),
+                    "state": _encode_state({_DELTA: kind, "data": data}, self._codec),
+                }
+            )
+            log.seq = seq
+            compact = (
+                not log.compacting
+                and log.seq - log.compacted >= self._delta_compact_count
+            )
+            if compact:
+                log.compacting = True
+        if compact:
+            with self._lock:
+                if self._compactor is None:
+                    self._compactor = ThreadPoolExecutor(
+                        max_workers=1,
+                        thread_name_prefix="KVStoreCheckpointerCompactor",
+                    )
+                self._compactor.submit(self._compact_deltas, key, log)
+
+    def _load_delta_log(self, key, log):
+        state = self._decode(self._current_record(key))
+        if state is None:
+            # Deltas left by a deleted checkpoint are not part of it
+            self._delete_deltas(key)
+            self._save_delta_base(key, log.kind, {}, 0)
+            log.seq = log.compacted = 0
+            return
+        if not isinstance(state, dict) or state.get(_DELTA) != log.kind:
+            raise CheckpointerException(
+                f"Checkpoint {key} is not a {log.kind} checkpoint."
+            )
+        log.compacted = log.seq = state["seq"]
+        for record in self._query_deltas(key, state["seq"]):
+            log.seq = max(log.seq, _delta_seq(record))
+
+    def _compact_deltas(self, key, log):
+        try:
+            with log.lock:
+                upto = log.seq
+            state = self._decode(self._current_record(key))
+            base = _merge_deltas(
+                log.kind,
+                state["base"],
+                (
+                    self._decode(record)["data"]
+                    for record in self._query_deltas(key, state["seq"], upto)
+                ),
+            )
+            self._save_delta_base(key, log.kind, base, upto)
+            # The deltas merged by this compaction are deleted by the next
+            # one, readers of the previous base still query them. Readers
+            # of an older base find a gap in the sequence and read the base
+            # again.
+            if state["seq"]:
+                self._delete_deltas(key, state["seq"])
+            with log.lock:
+                log.compacted = upto
+        except Exception:
+            logging.error(f"Compact checkpoint {key} failed: {traceback.format_exc()}.")
+        finally:
+            log.compacting = False
+
+    def _run_flusher(self, flush_interval):
+        while not self._closed.wait(flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logging.error(f"Flush checkpoints failed: {traceback.format_exc()}.")
+
+
+class SQLiteCheckpointer(Checkpointer):
+    """SQLite checkpointer.
+
+    Use one SQLite database file in the checkpoint directory to save
+    modular input checkpoint. The database is in WAL mode, so checkpoints
+    can be read while they are written, by other threads or processes.
+
+    Examples:
+        >>> from solnlib.modular_input import checkpointer
+        >>> ck = checkpointer.SQLiteCheckpointer('/opt/splunk/var/...')
+        >>> ck.import_file_checkpoints('/opt/splunk/var/...')
+        >>> ck.update("input_1", {"timestamp": 1638043093})
+        >>> ck.get("input_1")
+        >>> # returns {"timestamp": 1638043093}
+        >>> list(ck.scan("input_"))
+        >>> # returns [("input_1", {"timestamp": 1638043093})]
+        >>> ck.close()
+    """
+
+    def __init__(
+        self,
+        checkpoint_dir: str,
+        file_name: str = "checkpoints.sqlite",
+        timeout: float = 30.0,
+    ):
+        """Initializes SQLiteCheckpointer.
+
+        Arguments:
+            checkpoint_dir: Checkpoint directory.
+            file_name: (optional) Name of the database file in
+                `checkpoint_dir`, default is `checkpoints.sqlite`.
+            timeout: (optional) Max seconds to wait for the database lock
+                held by another connection, default is 30.0.
+        """
+        self._path = op.join(checkpoint_dir, file_name)
+        self._timeout = timeout
+        # One connection per thread
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints "
+                "(key TEXT PRIMARY KEY, state TEXT NOT NULL) WITHOUT ROWID"
+            )
+
+    def update(self, key: str, state: Any) -> None:
+        """Updates the checkpoint of `key`.
+
+        Arguments:
+            key: Checkpoint key.
+            state: Checkpoint state, anything that can be an argument to
+                `json.dumps`.
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                (key, json.dumps(state)),
+            )
+
+    def batch_update(self, states: Iterable[dict[str, Any]]) -> None:
+        """Updates multiple checkpoints in one transaction, either every
+        checkpoint is updated or none is.
+
+        Arguments:
+            states: Iterable that contains dicts with "_key" and "state"
+                keys.
+        """
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                ((state["_key"], json.dumps(state["state"])) for state in states),
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        """Gets the checkpoint of `key`.
+
+        Arguments:
+            key: Checkpoint key.
+
+        Returns:
+            Checkpoint state or `None` in case of no checkpoint.
+        """
+        row = (
+            self._connection()
+            .execute("SELECT state FROM checkpoints WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row is not None else None
+
+    def scan(self, prefix: str = None) -> Iterator[tuple[str, Any]]:
+        """Gets the checkpoints of the keys starting with `prefix`, in key
+        order.
+
+        Arguments:
+            prefix: (optional) Prefix of the keys, default is None which
+                gets every checkpoint.
+
+        Returns:
+            Iterator of tuples of key and checkpoint state.
+        """
+        if prefix:
+            # keys are compared by their UTF-8 bytes, no key under the
+            # prefix sorts after prefix + the greatest code point
+            cursor = self._connection().execute(
+                "SELECT key, state FROM checkpoints WHERE key >= ? AND key < ? "
+                "ORDER BY key",
+                (prefix, prefix + "\U0010ffff"),
+            )
+        else:
+            cursor = self._connection().execute(
+                "SELECT key, state FROM checkpoints ORDER BY key"
+            )
+        for key, state in cursor:
+            yield key, json.loads(state)
+
+    def delete(self, key: str) -> None:
+        """Deletes the checkpoint of `key`.
+
+        Arguments:
+            key: Checkpoint key.
+        """
+        with self._connection() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+
+    def import_file_checkpoints(self, checkpoint_dir: str, remove: bool = False) -> int:
+        """Imports the checkpoints written by `FileCheckpointer` in
+        `checkpoint_dir`, in one transaction.
+
+        Arguments:
+            checkpoint_dir: Checkpoint directory of `FileCheckpointer`.
+            remove: (optional) Remove the checkpoint files once they are
+                imported, default is False.
+
+        Returns:
+            Number of imported checkpoints.
+        """
+        states = []
+        for name in os.listdir(checkpoint_dir):
+            path = op.join(checkpoint_dir, name)
+            try:
+                key = base64.b64decode(name, validate=True).decode()
+            except (binascii.Error, UnicodeDecodeError):
+                continue
+            if base64.b64encode(key.encode()).decode() != name or not op.isfile(path):
+                continue
+            try:
+                with open(path) as fp:
+                    states.append((key, json.dumps(json.load(fp)), path))
+            except (OSError, ValueError):
+                continue
+
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                ((key, state) for key, state, _ in states),
+            )
+        if remove:
+            for _, _, path in states:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return len(states)
+
+    def close(self) -> None:
+        """Closes the connections to the database."""
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # used by this thread only, but closed by the thread of close()
+            conn = sqlite3.connect(
+                self._path, timeout=self._timeout, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL mode is durable across application crashes with NORMAL
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
 
 class FileCheckpointer(Checkpointer):
     """File checkpointer.
@@ -0,0 +1,226 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""This module provides a bounded store of seen event IDs for modular inputs
+which deduplicate events, persisted through a checkpointer."""
+
+import base64
+import collections
+import hashlib
+import logging
+import math
+import threading
+import time
+import traceback
+import zlib
+from collections.abc import Iterable
+
+from .checkpointer import Checkpointer
+
+__all__ = ["Deduplicator"]
+
+
+class _BloomFilter:
+    """Bloom filter of the IDs seen during one generation."""
+
+    __slots__ = ("start", "bits")
+
+    def __init__(self, start, size, bits=None):
+        self.start = start
+        self.bits = bits if bits is not None else bytearray(size)
+
+
+class Deduplicator:
+    """Bounded store of seen event IDs.
+
+    Recent IDs are kept in an exact LRU of `lru_size` IDs. Every ID is also
+    added to a time windowed bloom filter: `generations` filters which each
+    take the IDs of `window / generations` seconds, the oldest filter is
+    dropped when a new one is started. An ID is remembered for at least
+    `window * (generations - 1) / generations` seconds and at most `window`
+    seconds, memory does not grow with the number of IDs.
+
+    A bloom filter has false positives: an ID which was not seen is
+    reported as seen with a probability of about `error_rate` while a
+    generation takes at most `capacity` IDs, more if it takes more.
+
+    Examples:
+        >>> from solnlib.modular_input import checkpointer, dedup
+        >>> ck = checkpointer.KVStoreCheckpointer(...)
+        >>> dedup_store = dedup.Deduplicator(ck, 'input_1_dedup', window=86400)
+        >>> mask = dedup_store.seen([event['id'] for event in events])
+        >>> new_events = [e for e, seen in zip(events, mask) if not seen]
+        >>> ...
+        >>> dedup_store.save()
+    """
+
+    def __init__(
+        self,
+        checkpointer: Checkpointer,
+        key: str,
+        window: float = 86400.0,
+        generations: int = 4,
+        capacity: int = 100000,
+        error_rate: float = 0.001,
+        lru_size: int = 10000,
+    ):
+        """Initializes Deduplicator, with the state saved under `key` if
+        any.
+
+        Arguments:
+            checkpointer: Checkpointer the state is saved with.
+            key: Checkpoint key of the state.
+            window: (optional) Seconds IDs are remembered for, default is
+                86400.0.
+            generations: (optional) Number of bloom filters the window is
+                split in, default is 4.
+            capacity: (optional) Expected max number of IDs seen during
+                `window / generations` seconds, default is 100000.
+            error_rate: (optional) False positive rate of the bloom filter
+                while it takes at most `capacity` IDs, default is 0.001.
+            lru_size: (optional) Number of recent IDs kept exactly,
+                default is 10000.
+        """
+        self._checkpointer = checkpointer
+        self._key = key
+        self._window = window
+        self._generations = max(generations, 1)
+        self._generation_period = window / self._generations
+        # Optimal number of bits and of hash functions of a bloom filter
+        bits = -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self._filter_size = max(int(math.ceil(bits / 8)), 1)
+        self._hashes = max(int(round(bits / capacity * math.log(2))), 1)
+        self._lru_size = lru_size
+        self._lru = collections.OrderedDict()
+        self._filters = []
+        self._lock = threading.Lock()
+        self._load()
+
+    def seen(self, ids: Iterable, add: bool = True) -> list[bool]:
+        """Check which IDs were seen, IDs are compared as strings.
+
+        Arguments:
+            ids: Event IDs.
+            add: (optional) Remember the IDs, so an ID repeated in `ids` is
+                seen from its second occurrence, default is True.
+
+        Returns:
+            List of booleans, True for the IDs which were seen.
+        """
+        mask = []
+        with self._lock:
+            now = time.time()
+            self._rotate(now)
+            lru = self._lru
+            filters = self._filters
+            current = filters[-1]
+            for event_id in ids:
+                event_id = str(event_id)
+                if event_id in lru:
+                    lru.move_to_end(event_id)
+                    mask.append(True)
+                    continue
+                positions = self._positions(event_id)
+                mask.append(
+                    any(
+                        all(f.bits[p >> 3] & (1 << (p & 7)) for p in positions)
+                        for f in filters
+                    )
+                )
+                if add:
+                    bits = current.bits
+                    for p in positions:
+                        bits[p >> 3] |= 1 << (p & 7)
+                    lru[event_id] = None
+                    if len(lru) > self._lru_size:
+                        lru.popitem(last=False)
+        return mask
+
+    def add(self, ids: Iterable):
+        """Remember IDs.
+
+        Arguments:
+            ids: Event IDs.
+        """
+        self.seen(ids)
+
+    def save(self):
+        """Save the state with the checkpointer.
+
+        The filters are saved zlib compressed and base64 encoded, with the
+        IDs of the LRU.
+        """
+        with self._lock:
+            state = {
+                "filter_size": self._filter_size,
+                "hashes": self._hashes,
+                "filters": [
+                    [f.start, base64.b64encode(zlib.compress(f.bits)).decode("ascii")]
+                    for f in self._filters
+                ],
+                "lru": list(self._lru),
+            }
+        self._checkpointer.update(self._key, state)
+
+    def _load(self):
+        state = self._checkpointer.get(self._key)
+        if state:
+            try:
+                if (
+                    state["filter_size"] == self._filter_size
+                    and state["hashes"] == self._hashes
+                ):
+                    self._filters = [
+                        _BloomFilter(
+                            start,
+                            self._filter_size,
+                            bytearray(zlib.decompress(base64.b64decode(bits))),
+                        )
+                        for start, bits in state["filters"]
+                    ]
+                else:
+                    # IDs of filters of another size can not be looked up,
+                    # only the exact ones are kept
+                    logging.warning(
+                        "Dedup filters of %s do not match the capacity and "
+                        "error rate, they are reset.",
+                        self._key,
+                    )
+                for event_id in state["lru"][-self._lru_size :]:
+                    self._lru[event_id] = None
+            except (KeyError, TypeError, ValueError, zlib.error):
+                logging.warning(
+                    "Load dedup state %s failed: %s.", self._key, traceback.format_exc()
+                )
+                self._filters = []
+                self._lru.clear()
+        self._rotate(time.time())
+
+    def _rotate(self, now):
+        filters = self._filters
+        # Filters with IDs older than the window
+        while filters and now - filters[0].start >= self._window:
+            filters.pop(0)
+        if not filters or now - filters[-1].start >= self._generation_period:
+            filters.append(_BloomFilter(now, self._filter_size))
+            if len(filters) > self._generations:
+                filters.pop(0)
+
+    def _positions(self, event_id):
+        digest = hashlib.blake2b(event_id.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self._filter_size * 8
+        return [(h1 + i * h2) % size for i in range(self._hashes)]
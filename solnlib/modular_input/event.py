@@ -15,21 +15,259 @@
 #
 """This module provides Splunk modular input event encapsulation."""
 
+import itertools
 import json
+import math
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+__all__ = [
+    "EventException",
+    "EventColumns",
+    "XMLEvent",
+    "HECEvent",
+    "get_json_serializer",
+]
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _has_non_finite_float(obj: Any) -> bool:
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        cls = type(value)
+        if cls is str or cls is int or value is None:
+            continue
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    try:
+        data = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # integers over 64 bits, unsupported types etc.
+        return _stdlib_dumps(obj)
+    # orjson writes NaN and Infinity as null, only documents with a null
+    # can have one
+    if b"null" in data and _has_non_finite_float(obj):
+        return _stdlib_dumps(obj)
+    return data
+
+
+def _ujson_dumps(obj: Any) -> bytes:
+    try:
+        return ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        ).encode("utf-8")
+    except (TypeError, OverflowError):
+        return _stdlib_dumps(obj)
+
+
+_json_serializers = {"json": _stdlib_dumps}
+if ujson is not None:
+    _json_serializers["ujson"] = _ujson_dumps
+if orjson is not None:
+    _json_serializers["orjson"] = _orjson_dumps
+
+
+def get_json_serializer(
+    serializer: Union[str, Callable[[Any], bytes]] = None
+) -> Callable[[Any], bytes]:
+    """Get a function serializing objects to UTF-8 encoded JSON.
+
+    `orjson` or `ujson` are used when installed since they are several
+    times faster than the standard `json` module. They write compact JSON,
+    the `json` serializer keeps the `json.dumps` separators. Every
+    serializer keeps non-ASCII characters unescaped and produces the same
+    float representation, values they do not support (integers over 64
+    bits, NaN, Infinity) fall back to the `json` module, so the decoded
+    documents are identical.
+
+    Arguments:
+        serializer: (optional) `orjson`, `ujson`, `json` or a callable
+            returning bytes, default is None which picks the fastest
+            installed one.
+
+    Returns:
+        Serializer function.
+
+    Raises:
+        ValueError: If `serializer` is not installed or unknown.
+    """
+    if callable(serializer):
+        return serializer
+    if serializer is None:
+        for name in ("orjson", "ujson", "json"):
+            if name in _json_serializers:
+                return _json_serializers[name]
+    try:
+        return _json_serializers[serializer]
+    except KeyError:
+        raise ValueError("JSON serializer %s is not available." % serializer)
+
+
+def _escape_xml_text(text: str) -> str:
+    # Same escaping as ElementTree
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _escape_xml_attrib(text: str) -> str:
+    text = _escape_xml_text(text)
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
 
-from xml.etree import ElementTree as ET  # nosemgrep
 
-import defusedxml.ElementTree as defused_et
+class EventException(Exception):
+    pass
 
-__all__ = ["EventException", "XMLEvent", "HECEvent"]
 
+class EventColumns:
+    """Events held as columns of values instead of one object per event.
 
-class EventException(Exception):
-    pass
+    `format_events` and `iter_batches` of `XMLEvent` and `HECEvent`
+    serialize them without creating event objects. Every argument but
+    `data` is either one value shared by every event or a list (or tuple)
+    with one value per event. Iterating creates the event objects.
+
+    Examples:
+        >>> columns = EventColumns(
+        >>>     HECEvent,
+        >>>     data=['event 1', 'event 2'],
+        >>>     time=[1372274622.493, 1372274623.493],
+        >>>     index='main',
+        >>>     sourcetype='misc')
+    """
+
+    __slots__ = ("event_class", "_columns")
+
+    def __init__(
+        self,
+        event_class: type,
+        data: list,
+        time: Union[float, list] = None,
+        index: Union[str, list] = None,
+        host: Union[str, list] = None,
+        source: Union[str, list] = None,
+        sourcetype: Union[str, list] = None,
+        fields: Union[dict, list] = None,
+        stanza: Union[str, list] = None,
+    ):
+        """Initializes EventColumns.
+
+        Arguments:
+            event_class: Class of the events, `XMLEvent` or `HECEvent`.
+            data: List of event data.
+            time: (optional) Event timestamp or list of event timestamps,
+                default is None.
+            index: (optional) The index events will be written to or list
+                of indexes, default is None.
+            host: (optional) Event host or list of hosts, default is None.
+            source: (optional) Event source or list of sources,
+                default is None.
+            sourcetype: (optional) Event sourcetype or list of
+                sourcetypes, default is None.
+            fields: (optional) Event fields or list of event fields,
+                default is None.
+            stanza: (optional) Event stanza name or list of stanza names,
+                default is None.
+
+        Raises:
+            EventException: If a list does not have one value per event.
+        """
+
+        self.event_class = event_class
+        self._columns = (data, time, index, host, source, sourcetype, fields, stanza)
+        for column in self._columns[1:]:
+            if isinstance(column, (list, tuple)) and len(column) != len(data):
+                raise EventException(
+                    "Column has %d values for %d events." % (len(column), len(data))
+                )
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def rows(self) -> Iterator[tuple]:
+        """Iterate over the events as tuples of data, time, index, host,
+        source, sourcetype, fields and stanza."""
+        count = len(self)
+        return zip(
+            *(
+                column
+                if isinstance(column, (list, tuple))
+                else itertools.repeat(column, count)
+                for column in self._columns
+            )
+        )
+
+    def __iter__(self):
+        for data, time, index, host, source, sourcetype, fields, stanza in self.rows():
+            yield self.event_class(
+                data,
+                time=time,
+                index=index,
+                host=host,
+                source=source,
+                sourcetype=sourcetype,
+                fields=fields,
+                stanza=stanza,
+            )
 
 
 class Event:
-    """Base class of modular input event."""
+    """Base class of modular input event.
+
+    Events keep their attributes in `__slots__` and the timestamp as a
+    number, it is rounded to milliseconds and formatted when the event is
+    serialized. The serialized event is cached, so writing it again (for
+    example after a failed write) does not encode it again, data and
+    fields should not be modified once the event was written.
+    """
+
+    __slots__ = (
+        "_data",
+        "_time",
+        "_index",
+        "_host",
+        "_source",
+        "_sourcetype",
+        "_fields",
+        "_stanza",
+        "_unbroken",
+        "_done",
+        "_serialized",
+    )
 
     def __init__(
         self,
@@ -72,24 +310,37 @@ class Event:
            >>>     done=True)
         """
 
+        if not unbroken and done:
+            raise EventException('Invalid combination of "unbroken" and "done".')
         self._data = data
-        self._time = "%.3f" % time if time else None
+        self._time = time if time else None
         self._index = index
         self._host = host
         self._source = source
         self._sourcetype = sourcetype
-        if fields:
-            self._fields = fields
+        self._fields = fields if fields else None
         self._stanza = stanza
-        if not unbroken and done:
-            raise EventException('Invalid combination of "unbroken" and "done".')
         self._unbroken = unbroken
         self._done = done
+        # Serialized form cached on first use
+        self._serialized = None
+
+    def _timestamp(self) -> Optional[float]:
+        """Event time rounded to milliseconds."""
+        if self._time is None:
+            return None
+        return round(float(self._time), 3)
+
+    def _time_text(self) -> Optional[str]:
+        """Event time formatted with milliseconds."""
+        if self._time is None:
+            return None
+        return "%.3f" % self._time
 
     def __str__(self):
         event = {
             "data": self._data,
-            "time": float(self._time) if self._time else self._time,
+            "time": self._timestamp(),
             "index": self._index,
             "host": self._host,
             "source": self._source,
@@ -99,7 +350,7 @@ class Event:
             "done": self._done,
         }
 
-        if hasattr(self, "_fields"):
+        if self._fields is not None:
             event["fields"] = self._fields
 
         return json.dumps(event)
@@ -121,35 +372,124 @@ class Event:
 class XMLEvent(Event):
     """XML event."""
 
-    def _to_xml(self):
-        _event = ET.Element("event")
-        if self._stanza:
-            _event.set("stanza", self._stanza)
-        if self._unbroken:
-            _event.set("unbroken", str(int(self._unbroken)))
-
-        if self._time:
-            ET.SubElement(_event, "time").text = self._time
-
-        sub_elements = [
-            ("index", self._index),
-            ("host", self._host),
-            ("source", self._source),
-            ("sourcetype", self._sourcetype),
-        ]
-        for node, value in sub_elements:
+    __slots__ = ()
+
+    # Size of the chunks `iter_chunks` yields
+    chunk_size = 1024**2
+
+    def _to_xml(self) -> bytes:
+        if self._serialized is None:
+            self._serialized = self._xml_event(
+                self._data,
+                self._time_text(),
+                self._index,
+                self._host,
+                self._source,
+                self._sourcetype,
+                self._stanza,
+                self._unbroken,
+                self._done,
+            ).encode("utf-8", "xmlcharrefreplace")
+        return self._serialized
+
+    @staticmethod
+    def _xml_event(
+        data, time, index, host, source, sourcetype, stanza, unbroken, done
+    ) -> str:
+        """Serialize an event like `ElementTree` does."""
+
+        parts = ["<event"]
+        if stanza:
+            parts.append(' stanza="%s"' % _escape_xml_attrib(stanza))
+        if unbroken:
+            parts.append(' unbroken="%d"' % int(unbroken))
+        parts.append(">")
+
+        if time is not None:
+            parts.append("<time>%s</time>" % time)
+
+        for node, value in (
+            ("index", index),
+            ("host", host),
+            ("source", source),
+            ("sourcetype", sourcetype),
+        ):
             if value:
-                ET.SubElement(_event, node).text = value
+                parts.append("<%s>%s</%s>" % (node, _escape_xml_text(value), node))
 
-        if isinstance(self._data, str):
-            ET.SubElement(_event, "data").text = self._data
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        if data:
+            parts.append("<data>%s</data>" % _escape_xml_text(data))
         else:
-            ET.SubElement(_event, "data").text = json.dumps(self._data)
+            parts.append("<data />")
+
+        if done:
+            parts.append("<done />")
+        parts.append("</event>")
+        return "".join(parts)
+
+    @classmethod
+    def iter_chunks(cls, events: Iterable, chunk_size: int = None) -> Iterator[bytes]:
+        """Serialize events into a UTF-8 encoded `<stream>` document
+        incrementally.
 
-        if self._done:
-            ET.SubElement(_event, "done")
+        Events are consumed one at a time and the document is yielded in
+        chunks, so only the chunk being built is kept in memory. Output is
+        the same as serializing the events with `ElementTree`.
 
-        return _event
+        Arguments:
+            events: Iterable of events or `EventColumns` to format.
+            chunk_size: (optional) Min size of the chunks in bytes, except
+                for the last one, default is `chunk_size`.
+
+        Yields:
+            Chunks of the document.
+        """
+
+        chunk_size = chunk_size or cls.chunk_size
+        chunk = [b"<stream>"]
+        size = len(chunk[0])
+        for item in cls.iter_serialized(events):
+            chunk.append(item)
+            size += len(item)
+            if size >= chunk_size:
+                yield b"".join(chunk)
+                chunk = []
+                size = 0
+        chunk.append(b"</stream>")
+        yield b"".join(chunk)
+
+    @classmethod
+    def iter_serialized(cls, events: Iterable) -> Iterator[bytes]:
+        """Serialize events one at a time into UTF-8 encoded `<event>`
+        elements.
+
+        Arguments:
+            events: Iterable of events or `EventColumns` to format.
+
+        Yields:
+            Serialized events.
+        """
+
+        if isinstance(events, EventColumns):
+            return (
+                cls._xml_event(
+                    data,
+                    "%.3f" % time if time else None,
+                    index,
+                    host,
+                    source,
+                    sourcetype,
+                    stanza,
+                    False,
+                    False,
+                ).encode("utf-8", "xmlcharrefreplace")
+                for data, time, index, host, source, sourcetype, _, stanza in (
+                    events.rows()
+                )
+            )
+        return (event._to_xml() for event in events)
 
     @classmethod
     def format_events(cls, events: list) -> list:
@@ -185,37 +525,209 @@ class XMLEvent(Event):
                 ]
         """
 
-        stream = ET.Element("stream")
-        for event in events:
-            stream.append(event._to_xml())
-
-        return [
-            defused_et.tostring(stream, encoding="utf-8", method="xml").decode("utf-8")
-        ]
+        return [b"".join(cls.iter_chunks(events)).decode("utf-8")]
 
 
 class HECEvent(Event):
     """HEC event."""
 
+    __slots__ = ()
+
     max_hec_event_length = 1000000
 
-    def _to_hec(self, event_field):
+    # Serializer used by `iter_batches` when none is given
+    serializer = staticmethod(_stdlib_dumps)
+    # Keys of a HEC event besides the event field
+    _envelope_fields = ("time", "index", "host", "source", "sourcetype", "fields")
+
+    def _to_hec(self, event_field, dumps=None):
+        dumps = dumps or self.serializer
+        cached = self._serialized
+        if cached is not None and cached[0] == event_field and cached[1] is dumps:
+            return cached[2]
+
+        data = dumps(
+            self._hec_dict(
+                event_field,
+                self._data,
+                self._time,
+                self._index,
+                self._host,
+                self._source,
+                self._sourcetype,
+                self._fields,
+            )
+        )
+        self._serialized = (event_field, dumps, data)
+        return data
+
+    @staticmethod
+    def _hec_dict(event_field, data, time, index, host, source, sourcetype, fields):
         event = {}
-        event[event_field] = self._data
-        if self._time:
-            event["time"] = float(self._time)
-        if self._index:
-            event["index"] = self._index
-        if self._host:
-            event["host"] = self._host
-        if self._source:
-            event["source"] = self._source
-        if self._sourcetype:
-            event["sourcetype"] = self._sourcetype
-        if hasattr(self, "_fields"):
-            event["fields"] = self._fields
+        event[event_field] = data
+        if time:
+            event["time"] = round(float(time), 3)
+        if index:
+            event["index"] = index
+        if host:
+            event["host"] = host
+        if source:
+            event["source"] = source
+        if sourcetype:
+            event["sourcetype"] = sourcetype
+        if fields:
+            event["fields"] = fields
+        return event
+
+    @classmethod
+    def iter_batches(
+        cls,
+        events: Iterable,
+        event_field: str = "event",
+        serializer: Callable[[Any], bytes] = None,
+    ) -> Iterator[bytes]:
+        """Serialize events and group them into HEC batches incrementally.
+
+        Events are consumed one at a time, so `events` can be an iterator
+        and only the batch being built is kept in memory. Batches are sized
+        in UTF-8 encoded bytes and do not exceed `max_hec_event_length`
+        unless a single event is larger than it.
+
+        Arguments:
+            events: Iterable of events or `EventColumns` to format.
+            event_field: Event field.
+            serializer: (optional) Function serializing an event to bytes,
+                see `get_json_serializer`, default is None which uses
+                `json.dumps`.
 
-        return json.dumps(event, ensure_ascii=False)
+        Yields:
+            Newline delimited batches of serialized events.
+        """
+
+        dumps = serializer or cls.serializer
+        enveloped = dumps is _stdlib_dumps and event_field not in cls._envelope_fields
+        if isinstance(events, EventColumns):
+            if enveloped:
+                encode = cls._envelope_encoder(event_field)
+                items = (encode(*row[:7]) for row in events.rows())
+            else:
+                items = (
+                    dumps(cls._hec_dict(event_field, *row[:7])) for row in events.rows()
+                )
+            return cls.join_batches(items)
+        if enveloped:
+            return cls.join_batches(cls._iter_enveloped(events, event_field))
+        return cls.join_batches(event._to_hec(event_field, dumps) for event in events)
+
+    @classmethod
+    def _iter_enveloped(cls, events: Iterable, event_field: str) -> Iterator[bytes]:
+        """Serialize events like `_to_hec` with `json.dumps`, see
+        `_envelope_encoder`."""
+
+        encode = cls._envelope_encoder(event_field)
+        for event in events:
+            cached = event._serialized
+            if (
+                cached is not None
+                and cached[0] == event_field
+                and cached[1] is _stdlib_dumps
+            ):
+                yield cached[2]
+                continue
+
+            data = encode(
+                event._data,
+                event._time,
+                event._index,
+                event._host,
+                event._source,
+                event._sourcetype,
+                event._fields,
+            )
+            event._serialized = (event_field, _stdlib_dumps, data)
+            yield data
+
+    @classmethod
+    def _envelope_encoder(cls, event_field: str) -> Callable[..., bytes]:
+        """Get a function serializing event values like `_to_hec` with
+        `json.dumps`, encoding the metadata shared by events only once.
+
+        The envelope of every distinct (index, host, source, sourcetype,
+        fields) is serialized once, only the event data and time are
+        serialized per event and spliced into it.
+        """
+
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        prefix = "{%s: " % encode(event_field)
+        envelopes = {}
+
+        def encode_event(data, time, index, host, source, sourcetype, fields):
+            key = (index, host, source, sourcetype)
+            envelope = envelopes.get(key)
+            # fields are compared by identity, the cache keeps them
+            # referenced so their id is not reused
+            if envelope is None or envelope[0] is not fields:
+                metadata = cls._hec_dict(
+                    event_field, None, None, index, host, source, sourcetype, fields
+                )
+                del metadata[event_field]
+                suffix = ", " + encode(metadata)[1:] if metadata else "}"
+                envelope = envelopes[key] = (fields, suffix)
+
+            if time:
+                timestamp = round(float(time), 3)
+                if not math.isfinite(timestamp):
+                    return _stdlib_dumps(
+                        cls._hec_dict(
+                            event_field,
+                            data,
+                            time,
+                            index,
+                            host,
+                            source,
+                            sourcetype,
+                            fields,
+                        )
+                    )
+                event = '%s%s, "time": %r%s' % (
+                    prefix,
+                    encode(data),
+                    timestamp,
+                    envelope[1],
+                )
+            else:
+                event = prefix + encode(data) + envelope[1]
+            return event.encode("utf-8")
+
+        return encode_event
+
+    @classmethod
+    def join_batches(cls, items: Iterable[bytes]) -> Iterator[bytes]:
+        """Group serialized items into newline delimited HEC batches.
+
+        Batches do not exceed `max_hec_event_length` bytes unless a single
+        item is larger than it.
+
+        Arguments:
+            items: Iterable of serialized events or raw lines.
+
+        Yields:
+            Newline delimited batches.
+        """
+
+        size = 0
+        batch = []
+        for item in items:
+            # items are joined with a newline
+            if batch and size + len(batch) + len(item) > cls.max_hec_event_length:
+                yield b"\n".join(batch)
+                batch = []
+                size = 0
+
+            batch.append(item)
+            size += len(item)
+        if batch:
+            yield b"\n".join(batch)
 
     @classmethod
     def format_events(cls, events: list, event_field: str = "event") -> list:
@@ -235,20 +747,6 @@ class HECEvent(Event):
                 ]
         """
 
-        size = 0
-        new_events, batched_events = [], []
-        events = [event._to_hec(event_field) for event in events]
-        for event in events:
-            new_length = size + len(event) + len(batched_events) - 1
-            if new_length >= cls.max_hec_event_length:
-                if batched_events:
-                    new_events.append("\n".join(batched_events))
-                del batched_events[:]
-                size = 0
-
-            batched_events.append(event)
-            size = size + len(event)
-        if batched_events:
-            new_events.append("\n".join(batched_events))
-
-        return new_events
+        return [
+            batch.decode("utf-8") for batch in cls.iter_batches(events, event_field)
+        ]
@@ -16,16 +16,25 @@
 """This module provides two kinds of event writers (ClassicEventWriter,
 HECEventWriter) to write Splunk modular input events."""
 
+import collections
+import gzip
+import itertools
+import json
 import logging
 import multiprocessing
+import os
+import queue
 import sys
 import threading
 import time
 import traceback
+import uuid
 import warnings
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
 from random import randint
-from typing import Union
+from typing import Callable, Optional, Union
 
 from splunklib import binding
 
@@ -34,9 +43,16 @@ from .. import utils
 from ..hec_config import HECConfig
 from ..splunkenv import get_splunkd_access_info, get_scheme_from_hec_settings
 from ..utils import retry
-from .event import HECEvent, XMLEvent
+from .event import EventColumns, HECEvent, XMLEvent, get_json_serializer
+from .hec_spool import HECSpool
 
-__all__ = ["ClassicEventWriter", "HECEventWriter"]
+__all__ = [
+    "ClassicEventWriter",
+    "ProcessClassicEventWriter",
+    "HECEventWriter",
+    "AsyncHECEventWriter",
+    "HECEventWriterException",
+]
 
 deprecation_msg = (
     "Function 'create_from_token' is deprecated and incompatible with 'global_settings_schema=True'. "
@@ -44,10 +60,32 @@ deprecation_msg = (
 )
 
 
+# Pending acknowledgement of a batch written to the spool
+_SPOOLED = "spooled"
+
+
 class FunctionDeprecated(Exception):
     pass
 
 
+class HECEventWriterException(Exception):
+    """Raised when some batches could not be written through HEC.
+
+    Attributes:
+        failures: Dict of batch index (in the order batches were produced)
+            to the exception that made the batch fail.
+        batch_count: Total number of batches which were submitted.
+    """
+
+    def __init__(self, failures: dict, batch_count: int):
+        self.failures = failures
+        self.batch_count = batch_count
+        super().__init__(
+            "Write events through HEC failed for %d of %d batches."
+            % (len(failures), batch_count)
+        )
+
+
 class EventWriter(metaclass=ABCMeta):
     """Base class of event writer."""
 
@@ -115,21 +153,68 @@ class EventWriter(metaclass=ABCMeta):
 
         pass
 
+    def close(self, timeout: float = None):
+        """Release resources held by the event writer.
+
+        Event writers which buffer events make sure every buffered event
+        has been written before returning. Default implementation does
+        nothing.
+
+        Arguments:
+            timeout: (optional) Max seconds to wait for buffered events to
+                be written, default is None which waits forever.
+        """
+
+        pass
+
+
+class _ThreadBuffer:
+    """Serialized events buffered by one thread."""
+
+    __slots__ = ("lock", "thread", "items", "size", "since")
+
+    def __init__(self, thread):
+        self.lock = threading.Lock()
+        self.thread = thread
+        self.items = []
+        self.size = 0
+        self.since = None
+
 
 class ClassicEventWriter(EventWriter):
     """Classic event writer.
 
     Use sys.stdout as the output.
 
+    With `buffered`, events of many `write_events` calls are coalesced into
+    one `<stream>` document. Every thread serializes its events into its
+    own buffer, the lock of stdout is only taken when a buffer is flushed:
+    when it reaches `flush_bytes` or `flush_events`, when its oldest event
+    waited `flush_interval` seconds, on `flush` and on `close`.
+
     Examples:
         >>> from solnlib.modular_input import event_writer
         >>> ew = event_writer.ClassicEventWriter()
         >>> ew.write_events([event1, event2])
+
+        Buffered, `ModularInput.execute` closes the event writer when
+        `do_run` returns:
+
+        >>> ew = event_writer.ClassicEventWriter(buffered=True)
+        >>> ew.write_events([event1, event2])
+        >>> ew.close()
     """
 
     description = "ClassicEventWriter"
 
-    def __init__(self, lock: Union[threading.Lock, multiprocessing.Lock] = None):
+    def __init__(
+        self,
+        lock: Union[threading.Lock, multiprocessing.Lock] = None,
+        buffered: bool = False,
+        flush_bytes: int = 1024**2,
+        flush_events: int = 10000,
+        flush_interval: float = 1.0,
+    ):
         """Initializes ClassicEventWriter.
 
         Arguments:
@@ -137,12 +222,36 @@ class ClassicEventWriter(EventWriter):
                 by default, it is None and it will use threading safe lock.
                 if user would like to make the lock multiple-process safe, user should
                 pass in multiprocessing.Lock() instead
+            buffered: (optional) Buffer events in per thread buffers,
+                default is False.
+            flush_bytes: (optional) Size of serialized events after which a
+                buffer is flushed, default is 1 MiB.
+            flush_events: (optional) Number of events after which a buffer
+                is flushed, default is 10000.
+            flush_interval: (optional) Max seconds an event waits in a
+                buffer, default is 1.0.
         """
         if lock is None:
             self._lock = threading.Lock()
         else:
             self._lock = lock
 
+        self._buffered = buffered
+        self._flush_bytes = flush_bytes
+        self._flush_events = flush_events
+        self._flush_interval = flush_interval
+        self._local = threading.local()
+        self._buffers = []
+        self._buffers_lock = threading.Lock()
+        self._flusher = None
+        self._flusher_wakeup = threading.Event()
+        self._closed = False
+        if buffered:
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="ClassicEventWriterFlusher", daemon=True
+            )
+            self._flusher.start()
+
     def create_event(
         self,
         data: dict,
@@ -170,16 +279,466 @@ class ClassicEventWriter(EventWriter):
             done=done,
         )
 
+    def create_events_bulk(
+        self,
+        data: list,
+        time: Union[float, list] = None,
+        index: Union[str, list] = None,
+        host: Union[str, list] = None,
+        source: Union[str, list] = None,
+        sourcetype: Union[str, list] = None,
+        stanza: Union[str, list] = None,
+    ) -> EventColumns:
+        """Create events from columns of values, without creating an
+        XMLEvent object per event.
+
+        Arguments:
+            data: List of event data.
+            time: (optional) Event timestamp or list of event timestamps,
+                default is None.
+            index: (optional) The index events will be written to or list
+                of indexes, default is None.
+            host: (optional) Event host or list of hosts, default is None.
+            source: (optional) Event source or list of sources,
+                default is None.
+            sourcetype: (optional) Event sourcetype or list of
+                sourcetypes, default is None.
+            stanza: (optional) Event stanza name or list of stanza names,
+                default is None.
+
+        Returns:
+            Created events, to be passed to `write_events`.
+
+        Examples:
+           >>> events = ew.create_events_bulk(
+           >>>     data=['event 1', 'event 2'],
+           >>>     time=[1372274622.493, 1372274623.493],
+           >>>     index='main',
+           >>>     sourcetype='misc')
+           >>> ew.write_events(events)
+        """
+
+        return EventColumns(
+            XMLEvent,
+            data,
+            time=time,
+            index=index,
+            host=host,
+            source=source,
+            sourcetype=sourcetype,
+            stanza=stanza,
+        )
+
     def write_events(self, events):
+        """Write events to stdout.
+
+        Events are serialized in chunks of `XMLEvent.chunk_size` bytes
+        before the stdout lock is taken, then written to `sys.stdout.buffer`
+        when stdout has one. When buffered, events are added to the buffer of
+        the calling thread instead.
+
+        Arguments:
+            events: List of events, or events created by
+                `create_events_bulk`.
+        """
         if not events:
             return
 
-        stdout = sys.stdout
+        if self._buffered:
+            self._buffer_events(events)
+            return
 
-        data = "".join([event for event in XMLEvent.format_events(events)])
+        # An event failing to serialize must not leave an unclosed
+        # <stream> on stdout
+        chunks = list(XMLEvent.iter_chunks(events))
         with self._lock:
-            stdout.write(data)
+            self._write_chunks(chunks)
+
+    def flush(self):
+        """Write the events buffered by every thread."""
+        with self._buffers_lock:
+            buffers = list(self._buffers)
+        for buffer in buffers:
+            with buffer.lock:
+                self._flush_buffer(buffer)
+
+    def close(self, timeout: float = None):
+        """Write buffered events and stop the flusher thread.
+
+        Arguments:
+            timeout: (optional) Max seconds to wait for the flusher thread,
+                default is None which waits forever.
+        """
+        if self._flusher is None:
+            return
+        self._closed = True
+        self._flusher_wakeup.set()
+        self._flusher.join(timeout)
+        self._flusher = None
+        self.flush()
+
+    @staticmethod
+    def _write_chunks(chunks):
+        stdout = sys.stdout
+        buffer = getattr(stdout, "buffer", None)
+        if buffer is not None:
+            # text written before must come first
             stdout.flush()
+            for chunk in chunks:
+                buffer.write(chunk)
+            buffer.flush()
+        else:
+            for chunk in chunks:
+                stdout.write(chunk.decode("utf-8"))
+            stdout.flush()
+
+    def _thread_buffer(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _ThreadBuffer(threading.current_thread())
+            with self._buffers_lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def _buffer_events(self, events):
+        buffer = self._thread_buffer()
+        with buffer.lock:
+            for item in XMLEvent.iter_serialized(events):
+                if buffer.since is None:
+                    buffer.since = time.time()
+                    # the flusher waits for the oldest buffered event
+                    self._flusher_wakeup.set()
+                buffer.items.append(item)
+                buffer.size += len(item)
+                if (
+                    buffer.size >= self._flush_bytes
+                    or len(buffer.items) >= self._flush_events
+                ):
+                    self._flush_buffer(buffer)
+            if self._closed:
+                self._flush_buffer(buffer)
+
+    def _flush_buffer(self, buffer):
+        # buffer.lock is held
+        if not buffer.items:
+            return
+        items = buffer.items
+        buffer.items = []
+        buffer.size = 0
+        buffer.since = None
+        with self._lock:
+            self._write_chunks([b"<stream>" + b"".join(items) + b"</stream>"])
+
+    def _run_flusher(self):
+        while not self._closed:
+            now = time.time()
+            deadline = None
+            with self._buffers_lock:
+                buffers = list(self._buffers)
+            for buffer in buffers:
+                with buffer.lock:
+                    if buffer.since is not None:
+                        if now - buffer.since >= self._flush_interval:
+                            try:
+                                self._flush_buffer(buffer)
+                            except Exception:
+                                logging.error(
+                                    "Flush buffered events failed: %s.",
+                                    traceback.format_exc(),
+                                )
+                        else:
+                            flush_at = buffer.since + self._flush_interval
+                            if deadline is None or flush_at < deadline:
+                                deadline = flush_at
+                    elif not buffer.thread.is_alive():
+                        with self._buffers_lock:
+                            self._buffers.remove(buffer)
+            self._flusher_wakeup.wait(
+                self._flush_interval if deadline is None else deadline - now
+            )
+            self._flusher_wakeup.clear()
+
+
+class ProcessClassicEventWriter(ClassicEventWriter):
+    """Classic event writer shared by worker processes.
+
+    Events are serialized by the process which calls `write_events`, the
+    serialized events are put on a `multiprocessing.Queue` and a single
+    writer thread of the process which created the event writer writes
+    them to stdout. Worker processes never take the stdout lock, they only
+    block when `queue_size` chunks are waiting to be written.
+
+    The event writer must be created before the worker processes and
+    passed to them by inheritance, for example as `initargs` of
+    `solnlib.concurrent.process_pool.ProcessPool`.
+
+    Examples:
+        >>> from solnlib.concurrent import process_pool
+        >>> from solnlib.modular_input import event_writer
+        >>>
+        >>> def init_worker(ew):
+        >>>     global worker_ew
+        >>>     worker_ew = ew
+        >>>
+        >>> def parse(data):
+        >>>     worker_ew.write_events([worker_ew.create_event(data=...)])
+        >>>
+        >>> ew = event_writer.ProcessClassicEventWriter()
+        >>> pool = process_pool.ProcessPool(initializer=init_worker, initargs=(ew,))
+        >>> pool.apply_async(parse, (data,))
+        >>> ...
+        >>> pool.tear_down()
+        >>> ew.close()
+    """
+
+    description = "ProcessClassicEventWriter"
+
+    def __init__(
+        self,
+        lock: Union[threading.Lock, multiprocessing.Lock] = None,
+        queue_size: int = 1000,
+        flush_bytes: int = 1024**2,
+    ):
+        """Initializes ProcessClassicEventWriter.
+
+        Arguments:
+            lock: (optional) lock to exclusively access stdout, see
+                `ClassicEventWriter`.
+            queue_size: (optional) Max number of serialized chunks waiting
+                to be written, default is 1000.
+            flush_bytes: (optional) Max size of the chunks the writer
+                thread coalesces into one `<stream>` document, default
+                is 1 MiB.
+        """
+        super().__init__(lock)
+        self._flush_bytes = flush_bytes
+        self._owner_pid = os.getpid()
+        self._queue = multiprocessing.Queue(queue_size)
+        self._writer = threading.Thread(
+            target=self._run_writer, name="ProcessClassicEventWriter", daemon=True
+        )
+        self._writer.start()
+
+    def __getstate__(self):
+        # Only the queue is needed by worker processes
+        return {"_queue": self._queue, "_owner_pid": self._owner_pid}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._writer = None
+
+    def write_events(self, events):
+        """Serialize events and queue them for the writer thread.
+
+        Arguments:
+            events: List of events, or events created by
+                `create_events_bulk`.
+        """
+        if not events:
+            return
+
+        chunk = b"".join(XMLEvent.iter_serialized(events))
+        if chunk:
+            self._queue.put(chunk)
+
+    def flush(self):
+        """Events are written by the writer thread as soon as possible."""
+
+    def close(self, timeout: float = None):
+        """Write the queued events and stop the writer thread, the event
+        writer must not be used by worker processes afterwards.
+
+        Worker processes do not own the writer thread, closing the event
+        writer in a worker process does nothing.
+
+        Arguments:
+            timeout: (optional) Max seconds to wait for the writer thread,
+                default is None which waits forever.
+        """
+        if self._writer is None or os.getpid() != self._owner_pid:
+            return
+        self._queue.put(None)
+        self._writer.join(timeout)
+        self._writer = None
+
+    def _run_writer(self):
+        stopped = False
+        while not stopped:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            chunks = [chunk]
+            size = len(chunk)
+            while size < self._flush_bytes:
+                try:
+                    chunk = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if chunk is None:
+                    stopped = True
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            try:
+                with self._lock:
+                    self._write_chunks([b"<stream>" + b"".join(chunks) + b"</stream>"])
+            except Exception:
+                logging.error("Write queued events failed: %s.", traceback.format_exc())
+
+
+class _AIMDRateLimiter:
+    """Additive increase, multiplicative decrease limiter of requests in
+    flight to one HEC endpoint.
+
+    Limiters are shared by every HEC event writer of the process which
+    posts to the same endpoint, so writers slow down together when HEC is
+    saturated and ramp back up together instead of backing off separately
+    and stampeding back.
+    """
+
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+
+    # Window is halved at most once per this number of seconds, requests
+    # already in flight when HEC got saturated will fail as well.
+    decrease_interval = 1.0
+    max_pause = 80.0
+
+    SUCCEEDED = "succeeded"
+    THROTTLED = "throttled"
+
+    def __init__(self, max_window):
+        self._max_window = float(max_window)
+        self._window = float(max_window)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._throttled_count = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def for_endpoint(cls, uri, max_window):
+        with cls._limiters_lock:
+            limiter = cls._limiters.get(uri)
+            if limiter is None:
+                limiter = cls._limiters[uri] = cls(max_window)
+            return limiter
+
+    @property
+    def window(self):
+        return self._window
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                delay = self._paused_until - time.time()
+                if delay <= 0 and self._in_flight < int(self._window):
+                    break
+                self._cond.wait(delay if delay > 0 else None)
+            self._in_flight += 1
+
+    def release(self, outcome=None, retry_after=None):
+        """Release a request slot.
+
+        Arguments:
+            outcome: `SUCCEEDED` grows the window, `THROTTLED` shrinks it
+                and pauses requests, None (connection errors, rejected
+                payloads) leaves it unchanged.
+            retry_after: Seconds to pause when throttled, default is None
+                which backs off exponentially.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            now = time.time()
+            if outcome == self.THROTTLED:
+                self._throttled_count += 1
+                if now - self._last_decrease >= self.decrease_interval:
+                    self._window = max(1.0, self._window / 2)
+                    self._last_decrease = now
+                if retry_after is None:
+                    # 1, 2, 4, ... seconds while HEC keeps throttling
+                    retry_after = min(2 ** (self._throttled_count - 1), self.max_pause)
+                    retry_after += randint(0, 1000) / 1000.0
+                self._paused_until = max(self._paused_until, now + retry_after)
+            elif outcome == self.SUCCEEDED:
+                self._throttled_count = 0
+                self._window = min(self._max_window, self._window + 1 / self._window)
+            self._cond.notify_all()
+
+
+def _get_retry_after(e):
+    for key, value in (e.headers or {}).items():
+        if key.lower() == "retry-after":
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                pass
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class _HECEndpoint:
+    """A HEC endpoint with its REST client, health and throughput counters."""
+
+    def __init__(self, uri, rest_client, eject_after, eject_period, rate_limiter=None):
+        self.uri = uri
+        self.rest_client = rest_client
+        self.rate_limiter = rate_limiter
+        self._eject_after = eject_after
+        self._eject_period = eject_period
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.batches = 0
+        self.events = 0
+        self.bytes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = None
+
+    def is_available(self, now):
+        ejected_until = self.ejected_until
+        if ejected_until is None:
+            return True
+        # Once the ejection period passed, one request at a time probes
+        # whether the endpoint recovered.
+        return now >= ejected_until and self.in_flight == 0
+
+    def start_request(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish_request(self, body=None, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            if body is not None:
+                self.batches += 1
+                self.events += body.count(b"\n") + 1
+                self.bytes += len(body)
+                self.consecutive_failures = 0
+                self.ejected_until = None
+            elif failed:
+                self.failures += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self._eject_after:
+                    self.ejected_until = time.time() + self._eject_period
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "batches": self.batches,
+                "events": self.events,
+                "bytes": self.bytes,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "ejected": self.ejected_until is not None
+                and time.time() < self.ejected_until,
+            }
+        if self.rate_limiter is not None:
+            stats["rate_window"] = self.rate_limiter.window
+        return stats
 
 
 class HECEventWriter(EventWriter):
@@ -196,8 +755,15 @@ class HECEventWriter(EventWriter):
     WRITE_EVENT_RETRIES = 5
     HTTP_INPUT_CONFIG_ENDPOINT = "/servicesNS/nobody/splunk_httpinput/data/inputs/http"
     HTTP_EVENT_COLLECTOR_ENDPOINT = "/services/collector"
+    HTTP_EVENT_COLLECTOR_ACK_ENDPOINT = "/services/collector/ack"
+    HTTP_EVENT_COLLECTOR_RAW_ENDPOINT = "/services/collector/raw"
     TOO_MANY_REQUESTS = 429  # we exceeded rate limit
     SERVICE_UNAVAILABLE = 503  # remote service is temporary unavailable
+    BAD_REQUEST = 400  # invalid event data
+    PAYLOAD_TOO_LARGE = 413  # batch exceeds max_content_length
+    COMPRESSION_GZIP = "gzip"
+    ROUND_ROBIN = "round_robin"
+    LEAST_OUTSTANDING = "least_outstanding"
 
     description = "HECEventWriter"
 
@@ -214,6 +780,21 @@ class HECEventWriter(EventWriter):
         hec_token: str = None,
         global_settings_schema: bool = True,
         logger: logging.Logger = None,
+        max_in_flight: int = 1,
+        compression: str = None,
+        compression_level: int = 6,
+        compression_threshold: int = 1024,
+        use_ack: bool = False,
+        channel: str = None,
+        hec_uris: list = None,
+        load_balancing: str = ROUND_ROBIN,
+        eject_after: int = 3,
+        eject_period: float = 30.0,
+        rate_control: bool = False,
+        rate_control_max_in_flight: int = 32,
+        spool: HECSpool = None,
+        spool_replay_interval: float = 30.0,
+        serializer: Union[str, Callable] = None,
         **context: dict
     ):
         """Initializes HECEventWriter.
@@ -229,6 +810,59 @@ class HECEventWriter(EventWriter):
             hec_token: (optional) HEC token.
             global_settings_schema: (optional) if True, scheme will be set based on HEC global settings, default False.
             logger: Logger object.
+            max_in_flight: (optional) Max number of batches posted to HEC
+                concurrently by `write_events`, default is 1 which posts
+                batches one after another on the calling thread.
+            compression: (optional) Content encoding of request bodies, only
+                `gzip` is supported, default is None which sends them
+                uncompressed. Batches are sized on their uncompressed length,
+                so they stay within HEC `max_content_length` whether it is
+                enforced before or after decompression.
+            compression_level: (optional) Compression level from 1 (fastest)
+                to 9 (smallest), default is 6.
+            compression_threshold: (optional) Bodies shorter than this number
+                of bytes are sent uncompressed, default is 1024.
+            use_ack: (optional) If True, track the indexer acknowledgement
+                ID of every posted batch, the HEC token must have indexer
+                acknowledgement enabled. Default is False.
+            channel: (optional) HEC channel sent in the
+                `X-Splunk-Request-Channel` header. When `use_ack` is True
+                and no channel is provided, a random one is generated.
+            hec_uris: (optional) List of HEC URIs sharing `hec_token`, like
+                `https://idx1:8088`. Batches are distributed across them and
+                they take precedence over `hec_uri`.
+            load_balancing: (optional) How batches are distributed across
+                `hec_uris`: `round_robin` or `least_outstanding` which picks
+                the endpoint with the fewest requests in flight,
+                default is `round_robin`.
+            eject_after: (optional) Number of consecutive 503 responses or
+                connection errors after which an endpoint stops receiving
+                batches, default is 3.
+            eject_period: (optional) Seconds an ejected endpoint stops
+                receiving batches, after that a single batch probes whether
+                it recovered, default is 30.0.
+            rate_control: (optional) If True, requests to every HEC endpoint
+                go through an AIMD limiter shared by all HEC event writers of
+                the process. On 429 and 503 responses it halves the number of
+                requests allowed in flight and pauses sending for
+                `Retry-After` seconds (or an exponential delay when HEC does
+                not provide it), then grows back by one request per window
+                of successful ones. It replaces the fixed 10, 20, 40, 80
+                seconds backoff. Default is False.
+            rate_control_max_in_flight: (optional) Max number of requests
+                the limiter of an endpoint allows in flight, default is 32.
+                The first writer creating the limiter of an endpoint sets it.
+            spool: (optional) Disk spool which receives batches that could
+                not be written because HEC stayed unavailable (429, 503 or
+                connection errors) after all retries, instead of raising.
+                A background thread replays spooled batches in order. Batches
+                written afterwards are not held back while the spool drains.
+            spool_replay_interval: (optional) Seconds between two attempts to
+                replay the spool while HEC is unavailable, default is 30.0.
+            serializer: (optional) JSON serializer of events: `orjson`,
+                `ujson`, `json` or a function returning bytes, default is
+                None which picks the fastest installed one. See
+                `solnlib.modular_input.event.get_json_serializer`.
             context: Other configurations for Splunk rest client.
         """
         super().__init__()
@@ -238,6 +872,8 @@ class HECEventWriter(EventWriter):
         else:
             self.logger = logging
 
+        if hec_uris and hec_token:
+            hec_uri = hec_uris[0]
         if hec_uri and hec_token:
             scheme, host, hec_port = utils.extract_http_scheme_host_port(hec_uri)
         else:
@@ -253,15 +889,87 @@ class HECEventWriter(EventWriter):
         if not context.get("pool_connections"):
             context["pool_connections"] = 10
 
-        if not context.get("pool_maxsize"):
-            context["pool_maxsize"] = 10
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight should be a positive integer.")
+        self._max_in_flight = max_in_flight
+
+        if compression not in (None, self.COMPRESSION_GZIP):
+            raise ValueError("Unsupported compression: %s." % compression)
+        self._compression = compression
+        self._compression_level = compression_level
+        self._compression_threshold = compression_threshold
+
+        if use_ack and not channel:
+            channel = str(uuid.uuid4())
+        self._use_ack = use_ack
+        self._channel = channel
+        # acknowledgement ID returned by write_events -> (endpoint, HEC ackId)
+        self._pending_acks = {}
+        self._next_ack_id = 0
+        # Identifies the acknowledgement IDs of batches spooled by this writer
+        self._writer_id = uuid.uuid4().hex
+        self._ack_lock = threading.Lock()
+
+        if load_balancing not in (self.ROUND_ROBIN, self.LEAST_OUTSTANDING):
+            raise ValueError("Invalid load_balancing: %s." % load_balancing)
+        self._load_balancing = load_balancing
+        self._next_endpoint = 0
+        self._endpoint_lock = threading.Lock()
 
-        self._rest_client = rest_client.SplunkRestClient(
-            hec_token, app="-", scheme=scheme, host=host, port=hec_port, **context
-        )
+        if not context.get("pool_maxsize"):
+            context["pool_maxsize"] = max(10, max_in_flight)
+
+        endpoints = [(scheme, host, hec_port)]
+        if hec_uris and hec_token:
+            for uri in hec_uris[1:]:
+                (
+                    endpoint_scheme,
+                    endpoint_host,
+                    endpoint_port,
+                ) = utils.extract_http_scheme_host_port(uri)
+                if global_settings_schema:
+                    endpoint_scheme = scheme
+                endpoints.append((endpoint_scheme, endpoint_host, endpoint_port))
+
+        self._endpoints = [
+            _HECEndpoint(
+                "{}://{}:{}".format(*endpoint),
+                rest_client.SplunkRestClient(
+                    hec_token,
+                    app="-",
+                    scheme=endpoint[0],
+                    host=endpoint[1],
+                    port=endpoint[2],
+                    **context,
+                ),
+                eject_after,
+                eject_period,
+                _AIMDRateLimiter.for_endpoint(
+                    "{}://{}:{}".format(*endpoint), rate_control_max_in_flight
+                )
+                if rate_control
+                else None,
+            )
+            for endpoint in endpoints
+        ]
+        self._rest_client = self._endpoints[0].rest_client
+
+        self._serializer = get_json_serializer(serializer)
+
+        self._spool = spool
+        self._spool_replay_interval = spool_replay_interval
+        self._spool_wakeup = threading.Event()
+        self._spool_closed = False
+        self._spool_replayer = None
+        if spool is not None:
+            self._spool_replayer = threading.Thread(
+                target=self._replay_spool, name="HECSpoolReplayer", daemon=True
+            )
+            self._spool_replayer.start()
 
-    @staticmethod
+    @classmethod
     def create_from_token(
+        cls,
         hec_uri: str,
         hec_token: str,
         global_settings_schema: bool = False,
@@ -286,7 +994,7 @@ class HECEventWriter(EventWriter):
         if global_settings_schema:
             raise FunctionDeprecated(deprecation_msg)
 
-        return HECEventWriter(
+        return cls(
             None,
             None,
             None,
@@ -295,11 +1003,12 @@ class HECEventWriter(EventWriter):
             hec_uri=hec_uri,
             hec_token=hec_token,
             global_settings_schema=global_settings_schema,
-            **context
+            **context,
         )
 
-    @staticmethod
+    @classmethod
     def create_from_input(
+        cls,
         hec_input_name: str,
         splunkd_uri: str,
         session_key: str,
@@ -324,18 +1033,19 @@ class HECEventWriter(EventWriter):
         """
 
         scheme, host, port = utils.extract_http_scheme_host_port(splunkd_uri)
-        return HECEventWriter(
+        return cls(
             hec_input_name,
             session_key,
             scheme,
             host,
             port,
             global_settings_schema=global_settings_schema,
-            **context
+            **context,
         )
 
-    @staticmethod
+    @classmethod
     def create_from_token_with_session_key(
+        cls,
         splunkd_uri: str,
         session_key: str,
         hec_uri: str,
@@ -361,7 +1071,7 @@ class HECEventWriter(EventWriter):
         """
 
         scheme, host, port = utils.extract_http_scheme_host_port(splunkd_uri)
-        return HECEventWriter(
+        return cls(
             None,
             session_key,
             scheme,
@@ -370,7 +1080,7 @@ class HECEventWriter(EventWriter):
             hec_uri=hec_uri,
             hec_token=hec_token,
             global_settings_schema=global_settings_schema,
-            **context
+            **context,
         )
 
     @retry(exceptions=[binding.HTTPError])
@@ -457,6 +1167,63 @@ class HECEventWriter(EventWriter):
             fields=fields,
         )
 
+    def create_events_bulk(
+        self,
+        data: list,
+        time: Union[float, list] = None,
+        index: Union[str, list] = None,
+        host: Union[str, list] = None,
+        source: Union[str, list] = None,
+        sourcetype: Union[str, list] = None,
+        fields: Union[dict, list] = None,
+    ) -> EventColumns:
+        """Create events from columns of values, without creating a
+        HECEvent object per event.
+
+        Events are serialized straight from the columns by `write_events`,
+        which is cheaper when the data already is column oriented, like
+        lists of timestamps and payloads of an API response page.
+
+        Arguments:
+            data: List of event data.
+            time: (optional) Event timestamp or list of event timestamps,
+                default is None.
+            index: (optional) The index events will be written to or list
+                of indexes, default is None.
+            host: (optional) Event host or list of hosts, default is None.
+            source: (optional) Event source or list of sources,
+                default is None.
+            sourcetype: (optional) Event sourcetype or list of
+                sourcetypes, default is None.
+            fields: (optional) Event fields or list of event fields,
+                default is None.
+
+        Returns:
+            Created events, to be passed to `write_events`.
+
+        Raises:
+            EventException: If a list does not have one value per event.
+
+        Examples:
+           >>> events = ew.create_events_bulk(
+           >>>     data=[item['message'] for item in page],
+           >>>     time=[item['timestamp'] for item in page],
+           >>>     index='main',
+           >>>     sourcetype='misc')
+           >>> ew.write_events(events)
+        """
+
+        return EventColumns(
+            HECEvent,
+            data,
+            time=time,
+            index=index,
+            host=host,
+            source=source,
+            sourcetype=sourcetype,
+            fields=fields,
+        )
+
     def write_events(
         self,
         events: list,
@@ -465,44 +1232,782 @@ class HECEventWriter(EventWriter):
     ):
         """Write events to index in bulk.
 
+        When the writer was created with `use_ack`, the acknowledgement IDs
+        of the posted batches are returned. A batch is durably indexed once
+        its ID is reported as acknowledged by `query_acks`, `poll_acks` or
+        `wait_for_acks`, which is when checkpoints covering its events
+        can safely be advanced. Batches written to the spool are not
+        acknowledged before they are replayed and indexed, batches dropped
+        by the replay are never acknowledged.
+
+        Events are serialized and batched incrementally, so `events` can be
+        an iterator and memory is bounded by the batches being posted.
+
+        When the writer was created with `max_in_flight` greater than 1,
+        batches are posted concurrently and every batch is attempted even
+        if some of them fail.
+
         Arguments:
-            events: List of events.
+            events: List or iterator of events, or events created by
+                `create_events_bulk`.
             retries: Number of retries for writing events to index.
             event_field: Event field.
+
+        Raises:
+            binding.HTTPError: When a batch could not be written and
+                `max_in_flight` is 1.
+            HECEventWriterException: When one or more batches could not be
+                written and `max_in_flight` is greater than 1.
+
+        Returns:
+            List of acknowledgement IDs, one per batch in the order batches
+            were produced, if `use_ack` is True, otherwise None.
         """
         if not events:
-            return
+            return [] if self._use_ack else None
 
-        last_ex = None
-        for event in HECEvent.format_events(events, event_field):
-            for i in range(retries):
-                try:
-                    self._rest_client.post(
-                        self.HTTP_EVENT_COLLECTOR_ENDPOINT,
-                        body=event.encode("utf-8"),
-                        headers=self.headers,
-                    )
-                except binding.HTTPError as e:
-                    self.logger.warn(
-                        "Write events through HEC failed. Status=%s", e.status
-                    )
-                    last_ex = e
-                    if e.status in [self.TOO_MANY_REQUESTS, self.SERVICE_UNAVAILABLE]:
-                        # wait time for n retries: 10, 20, 40, 80, 80, 80, 80, ....
-                        sleep_time = min(((2 ** (i + 1)) * 5), 80)
-                        if i < retries - 1:
-                            random_millisecond = randint(0, 1000) / 1000.0
-                            time.sleep(sleep_time + random_millisecond)
-                    else:
-                        raise last_ex
-                else:
-                    break
+        return self._write_batches(
+            HECEvent.iter_batches(events, event_field, self._serializer),
+            retries,
+            self.HTTP_EVENT_COLLECTOR_ENDPOINT,
+        )
+
+    def write_raw(
+        self,
+        lines: list,
+        sourcetype: str = None,
+        index: str = None,
+        host: str = None,
+        source: str = None,
+        channel: str = None,
+        retries: int = WRITE_EVENT_RETRIES,
+    ):
+        """Write pre-formatted lines to index through the HEC raw endpoint.
+
+        Lines are sent as newline delimited bytes without being wrapped into
+        events, Splunk applies line breaking and timestamp extraction of
+        `sourcetype` to them. Batching, concurrency, compression and
+        acknowledgement work the same as for `write_events`.
+
+        Arguments:
+            lines: List or iterator of lines, `str` or UTF-8 `bytes`.
+                A trailing newline of a line is stripped.
+            sourcetype: (optional) Sourcetype of the lines, default is None.
+            index: (optional) The index lines will be written to,
+                default is None.
+            host: (optional) Host of the lines, default is None.
+            source: (optional) Source of the lines, default is None.
+            channel: (optional) HEC channel, default is the channel of the
+                event writer. Acknowledgements are only tracked for the
+                channel of the event writer.
+            retries: Number of retries for writing lines to index.
+
+        Raises:
+            binding.HTTPError: When a batch could not be written and
+                `max_in_flight` is 1.
+            HECEventWriterException: When one or more batches could not be
+                written and `max_in_flight` is greater than 1.
+
+        Returns:
+            List of acknowledgement IDs, one per batch, if `use_ack` is True,
+            otherwise None.
+
+        Examples:
+           >>> ew.write_raw(
+           >>>     ['Oct 18 10:01:02 host sshd[42]: Accepted publickey', ...],
+           >>>     sourcetype='syslog',
+           >>>     index='main')
+        """
+        query = {
+            "sourcetype": sourcetype,
+            "index": index,
+            "host": host,
+            "source": source,
+        }
+        query = {key: value for key, value in query.items() if value}
+        return self._write_batches(
+            HECEvent.join_batches(self._encode_line(line) for line in lines),
+            retries,
+            self.HTTP_EVENT_COLLECTOR_RAW_ENDPOINT,
+            channel,
+            query,
+        )
+
+    @staticmethod
+    def _encode_line(line):
+        if isinstance(line, str):
+            line = line.encode("utf-8")
+        if line.endswith(b"\n"):
+            line = line[:-2] if line.endswith(b"\r\n") else line[:-1]
+        return line
+
+    def _write_batches(self, batches, retries, endpoint, channel=None, query=None):
+        args = (retries, endpoint, channel, query)
+        if self._max_in_flight == 1:
+            ack_ids = [self._write_batch(batch, *args) for batch in batches]
+        else:
+            ack_ids = self._write_batches_concurrently(batches, args)
+        return ack_ids if self._use_ack else None
+
+    def _write_batches_concurrently(self, batches, args):
+        results = {}
+        failures = {}
+        batch_count = 0
+        with ThreadPoolExecutor(
+            max_workers=self._max_in_flight, thread_name_prefix="HECEventWriter"
+        ) as executor:
+            pending = {}
+            for batch in batches:
+                if len(pending) >= self._max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect_batch_results(done, pending, results, failures)
+                future = executor.submit(self._write_batch, batch, *args)
+                pending[future] = batch_count
+                batch_count += 1
+            self._collect_batch_results(list(pending), pending, results, failures)
+
+        if failures:
+            raise HECEventWriterException(failures, batch_count)
+        return [results[i] for i in range(batch_count)]
+
+    @staticmethod
+    def _collect_batch_results(done, pending, results, failures):
+        for future in done:
+            index = pending.pop(future)
+            ex = future.exception()
+            if ex is not None:
+                failures[index] = ex
             else:
-                # When failed after retry, we reraise the exception
-                # to exit the function to let client handle this situation
+                results[index] = future.result()
+
+    def _request_headers(self, channel=None):
+        channel = channel or self._channel
+        if channel:
+            return self.headers + [("X-Splunk-Request-Channel", channel)]
+        return self.headers
+
+    def query_acks(self, ack_ids: list) -> dict:
+        """Query HEC for the acknowledgement status of `ack_ids`.
+
+        Arguments:
+            ack_ids: Acknowledgement IDs returned by `write_events`.
+
+        Returns:
+            Dict of acknowledgement ID to True if the batch has been indexed,
+            False otherwise.
+        """
+        with self._ack_lock:
+            tracked = {
+                ack_id: self._pending_acks.get(ack_id)
+                for ack_id in ack_ids
+                if ack_id is not None
+            }
+
+        # IDs which are no longer pending were acknowledged before, IDs of
+        # spooled batches are not acknowledged until they are replayed
+        statuses = {
+            ack_id: ack is None
+            for ack_id, ack in tracked.items()
+            if ack is None or ack is _SPOOLED
+        }
+        by_endpoint = collections.defaultdict(dict)
+        for ack_id, ack in tracked.items():
+            if ack is not None and ack is not _SPOOLED:
+                by_endpoint[ack[0]][ack[1]] = ack_id
+
+        for endpoint, hec_ack_ids in by_endpoint.items():
+            response = endpoint.rest_client.post(
+                self.HTTP_EVENT_COLLECTOR_ACK_ENDPOINT,
+                body=json.dumps({"acks": list(hec_ack_ids)}).encode("utf-8"),
+                headers=self._request_headers(),
+            )
+            acks = json.loads(response.body.read())["acks"]
+            for hec_ack_id, ack_id in hec_ack_ids.items():
+                statuses[ack_id] = bool(acks.get(str(hec_ack_id)))
+
+        with self._ack_lock:
+            for ack_id, acked in statuses.items():
+                if acked:
+                    self._pending_acks.pop(ack_id, None)
+        return statuses
+
+    @property
+    def pending_acks(self) -> set:
+        """Acknowledgement IDs of posted batches which are not acknowledged
+        yet."""
+        with self._ack_lock:
+            return set(self._pending_acks)
+
+    def poll_acks(self) -> set:
+        """Query HEC for every pending acknowledgement in bulk.
+
+        Returns:
+            Set of acknowledgement IDs which became acknowledged.
+        """
+        statuses = self.query_acks(sorted(self.pending_acks))
+        return {ack_id for ack_id, acked in statuses.items() if acked}
+
+    def wait_for_acks(
+        self, ack_ids: list, timeout: float = None, poll_interval: float = 1.0
+    ) -> bool:
+        """Wait until every batch in `ack_ids` has been indexed.
+
+        Arguments:
+            ack_ids: Acknowledgement IDs returned by `write_events`.
+            timeout: (optional) Max seconds to wait, default is None which
+                waits forever.
+            poll_interval: (optional) Seconds between two acknowledgement
+                queries, default is 1.0.
+
+        Returns:
+            True if every batch was acknowledged, False on timeout.
+
+        Examples:
+           >>> ack_ids = ew.write_events(events)
+           >>> if ew.wait_for_acks(ack_ids, timeout=60):
+           >>>     checkpointer.update(key, state)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        remaining = {ack_id for ack_id in ack_ids if ack_id is not None}
+        while True:
+            remaining = {
+                ack_id
+                for ack_id, acked in self.query_acks(sorted(remaining)).items()
+                if not acked
+            }
+            if not remaining:
+                return True
+            if deadline is not None and time.time() + poll_interval > deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def _encode_body(self, body, channel=None):
+        headers = self._request_headers(channel)
+        if self._compression and len(body) >= self._compression_threshold:
+            body = gzip.compress(body, compresslevel=self._compression_level)
+            return body, headers + [("Content-Encoding", self._compression)]
+        return body, headers
+
+    def _tracks_acks(self, channel):
+        return self._use_ack and channel in (None, self._channel)
+
+    def _new_ack_id(self, ack):
+        with self._ack_lock:
+            ack_id = self._next_ack_id
+            self._next_ack_id += 1
+            self._pending_acks[ack_id] = ack
+        return ack_id
+
+    def _track_ack(self, endpoint, response, ack_id=None):
+        hec_ack_id = json.loads(response.body.read()).get("ackId")
+        if hec_ack_id is None:
+            if ack_id is not None:
+                with self._ack_lock:
+                    self._pending_acks.pop(ack_id, None)
+            return None
+        if ack_id is None:
+            return self._new_ack_id((endpoint, hec_ack_id))
+        with self._ack_lock:
+            self._pending_acks[ack_id] = (endpoint, hec_ack_id)
+        return ack_id
+
+    def _spooled_ack_id(self, spooled_ack):
+        # IDs spooled by another writer (or process) were never returned
+        # to a caller of this writer
+        writer_id, _, ack_id = (spooled_ack or "").partition(":")
+        if writer_id != self._writer_id:
+            return None
+        ack_id = int(ack_id)
+        with self._ack_lock:
+            if self._pending_acks.get(ack_id) is not _SPOOLED:
+                return None
+        return ack_id
+
+    def endpoint_stats(self) -> dict:
+        """Get per HEC endpoint counters.
+
+        Returns:
+            Dict of HEC URI to counters of batches, events and bytes written,
+            failed requests, requests in flight and whether the endpoint is
+            currently ejected, like::
+
+                {
+                    'https://idx1:8088': {
+                        'batches': 120,
+                        'events': 240000,
+                        'bytes': 119000000,
+                        'failures': 0,
+                        'in_flight': 2,
+                        'ejected': False,
+                    },
+                    ...
+                }
+        """
+        return {endpoint.uri: endpoint.stats() for endpoint in self._endpoints}
+
+    def _reserve_endpoint(self, exclude=None):
+        """Select the endpoint of the next request and count the request in
+        its `in_flight` while holding the selection lock, so only one
+        request probes an endpoint whose ejection expired."""
+        now = time.time()
+        with self._endpoint_lock:
+            endpoint = self._select_endpoint(now, exclude)
+            endpoint.start_request()
+            return endpoint
+
+    def _select_endpoint(self, now, exclude=None):
+        candidates = [
+            endpoint
+            for endpoint in self._endpoints
+            if endpoint is not exclude and endpoint.is_available(now)
+        ]
+        if not candidates:
+            if exclude is not None and exclude.is_available(now):
+                return exclude
+            # every endpoint is ejected, use the one recovering first, a
+            # successful request from another thread can clear ejected_until
+            return min(self._endpoints, key=lambda e: e.ejected_until or 0)
+
+        start = self._next_endpoint
+        self._next_endpoint = (start + 1) % len(self._endpoints)
+        # rotate candidates so ties are broken in round robin order
+        candidates.sort(
+            key=lambda e: (self._endpoints.index(e) - start) % len(self._endpoints)
+        )
+        if self._load_balancing == self.LEAST_OUTSTANDING:
+            return min(candidates, key=lambda e: e.in_flight)
+        return candidates[0]
+
+    def spool_stats(self) -> Optional[dict]:
+        """Get metrics of the spool.
+
+        Returns:
+            Dict with `spooled_bytes` and `spooled_events` waiting to be
+            replayed and `disk_bytes` used by the spool, None if the writer
+            has no spool.
+        """
+        return self._spool.stats() if self._spool is not None else None
+
+    def close(self, timeout: float = None):
+        """Stop replaying the spool.
+
+        Batches still in the spool are replayed by the next writer created
+        on the same spool directory.
+
+        Arguments:
+            timeout: (optional) Max seconds to wait for the batch being
+                replayed, default is None which waits forever.
+        """
+        if self._spool_replayer is None:
+            return
+        self._spool_closed = True
+        self._spool_wakeup.set()
+        self._spool_replayer.join(timeout)
+        self._spool_replayer = None
+        self._spool.close()
+
+    def _write_batch(self, batch, retries, path, channel=None, query=None):
+        try:
+            endpoint, response = self._send_batch(batch, retries, path, channel, query)
+        except (binding.HTTPError, OSError) as e:
+            if self._spool is None or not self._is_unavailable(e):
+                raise
+            events = batch.count(b"\n") + 1
+            ack_id = spooled_ack = None
+            if self._tracks_acks(channel):
+                ack_id = self._new_ack_id(_SPOOLED)
+                spooled_ack = "%s:%d" % (self._writer_id, ack_id)
+            if not self._spool.append(
+                batch, path, query, channel, events, ack_id=spooled_ack
+            ):
+                if ack_id is not None:
+                    with self._ack_lock:
+                        self._pending_acks.pop(ack_id, None)
+                self.logger.error(
+                    "HEC spool is full, %d events were not spooled.", events
+                )
+                raise
+            self.logger.warning(
+                "HEC is unavailable, %d events were spooled to disk.", events
+            )
+            self._spool_wakeup.set()
+            return ack_id
+
+        if self._tracks_acks(channel):
+            return self._track_ack(endpoint, response)
+        return None
+
+    def _is_unavailable(self, e):
+        if isinstance(e, binding.HTTPError):
+            return e.status in [self.TOO_MANY_REQUESTS, self.SERVICE_UNAVAILABLE]
+        return True
+
+    def _replay_spool(self):
+        while not self._spool_closed:
+            batch = self._spool.peek()
+            if batch is None:
+                self._spool_wakeup.wait(self._spool_replay_interval)
+                self._spool_wakeup.clear()
+                continue
+            try:
+                endpoint, response = self._send_batch(
+                    batch.body, 1, batch.path, batch.channel, batch.query
+                )
+            except binding.HTTPError as e:
+                # Batches HEC will never accept are dropped, other errors
+                # (unavailable, expired or rotated token, ...) are retried
+                if e.status not in [self.BAD_REQUEST, self.PAYLOAD_TOO_LARGE]:
+                    self.logger.warning(
+                        "Replay of spooled events failed, it will be retried. "
+                        "Status=%s",
+                        e.status,
+                    )
+                    self._spool_wakeup.wait(self._spool_replay_interval)
+                    self._spool_wakeup.clear()
+                    continue
                 self.logger.error(
-                    "Write events through HEC failed: %s. status=%s",
+                    "Replay of %s spooled events failed, they are dropped: %s.",
+                    batch.events,
                     traceback.format_exc(),
-                    last_ex.status,
                 )
-                raise last_ex
+            except OSError:
+                self._spool_wakeup.wait(self._spool_replay_interval)
+                self._spool_wakeup.clear()
+                continue
+            except Exception:
+                self.logger.error(
+                    "Replay of spooled events failed: %s.", traceback.format_exc()
+                )
+                self._spool_wakeup.wait(self._spool_replay_interval)
+                self._spool_wakeup.clear()
+                continue
+            else:
+                self._track_replayed_ack(batch, endpoint, response)
+            self._spool.pop()
+
+    def _track_replayed_ack(self, batch, endpoint, response):
+        # Only batches spooled by this writer have an ID a caller waits for
+        ack_id = self._spooled_ack_id(batch.ack_id)
+        if ack_id is None:
+            return
+        try:
+            self._track_ack(endpoint, response, ack_id)
+        except Exception:
+            self.logger.error(
+                "Track acknowledgement of replayed events failed: %s.",
+                traceback.format_exc(),
+            )
+
+    def _send_batch(self, batch, retries, path, channel=None, query=None):
+        body, headers = self._encode_body(batch, channel)
+        last_ex = None
+        endpoint = None
+        # Endpoints which failed since the last backoff
+        failed_endpoints = set()
+        backoffs = 0
+        for i in range(retries):
+            endpoint = self._reserve_endpoint(exclude=endpoint)
+            limiter = endpoint.rate_limiter
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                response = endpoint.rest_client.post(
+                    path, body=body, headers=headers, **(query or {})
+                )
+            except binding.HTTPError as e:
+                throttled = e.status in [
+                    self.TOO_MANY_REQUESTS,
+                    self.SERVICE_UNAVAILABLE,
+                ]
+                endpoint.finish_request(failed=e.status == self.SERVICE_UNAVAILABLE)
+                if limiter is not None and throttled:
+                    limiter.release(limiter.THROTTLED, _get_retry_after(e))
+                elif limiter is not None:
+                    limiter.release()
+                self.logger.warn(
+                    "Write events through HEC failed. Status=%s, endpoint=%s",
+                    e.status,
+                    endpoint.uri,
+                )
+                last_ex = e
+                if throttled:
+                    failed_endpoints.add(endpoint)
+                    # Fail over right away while another endpoint did not
+                    # fail, with rate control the limiter delays the next
+                    # request, otherwise once every endpoint failed wait
+                    # time for n retries: 10, 20, 40, 80, 80, ....
+                    if (
+                        i < retries - 1
+                        and limiter is None
+                        and not self._can_fail_over(failed_endpoints)
+                    ):
+                        sleep_time = min(((2 ** (backoffs + 1)) * 5), 80)
+                        random_millisecond = randint(0, 1000) / 1000.0
+                        time.sleep(sleep_time + random_millisecond)
+                        backoffs += 1
+                        failed_endpoints.clear()
+                else:
+                    raise last_ex
+            except OSError as e:
+                # Connection errors, fail over to another endpoint if any
+                endpoint.finish_request(failed=True)
+                if limiter is not None:
+                    limiter.release()
+                if len(self._endpoints) == 1:
+                    raise
+                failed_endpoints.add(endpoint)
+                self.logger.warning(
+                    "Write events through HEC failed. Error=%s, endpoint=%s",
+                    e,
+                    endpoint.uri,
+                )
+                last_ex = e
+            except BaseException:
+                # Any other error, the request slots must not leak
+                endpoint.finish_request()
+                if limiter is not None:
+                    limiter.release()
+                raise
+            else:
+                endpoint.finish_request(body=batch)
+                if limiter is not None:
+                    limiter.release(limiter.SUCCEEDED)
+                return endpoint, response
+
+        # When failed after retry, we reraise the exception
+        # to exit the function to let client handle this situation
+        self.logger.error(
+            "Write events through HEC failed: %s. status=%s",
+            traceback.format_exc(),
+            getattr(last_ex, "status", None),
+        )
+        raise last_ex
+
+    def _can_fail_over(self, failed_endpoints):
+        now = time.time()
+        return any(
+            other not in failed_endpoints and other.is_available(now)
+            for other in self._endpoints
+        )
+
+
+class AsyncHECEventWriter(HECEventWriter):
+    """Asynchronous HEC event writer.
+
+    Events are accepted into a bounded in-memory queue and written to HEC
+    by a background sender thread, so `write_events` does not block on the
+    HEC round-trip. `close` (or `flush`) must be called before exit to make
+    sure queued events are written.
+
+    Examples:
+        >>> from solnlib.modular_input import event_writer
+        >>> ew = event_writer.AsyncHECEventWriter(hec_input_name, session_key)
+        >>> ew.write_events([event1, event2])
+        >>> ew.flush(timeout=30)
+        >>> ew.close()
+
+        In a modular input, set `use_async_hec_event_writer = True` on the
+        `ModularInput` subclass, `ModularInput.execute` closes the event
+        writer with `event_writer_close_timeout` when `do_run` returns,
+        teardown handlers can also close it:
+
+        >>> mi.register_teardown_handler(mi.event_writer.close)
+    """
+
+    OVERFLOW_BLOCK = "block"
+    OVERFLOW_DROP_OLDEST = "drop_oldest"
+    OVERFLOW_RAISE = "raise"
+
+    description = "AsyncHECEventWriter"
+
+    def __init__(
+        self,
+        *args,
+        queue_size: int = 10000,
+        overflow_policy: str = OVERFLOW_BLOCK,
+        max_batch_events: int = 1000,
+        **kwargs
+    ):
+        """Initializes AsyncHECEventWriter.
+
+        Arguments:
+            args: Positional arguments of `HECEventWriter`.
+            queue_size: (optional) Max number of events waiting in the queue,
+                default is 10000.
+            overflow_policy: (optional) What `write_events` does when the
+                queue is full: `block` waits for free space, `drop_oldest`
+                discards the oldest queued events and `raise` raises
+                `queue.Full` without queueing any of the events,
+                default is `block`.
+            max_batch_events: (optional) Max number of queued events the
+                sender thread passes to one `HECEventWriter.write_events`
+                call, default is 1000.
+            kwargs: Keyword arguments of `HECEventWriter`, `use_ack` is not
+                supported since the acknowledgement IDs are not returned by
+                `write_events`.
+        """
+        if overflow_policy not in (
+            self.OVERFLOW_BLOCK,
+            self.OVERFLOW_DROP_OLDEST,
+            self.OVERFLOW_RAISE,
+        ):
+            raise ValueError("Invalid overflow_policy: %s." % overflow_policy)
+        if queue_size < 1:
+            raise ValueError("queue_size should be a positive integer.")
+
+        super().__init__(*args, **kwargs)
+        if self._use_ack:
+            super().close()
+            raise ValueError("AsyncHECEventWriter does not support use_ack.")
+        self._queue_size = queue_size
+        self._overflow_policy = overflow_policy
+        self._max_batch_events = max_batch_events
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._dropped_events = 0
+        self._failed_events = 0
+        self._close_timeout = None
+        self._sender = threading.Thread(
+            target=self._run, name="AsyncHECEventWriter", daemon=True
+        )
+        self._sender.start()
+
+    @property
+    def queued_events(self) -> int:
+        """Number of events which are queued or being written."""
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    @property
+    def dropped_events(self) -> int:
+        """Number of events discarded by the `drop_oldest` overflow policy."""
+        return self._dropped_events
+
+    @property
+    def failed_events(self) -> int:
+        """Number of events which could not be written through HEC."""
+        return self._failed_events
+
+    def write_events(
+        self,
+        events: list,
+        retries: int = HECEventWriter.WRITE_EVENT_RETRIES,
+        event_field: str = "event",
+    ):
+        """Queue events to be written to index by the sender thread.
+
+        Arguments:
+            events: List of events.
+            retries: Number of retries for writing events to index.
+            event_field: Event field.
+
+        Raises:
+            queue.Full: When the queue can not hold all the events and
+                overflow policy is `raise`.
+            RuntimeError: When the event writer is closed.
+        """
+        if not events:
+            return
+
+        events = list(events)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("AsyncHECEventWriter is closed.")
+            if (
+                self._overflow_policy == self.OVERFLOW_RAISE
+                and len(self._queue) + len(events) > self._queue_size
+            ):
+                raise queue.Full()
+
+            for event in events:
+                if len(self._queue) >= self._queue_size:
+                    if self._overflow_policy == self.OVERFLOW_DROP_OLDEST:
+                        self._queue.popleft()
+                        self._dropped_events += 1
+                    else:
+                        self._cond.notify_all()
+                        self._cond.wait_for(
+                            lambda: len(self._queue) < self._queue_size or self._closed
+                        )
+                        if self._closed:
+                            raise RuntimeError("AsyncHECEventWriter is closed.")
+                self._queue.append((event_field, retries, event))
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued event has been written or has failed.
+
+        Arguments:
+            timeout: (optional) Max seconds to wait, default is None which
+                waits forever.
+
+        Returns:
+            True if the queue was drained, False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._in_flight, timeout
+            )
+
+    def close(self, timeout: float = None) -> bool:
+        """Flush queued events and stop the sender thread.
+
+        On timeout, the sender thread keeps writing the queued events in the
+        background and closes the spool once it stops.
+
+        Arguments:
+            timeout: (optional) Max seconds to wait for queued events to be
+                written, default is None which waits forever.
+
+        Returns:
+            True if every queued event was handled, False on timeout.
+        """
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._close_timeout = timeout
+            self._cond.notify_all()
+        if flushed:
+            self._sender.join()
+        return flushed
+
+    def _run(self):
+        try:
+            self._send_queued()
+        finally:
+            # The spool is closed by the sender, it may still append
+            # batches to the spool after close timed out
+            super().close(self._close_timeout)
+
+    def _send_queued(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                items = [
+                    self._queue.popleft()
+                    for _ in range(min(len(self._queue), self._max_batch_events))
+                ]
+                self._in_flight = len(items)
+                self._cond.notify_all()
+
+            for (event_field, retries), group in itertools.groupby(
+                items, key=lambda item: item[:2]
+            ):
+                events = [item[2] for item in group]
+                try:
+                    super().write_events(events, retries, event_field)
+                except Exception:
+                    self.logger.error(
+                        "Write %d queued events through HEC failed: %s.",
+                        len(events),
+                        traceback.format_exc(),
+                    )
+                    self._failed_events += len(events)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
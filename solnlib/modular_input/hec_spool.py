@@ -0,0 +1,370 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""This module provides a disk backed spool of HEC batches which could not be
+written while HEC was unavailable."""
+
+import json
+import os
+import os.path as op
+import struct
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+__all__ = ["HECSpoolException", "HECSpool", "SpooledBatch"]
+
+
+class HECSpoolException(Exception):
+    pass
+
+
+class SpooledBatch:
+    """A batch read back from the spool."""
+
+    def __init__(
+        self, body: bytes, path: str, query: dict, channel: str, events, ack_id=None
+    ):
+        self.body = body
+        self.path = path
+        self.query = query
+        self.channel = channel
+        self.events = events
+        self.ack_id = ack_id
+
+
+class HECSpool:
+    """Append-only, segmented write-ahead spool of HEC batches.
+
+    Batches are appended to segment files under `spool_dir` and read back
+    in the order they were appended. The read position is persisted in a
+    cursor file, so batches which were already replayed are not replayed
+    again after a restart, and fully replayed segments are removed.
+
+    A spool directory is used by one process at a time, it is locked until
+    `close` is called.
+
+    Examples:
+        >>> from solnlib.modular_input import hec_spool
+        >>> spool = hec_spool.HECSpool('/opt/splunk/var/lib/splunk/modinputs/my_input/hec_spool')
+        >>> spool.append(b'{"event": "data"}', '/services/collector', events=1)
+        >>> batch = spool.peek()
+        >>> ... # write batch.body to HEC
+        >>> spool.pop()
+    """
+
+    FSYNC_ALWAYS = "always"
+    FSYNC_SEGMENT = "segment"
+    FSYNC_NEVER = "never"
+
+    SEGMENT_SUFFIX = ".seg"
+    CURSOR_FILE = "cursor"
+    LOCK_FILE = "lock"
+
+    # Record header: length of the JSON metadata, length of the body
+    _header = struct.Struct(">II")
+
+    def __init__(
+        self,
+        spool_dir: str,
+        max_bytes: int = 1024**3,
+        segment_bytes: int = 16 * 1024**2,
+        fsync: str = FSYNC_SEGMENT,
+    ):
+        """Initializes HECSpool.
+
+        Arguments:
+            spool_dir: Directory of the segment files, created if missing.
+            max_bytes: (optional) Max size of the segment files, batches
+                which do not fit are rejected by `append`, default is 1 GiB.
+            segment_bytes: (optional) Size after which a new segment file is
+                started, default is 16 MiB.
+            fsync: (optional) When appended data is fsynced: `always` after
+                every batch, `segment` when a segment file is completed or
+                `never`, default is `segment`.
+
+        Raises:
+            HECSpoolException: If the spool directory is used by another
+                spool, in this or another process.
+        """
+        if fsync not in (self.FSYNC_ALWAYS, self.FSYNC_SEGMENT, self.FSYNC_NEVER):
+            raise ValueError("Invalid fsync policy: %s." % fsync)
+
+        self._spool_dir = spool_dir
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock_file = self._acquire_dir_lock()
+
+        self._segments = sorted(
+            int(name[: -len(self.SEGMENT_SUFFIX)])
+            for name in os.listdir(spool_dir)
+            if name.endswith(self.SEGMENT_SUFFIX)
+        )
+        self._disk_bytes = 0
+        self._read_seq, self._read_offset = self._load_cursor()
+        for seq in [seq for seq in self._segments if seq < self._read_seq]:
+            self._remove_segment(seq)
+        if self._segments and self._read_seq < self._segments[0]:
+            self._read_seq, self._read_offset = self._segments[0], 0
+
+        # Never append to a segment written by a previous process, its last
+        # record may be torn.
+        self._write_seq = (self._segments[-1] + 1) if self._segments else 0
+        self._write_file = None
+        self._write_size = 0
+
+        self._disk_bytes = sum(
+            op.getsize(self._segment_path(seq)) for seq in self._segments
+        )
+        self._spooled_bytes = 0
+        self._spooled_events = 0
+        seq, offset = self._read_seq, self._read_offset
+        while True:
+            batch, size, seq, offset = self._read(seq, offset)
+            if batch is None:
+                break
+            self._spooled_bytes += len(batch.body)
+            self._spooled_events += batch.events or 0
+            offset += size
+
+    @property
+    def spooled_bytes(self) -> int:
+        """Number of body bytes of the batches waiting in the spool."""
+        return self._spooled_bytes
+
+    @property
+    def spooled_events(self) -> int:
+        """Number of events of the batches waiting in the spool."""
+        return self._spooled_events
+
+    def stats(self) -> dict:
+        """Get spool metrics.
+
+        Returns:
+            Dict with `spooled_bytes`, `spooled_events` waiting to be
+            replayed and `disk_bytes` used by the segment files.
+        """
+        with self._lock:
+            return {
+                "spooled_bytes": self._spooled_bytes,
+                "spooled_events": self._spooled_events,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def append(
+        self,
+        body: bytes,
+        path: str,
+        query: dict = None,
+        channel: str = None,
+        events: int = None,
+        ack_id: str = None,
+    ) -> bool:
+        """Append a batch to the spool.
+
+        Arguments:
+            body: Batch body.
+            path: HEC endpoint path the batch is written to.
+            query: (optional) Query string parameters of the request.
+            channel: (optional) HEC channel of the request.
+            events: (optional) Number of events in the batch.
+            ack_id: (optional) Acknowledgement ID the writer returned for
+                the batch.
+
+        Returns:
+            True if the batch was spooled, False if it does not fit in
+            `max_bytes`.
+        """
+        meta = json.dumps(
+            {
+                "path": path,
+                "query": query,
+                "channel": channel,
+                "events": events,
+                "ack_id": ack_id,
+            }
+        ).encode("utf-8")
+        record = self._header.pack(len(meta), len(body)) + meta + body
+
+        with self._lock:
+            if self._disk_bytes + len(record) > self._max_bytes:
+                return False
+
+            if self._write_file is None or self._write_size >= self._segment_bytes:
+                self._rotate()
+            self._write_file.write(record)
+            self._write_file.flush()
+            if self._fsync == self.FSYNC_ALWAYS:
+                os.fsync(self._write_file.fileno())
+            self._write_size += len(record)
+            self._disk_bytes += len(record)
+            self._spooled_bytes += len(body)
+            self._spooled_events += events or 0
+            return True
+
+    def peek(self) -> Optional[SpooledBatch]:
+        """Get the oldest batch of the spool without removing it.
+
+        Returns:
+            The oldest batch or None if the spool is empty.
+        """
+        with self._lock:
+            batch, _, self._read_seq, self._read_offset = self._read(
+                self._read_seq, self._read_offset, cleanup=True
+            )
+            return batch
+
+    def pop(self):
+        """Remove the oldest batch of the spool, usually once it has been
+        replayed."""
+        with self._lock:
+            batch, size, seq, offset = self._read(
+                self._read_seq, self._read_offset, cleanup=True
+            )
+            if batch is None:
+                return
+            self._read_seq, self._read_offset = seq, offset + size
+            self._spooled_bytes -= len(batch.body)
+            self._spooled_events -= batch.events or 0
+            self._save_cursor()
+
+    def close(self):
+        """Close the segment file being appended to and unlock the spool
+        directory."""
+        with self._lock:
+            self._close_write_file()
+            if self._lock_file is not None:
+                # closing the file releases the lock
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _acquire_dir_lock(self):
+        lock_file = open(op.join(self._spool_dir, self.LOCK_FILE), "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            raise HECSpoolException(
+                "HEC spool directory %s is used by another process." % self._spool_dir
+            )
+        return lock_file
+
+    def _read(self, seq, offset, cleanup=False):
+        """Read the record at `seq`, `offset`, moving on to the next segment
+        when the end of a completed segment is reached.
+
+        Returns:
+            Tuple of the batch (None if there is none), its record size and
+            the segment and offset it was read at.
+        """
+        if seq not in self._segments:
+            next_seqs = [s for s in self._segments if s > seq]
+            if next_seqs:
+                seq, offset = next_seqs[0], 0
+        while seq in self._segments:
+            try:
+                with open(self._segment_path(seq), "rb") as fp:
+                    fp.seek(offset)
+                    header = fp.read(self._header.size)
+                    if len(header) == self._header.size:
+                        meta_len, body_len = self._header.unpack(header)
+                        meta = fp.read(meta_len)
+                        body = fp.read(body_len)
+                        if len(meta) == meta_len and len(body) == body_len:
+                            meta = json.loads(meta)
+                            batch = SpooledBatch(
+                                body,
+                                meta["path"],
+                                meta["query"],
+                                meta["channel"],
+                                meta["events"],
+                                meta.get("ack_id"),
+                            )
+                            return batch, len(header) + meta_len + body_len, seq, offset
+            except FileNotFoundError:
+                pass
+
+            if seq == self._write_seq:
+                break
+            # A completed segment was read to its end (or its last record
+            # is torn), continue with the next one.
+            next_seqs = [s for s in self._segments if s > seq]
+            if cleanup:
+                self._remove_segment(seq)
+            if not next_seqs:
+                break
+            seq, offset = next_seqs[0], 0
+        return None, 0, seq, offset
+
+    def _rotate(self):
+        self._close_write_file()
+        if self._write_seq in self._segments:
+            self._write_seq += 1
+        self._segments.append(self._write_seq)
+        self._write_file = open(self._segment_path(self._write_seq), "ab")
+        self._write_size = 0
+        if not self._spooled_bytes and self._read_seq not in self._segments:
+            self._read_seq, self._read_offset = self._write_seq, 0
+
+    def _close_write_file(self):
+        if self._write_file is None:
+            return
+        if self._fsync != self.FSYNC_NEVER:
+            os.fsync(self._write_file.fileno())
+        self._write_file.close()
+        self._write_file = None
+
+    def _remove_segment(self, seq):
+        path = self._segment_path(seq)
+        try:
+            self._disk_bytes -= op.getsize(path)
+        except OSError:
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self._segments.remove(seq)
+
+    def _segment_path(self, seq):
+        return op.join(self._spool_dir, "%020d%s" % (seq, self.SEGMENT_SUFFIX))
+
+    def _load_cursor(self):
+        try:
+            with open(op.join(self._spool_dir, self.CURSOR_FILE)) as fp:
+                cursor = json.load(fp)
+            return cursor["segment"], cursor["offset"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        cursor_path = op.join(self._spool_dir, self.CURSOR_FILE)
+        with open(cursor_path + "_new", "w") as fp:
+            json.dump({"segment": self._read_seq, "offset": self._read_offset}, fp)
+            if self._fsync == self.FSYNC_ALWAYS:
+                fp.flush()
+                os.fsync(fp.fileno())
+        os.replace(cursor_path + "_new", cursor_path)
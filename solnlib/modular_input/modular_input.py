@@ -16,6 +16,8 @@
 """This module provides a base class of Splunk modular input."""
 
 import logging
+import os.path as op
+import re
 import sys
 import traceback
 from abc import ABCMeta, abstractmethod
@@ -32,7 +34,7 @@ from splunklib.modularinput.validation_definition import ValidationDefinition
 
 from .. import utils
 from ..orphan_process_monitor import OrphanProcessMonitor
-from . import checkpointer, event_writer
+from . import checkpointer, event_writer, hec_spool
 
 __all__ = ["ModularInputException", "ModularInput"]
 
@@ -101,12 +103,26 @@ class ModularInput(metaclass=ABCMeta):
     # Collection name of kvstore checkpointer, must be overridden if
     # use_kvstore_checkpointer is True
     kvstore_checkpointer_collection_name = None
+    # Keep checkpoints in memory and write them to kvstore in batches,
+    # default is False
+    kvstore_checkpointer_write_behind = False
     # Use hec event writer
     use_hec_event_writer = True
     # Input name of Splunk HEC, must be overridden if use_hec_event_writer
     # is True
     hec_input_name = None
     hec_global_settings_schema = False
+    # Spool batches to a directory per stanza (or per input in single
+    # instance mode) in the checkpoint dir when HEC is unavailable,
+    # default is False
+    use_hec_spool = False
+    # Write events through HEC from a background thread, default is False
+    use_async_hec_event_writer = False
+    # Coalesce events written through the classic event writer into fewer
+    # writes to stdout, default is False
+    buffer_classic_event_writer = False
+    # Max seconds to wait for buffered events to be written at exit
+    event_writer_close_timeout = 30.0
 
     def __init__(self):
         # Validate properties
@@ -193,6 +209,7 @@ class ModularInput(metaclass=ABCMeta):
                     scheme=self.server_scheme,
                     host=self.server_host,
                     port=self.server_port,
+                    write_behind=self.kvstore_checkpointer_write_behind,
                 )
             except binding.HTTPError:
                 logging.error(
@@ -224,13 +241,29 @@ class ModularInput(metaclass=ABCMeta):
         if self.use_hec_event_writer:
             hec_input_name = ":".join([self.app, self.hec_input_name])
             try:
-                return event_writer.HECEventWriter(
+                spool = None
+                if self.use_hec_spool:
+                    # splunkd runs one process per stanza which share the
+                    # checkpoint dir
+                    spool = hec_spool.HECSpool(
+                        op.join(
+                            self._checkpoint_dir,
+                            "hec_spool",
+                            re.sub(r"[^\w.-]", "_", self.config_name),
+                        )
+                    )
+                if self.use_async_hec_event_writer:
+                    writer_class = event_writer.AsyncHECEventWriter
+                else:
+                    writer_class = event_writer.HECEventWriter
+                return writer_class(
                     hec_input_name,
                     self.session_key,
                     scheme=self.server_scheme,
                     host=self.server_host,
                     port=self.server_port,
                     global_settings_schema=self.hec_global_settings_schema,
+                    spool=spool,
                 )
             except binding.HTTPError:
                 logging.error(
@@ -238,7 +271,9 @@ class ModularInput(metaclass=ABCMeta):
                 )
                 raise
         else:
-            return event_writer.ClassicEventWriter()
+            return event_writer.ClassicEventWriter(
+                buffered=self.buffer_classic_event_writer
+            )
 
     def _update_metadata(self, metadata):
         self.server_host_name = metadata["server_host"]
@@ -476,6 +511,19 @@ class ModularInput(metaclass=ABCMeta):
                 # Stop orphan monitor if any
                 if self._orphan_monitor:
                     self._orphan_monitor.stop()
+                # Write out events buffered by the event writer if any
+                if self._event_writer:
+                    self._event_writer.close(timeout=self.event_writer_close_timeout)
+                # Write out checkpoints kept in memory by the checkpointer
+                if self._checkpointer:
+                    try:
+                        self._checkpointer.close()
+                    except Exception:
+                        logging.error(
+                            "Modular input: %s close checkpointer failed: %s.",
+                            self.name,
+                            traceback.format_exc(),
+                        )
 
         elif str(sys.argv[1]).lower() == "--scheme":
             sys.stdout.write(self._do_scheme())
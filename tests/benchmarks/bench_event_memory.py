@@ -0,0 +1,91 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Memory footprint of buffered events.
+
+Compares `HECEvent` with an equivalent `__dict__` based event which
+formats the time when it is created, like events did before they used
+`__slots__`.
+
+Usage: poetry run python tests/benchmarks/bench_event_memory.py [events]
+"""
+
+import sys
+import tracemalloc
+
+from solnlib.modular_input import HECEvent
+
+
+class DictEvent:
+    def __init__(
+        self,
+        data,
+        time=None,
+        index=None,
+        host=None,
+        source=None,
+        sourcetype=None,
+        fields=None,
+        stanza=None,
+        unbroken=False,
+        done=False,
+    ):
+        self._data = data
+        self._time = "%.3f" % time if time else None
+        self._index = index
+        self._host = host
+        self._source = source
+        self._sourcetype = sourcetype
+        if fields:
+            self._fields = fields
+        self._stanza = stanza
+        self._unbroken = unbroken
+        self._done = done
+
+
+def measure(event_class, count, data):
+    tracemalloc.start()
+    events = [
+        event_class(
+            data,
+            time=1372274622.493 + i,
+            index="main",
+            host="localhost",
+            source="bench",
+            sourcetype="bench:json",
+        )
+        for i in range(count)
+    ]
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del events
+    return size, peak
+
+
+def main(count):
+    # the payload is shared, only the event objects are measured
+    data = {"id": 1, "user": "admin", "status": 200}
+    print("%d events" % count)
+    print("%-12s%16s%16s%12s" % ("event", "total MiB", "peak MiB", "bytes/event"))
+    for name, event_class in (("__dict__", DictEvent), ("HECEvent", HECEvent)):
+        size, peak = measure(event_class, count, data)
+        print(
+            "%-12s%16.1f%16.1f%12.1f"
+            % (name, size / 1024**2, peak / 1024**2, size / count)
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,84 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Benchmark of HEC envelope templating against serializing every event.
+
+Usage: poetry run python tests/benchmarks/bench_hec_envelope.py [events]
+"""
+
+import sys
+import time
+
+from solnlib.modular_input import HECEvent
+
+
+def per_event(events):
+    return list(HECEvent.join_batches(event._to_hec("event") for event in events))
+
+
+def enveloped(events):
+    return list(HECEvent.iter_batches(events))
+
+
+def make_events(count, make_data, fields):
+    return [
+        HECEvent(
+            data=make_data(i),
+            time=1372274622.493 + i,
+            index="main",
+            host="localhost",
+            source="bench",
+            sourcetype="bench:json",
+            fields=fields,
+        )
+        for i in range(count)
+    ]
+
+
+def best_of(func, count, make_data, fields, repeat=3):
+    best = None
+    for _ in range(repeat):
+        # events cache their serialized form, use new ones for every run
+        events = make_events(count, make_data, fields)
+        start = time.perf_counter()
+        func(events)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(count):
+    fields = {"account": "603514901691", "region": "us-west-1"}
+    shapes = {
+        "string": lambda i: "GET /index.html 200 %d" % i,
+        "dict": lambda i: {"id": i, "user": "admin", "status": 200},
+    }
+    print("%d events per run, best of 3, microseconds per event" % count)
+    print("%-8s%-8s%12s%12s" % ("data", "fields", "per event", "enveloped"))
+    for shape, make_data in shapes.items():
+        for with_fields in (False, True):
+            event_fields = fields if with_fields else None
+            assert per_event(make_events(100, make_data, event_fields)) == enveloped(
+                make_events(100, make_data, event_fields)
+            )
+            row = "%-8s%-8s" % (shape, with_fields)
+            for func in (per_event, enveloped):
+                best = best_of(func, count, make_data, event_fields)
+                row += "%12.2f" % (best / count * 1e6)
+            print(row)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
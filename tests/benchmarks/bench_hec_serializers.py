@@ -0,0 +1,79 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Micro-benchmark of the JSON serializers of HEC events.
+
+Usage: poetry run python tests/benchmarks/bench_hec_serializers.py [events]
+"""
+
+import sys
+import timeit
+
+from solnlib.modular_input import HECEvent, event
+
+SHAPES = {
+    "short string": lambda i: "GET /index.html 200 %d" % i,
+    "non-ascii string": lambda i: "utf-8 \u2603 \u4e2d\u6587 event %d" % i,
+    "flat dict": lambda i: {"id": i, "user": "admin", "status": 200, "ok": True},
+    "nested dict": lambda i: {
+        "id": i,
+        "request": {"method": "GET", "path": "/api/v1/items", "size": 1024.5},
+        "tags": ["a", "b", "c"],
+        "response": {"status": 200, "headers": {"content-type": "application/json"}},
+    },
+}
+
+
+def clear_cache(events):
+    for e in events:
+        e._serialized = None
+
+
+def main(count):
+    print("%d events per run, best of 3, seconds" % count)
+    names = sorted(event._json_serializers)
+    print("%-18s" % "shape" + "".join("%12s" % name for name in names))
+    for shape, make_data in SHAPES.items():
+        events = [
+            HECEvent(
+                data=make_data(i),
+                time=1372274622.493 + i,
+                index="main",
+                host="localhost",
+                source="bench",
+                sourcetype="bench:json",
+            )
+            for i in range(count)
+        ]
+        row = "%-18s" % shape
+        for name in names:
+            dumps = event.get_json_serializer(name)
+            best = min(
+                timeit.repeat(
+                    lambda: sum(
+                        len(b) for b in HECEvent.iter_batches(events, serializer=dumps)
+                    ),
+                    # events cache their serialized form
+                    setup=lambda: clear_cache(events),
+                    repeat=3,
+                    number=1,
+                )
+            )
+            row += "%12.4f" % best
+        print(row)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
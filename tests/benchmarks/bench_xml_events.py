@@ -0,0 +1,107 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Benchmark of the streaming XML serialization of events against building
+an ElementTree of the whole batch, like `XMLEvent.format_events` did.
+
+Usage: poetry run python tests/benchmarks/bench_xml_events.py [events]
+"""
+
+import io
+import json
+import sys
+import time
+import tracemalloc
+from xml.etree import ElementTree as ET  # nosemgrep
+
+import defusedxml.ElementTree as defused_et
+
+from solnlib.modular_input import XMLEvent
+
+
+def element_tree(events, out):
+    stream = ET.Element("stream")
+    for e in events:
+        event = ET.SubElement(stream, "event")
+        if e._stanza:
+            event.set("stanza", e._stanza)
+        if e._time is not None:
+            ET.SubElement(event, "time").text = e._time_text()
+        for node in ("index", "host", "source", "sourcetype"):
+            if getattr(e, "_" + node):
+                ET.SubElement(event, node).text = getattr(e, "_" + node)
+        data = e._data if isinstance(e._data, str) else json.dumps(e._data)
+        ET.SubElement(event, "data").text = data
+    out.write(
+        defused_et.tostring(stream, encoding="utf-8", method="xml").decode("utf-8")
+    )
+
+
+def streaming(events, out):
+    for chunk in XMLEvent.iter_chunks(events):
+        out.write(chunk.decode("utf-8"))
+
+
+class NullOutput:
+    def write(self, data):
+        pass
+
+
+def make_events(count):
+    return [
+        XMLEvent(
+            {"id": i, "message": "GET /index.html?a=1&b=2 <200>", "user": "admin"},
+            time=1372274622.493 + i,
+            index="main",
+            host="localhost",
+            source="bench",
+            sourcetype="bench:json",
+            stanza="bench://input",
+        )
+        for i in range(count)
+    ]
+
+
+def main(count):
+    outputs = []
+    for func in (element_tree, streaming):
+        out = io.StringIO()
+        func(make_events(100), out)
+        outputs.append(out.getvalue())
+    assert outputs[0] == outputs[1]
+
+    print("%d events, best of 3" % count)
+    print("%-14s%12s%16s" % ("", "seconds", "peak MiB"))
+    for func in (element_tree, streaming):
+        best = None
+        for _ in range(3):
+            # events cache their serialized form, use new ones for every run
+            events = make_events(count)
+            start = time.perf_counter()
+            func(events, NullOutput())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        events = make_events(count)
+        tracemalloc.start()
+        func(events, NullOutput())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # streaming peak includes the serialized form cached by the events
+        print("%-14s%12.3f%16.1f" % (func.__name__, best, peak / 1024**2))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -47,6 +47,8 @@ class FakeKVStoreCollectionData:
 
     def __init__(self, documents=None):
         self._documents = {}
+        self.batch_save_calls = []
+        self.query_calls = []
         if documents is not None:
             for document in documents:
                 self._documents[document["_key"]] = {
@@ -61,6 +63,7 @@ class FakeKVStoreCollectionData:
         return True if _id in self._documents else False
 
     def batch_save(self, *documents):
+        self.batch_save_calls.append(documents)
         for document in documents:
             self._documents[document["_key"]] = document
 
@@ -85,3 +88,39 @@ class FakeKVStoreCollectionData:
                     status=404,
                 )
             )
+
+    def delete(self, query=None):
+        query = json.loads(query) if query else {}
+        for document in list(self._documents.values()):
+            if self._matches(document, query):
+                del self._documents[document["_key"]]
+
+    def query(self, query=None, sort=None, fields=None, limit=None, skip=0):
+        """Supports queries with `$or`, `$gt`, `$gte`, `$lt` and `$lte`."""
+        self.query_calls.append(query)
+        documents = [
+            document
+            for _, document in sorted(self._documents.items())
+            if self._matches(document, query or {})
+        ]
+        return documents[skip : skip + limit if limit else None]
+
+    @classmethod
+    def _matches(cls, document, query):
+        for field, condition in query.items():
+            if field == "$or":
+                if not any(cls._matches(document, q) for q in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = document[field]
+                if "$gt" in condition and not value > condition["$gt"]:
+                    return False
+                if "$gte" in condition and not value >= condition["$gte"]:
+                    return False
+                if "$lt" in condition and not value < condition["$lt"]:
+                    return False
+                if "$lte" in condition and not value <= condition["$lte"]:
+                    return False
+            elif document[field] != condition:
+                return False
+        return True
@@ -21,7 +21,7 @@ import sys
 
 import common
 
-from solnlib.modular_input import Argument, checkpointer
+from solnlib.modular_input import Argument, checkpointer, event_writer
 from solnlib.modular_input.modular_input import ModularInput
 
 checkpoint_dir = op.join(op.dirname(op.abspath(__file__)), ".checkpoint_dir")
@@ -243,3 +243,124 @@ def test_modular_input_create_checkpointer(monkeypatch):
     checkpoint = md._create_checkpointer()
     assert collections[0] == "UnittestApp:config_test:kv_store_checkpointer_test"
     assert isinstance(checkpoint, checkpointer.KVStoreCheckpointer)
+
+
+def test_modular_input_closes_checkpointer(monkeypatch):
+    closed = []
+    monkeypatch.setattr(
+        checkpointer.FileCheckpointer, "close", lambda self: closed.append(self)
+    )
+    monkeypatch.setattr(
+        CustomModularInput, "do_run", lambda self, inputs: self.checkpointer
+    )
+
+    md = CustomModularInput()
+    monkeypatch.setattr(sys, "argv", [None])
+    monkeypatch.setattr(
+        md,
+        "get_input_definition",
+        lambda: {
+            "metadata": {
+                "server_host": "localhost",
+                "server_uri": "https://127.0.0.1:8089",
+                "session_key": common.SESSION_KEY,
+                "checkpoint_dir": checkpoint_dir,
+            },
+            "inputs": {"unittest_app_collector://test1": {}},
+        },
+    )
+    assert md.execute() == 0
+    assert closed == [md._checkpointer]
+
+
+def test_modular_input_create_async_event_writer(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    closed = []
+    close = event_writer.AsyncHECEventWriter.close
+
+    def mock_close(self, timeout=None):
+        closed.append(timeout)
+        return close(self, timeout)
+
+    monkeypatch.setattr(
+        event_writer.HECEventWriter, "_get_hec_config", mock_get_hec_config
+    )
+    monkeypatch.setattr(event_writer.AsyncHECEventWriter, "close", mock_close)
+    monkeypatch.setattr(CustomModularInput, "use_hec_event_writer", True)
+    monkeypatch.setattr(CustomModularInput, "hec_input_name", "unittest")
+    monkeypatch.setattr(CustomModularInput, "use_async_hec_event_writer", True)
+    monkeypatch.setattr(CustomModularInput, "event_writer_close_timeout", 5)
+    monkeypatch.setattr(CustomModularInput, "do_run", lambda self, inputs: None)
+
+    md = CustomModularInput()
+    md.session_key = common.SESSION_KEY
+    md.server_scheme, md.server_host, md.server_port = "https", "localhost", 8089
+
+    ew = md.event_writer
+    assert isinstance(ew, event_writer.AsyncHECEventWriter)
+
+    monkeypatch.setattr(sys, "argv", [None])
+    monkeypatch.setattr(
+        md,
+        "get_input_definition",
+        lambda: {
+            "metadata": {
+                "server_host": "localhost",
+                "server_uri": "https://127.0.0.1:8089",
+                "session_key": common.SESSION_KEY,
+                "checkpoint_dir": checkpoint_dir,
+            },
+            "inputs": {"unittest_app_collector://test1": {}},
+        },
+    )
+    assert md.execute() == 0
+    assert closed == [5]
+
+
+def test_modular_input_buffered_classic_event_writer(monkeypatch):
+    monkeypatch.setattr(CustomModularInput, "use_hec_event_writer", False)
+    monkeypatch.setattr(CustomModularInput, "buffer_classic_event_writer", True)
+
+    md = CustomModularInput()
+    ew = md.event_writer
+    assert isinstance(ew, event_writer.ClassicEventWriter)
+    assert ew._buffered
+    ew.close()
+
+
+def test_modular_input_hec_spool_per_stanza(monkeypatch, tmp_path):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    monkeypatch.setattr(
+        event_writer.HECEventWriter, "_get_hec_config", mock_get_hec_config
+    )
+    monkeypatch.setattr(CustomModularInput, "use_hec_event_writer", True)
+    monkeypatch.setattr(CustomModularInput, "hec_input_name", "unittest")
+    monkeypatch.setattr(CustomModularInput, "use_hec_spool", True)
+
+    writers = []
+    for stanza in ["unittest_app_collector://test1", "unittest_app_collector://test2"]:
+        md = CustomModularInput()
+        md.session_key = common.SESSION_KEY
+        md.server_scheme, md.server_host, md.server_port = "https", "localhost", 8089
+        md._checkpoint_dir = str(tmp_path)
+        md.config_name = stanza
+        writers.append(md.event_writer)
+
+    assert sorted(os.listdir(op.join(str(tmp_path), "hec_spool"))) == [
+        "unittest_app_collector___test1",
+        "unittest_app_collector___test2",
+    ]
+    for ew in writers:
+        ew.close()
@@ -0,0 +1,327 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+import json
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pytest
+from splunklib import binding
+
+from solnlib.modular_input import (
+    AsyncKVStoreCheckpointer,
+    AsyncSQLiteCheckpointer,
+    SQLiteCheckpointer,
+)
+from solnlib.modular_input import checkpointer
+
+COLLECTIONS = "/servicesNS/nobody/Splunk_TA_test/storage/collections"
+
+
+class FakeSplunkd:
+    """KV Store endpoints of splunkd, answered over HTTP/1.1."""
+
+    def __init__(self):
+        self.collections = {}
+        self.requests = []
+        self.fail = 0
+        self.stall = False
+        self.connections = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode().split(" ")
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode()
+                    if line == "\r\n":
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers["content-length"]))
+                assert headers["authorization"] == "Splunk session_key"
+
+                self._concurrent += 1
+                self.max_concurrent = max(self.max_concurrent, self._concurrent)
+                # Let concurrent requests overlap
+                await asyncio.sleep(0.5 if self.stall else 0.01)
+                self._concurrent -= 1
+                status, data = self._handle(method, target, body)
+                data = json.dumps(data).encode()
+                if status == 200 and len(self.requests) % 2:
+                    # Both framings of the body
+                    chunked = b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data)
+                    head = b"Transfer-Encoding: chunked\r\n"
+                    writer.write(b"HTTP/1.1 200 OK\r\n" + head + b"\r\n" + chunked)
+                else:
+                    writer.write(
+                        b"HTTP/1.1 %d Status\r\nContent-Length: %d\r\n\r\n%s"
+                        % (status, len(data), data)
+                    )
+                await writer.drain()
+        except ConnectionError:
+            # closed by the client
+            pass
+        finally:
+            writer.close()
+
+    def _handle(self, method, target, body):
+        url = urlsplit(target)
+        path = unquote(url.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests.append((method, path))
+        if self.fail:
+            self.fail -= 1
+            return 503, {"messages": [{"text": "busy"}]}
+
+        if path.startswith(COLLECTIONS + "/config"):
+            if method == "POST":
+                name = parse_qs(body.decode())["name"][0]
+                self.collections[name] = {}
+                return 201, {}
+            name = path.rsplit("/", 1)[1]
+            return (200, {}) if name in self.collections else (404, {})
+
+        name, _, rest = path[len(COLLECTIONS + "/data/") :].partition("/")
+        records = self.collections[name]
+        if rest == "batch_save":
+            for record in json.loads(body):
+                records[record["_key"]] = record
+            return 200, [r["_key"] for r in json.loads(body)]
+        if method == "DELETE":
+            if rest not in records:
+                return 404, {}
+            del records[rest]
+            return 200, {}
+        if rest:
+            return (200, records[rest]) if rest in records else (404, {})
+        kv_query = json.loads(query["query"])
+        if "$or" in kv_query:
+            keys = [q["_key"] for q in kv_query["$or"]]
+            return 200, [records[k] for k in keys if k in records]
+        bounds = kv_query["_key"]
+        keys = sorted(k for k in records if bounds["$gt"] < k < bounds["$lt"])
+        skip = int(query.get("skip", 0))
+        return 200, [records[k] for k in keys[skip : skip + int(query["limit"])]]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _start(**kwargs):
+    splunkd = FakeSplunkd()
+    port = await splunkd.start()
+    ck = AsyncKVStoreCheckpointer(
+        "test:collection",
+        "session_key",
+        "Splunk_TA_test",
+        scheme="http",
+        host="127.0.0.1",
+        port=port,
+        **kwargs,
+    )
+    return splunkd, ck
+
+
+def test_async_kvstore_checkpointer():
+    async def main():
+        splunkd, ck = await _start()
+        assert await ck.get("missing") is None
+        assert "test_collection" in splunkd.collections
+
+        await ck.update("key_1", {"offset": 1})
+        assert await ck.get("key_1") == {"offset": 1}
+        await ck.batch_update(
+            [{"_key": "key_2", "state": 2}, {"_key": "key_3", "state": "\u2603"}]
+        )
+        assert await ck.get_many(["key_1", "key_3", "missing"]) == {
+            "key_1": {"offset": 1},
+            "key_3": "\u2603",
+            "missing": None,
+        }
+
+        await ck.delete("key_2")
+        await ck.delete("key_2")
+        assert await ck.get("key_2") is None
+        await ck.close()
+        # Connections are kept alive between requests
+        assert splunkd.connections == 1
+        await splunkd.stop()
+
+    run(main())
+
+
+def test_async_kvstore_checkpointer_coalesced_writes():
+    async def main():
+        splunkd, ck = await _start(codec="json_zlib")
+        await ck.get("key_0")
+        await asyncio.gather(*(ck.update("key_%d" % i, i) for i in range(2000)))
+        saves = [r for r in splunkd.requests if r[1].endswith("batch_save")]
+        # max_documents_per_batch_save documents per request
+        assert len(saves) == 2
+
+        records = splunkd.collections["test_collection"]
+        assert len(records) == 2000
+        assert records["key_7"]["state"].startswith("$codec:json_zlib$")
+        # Readable by KVStoreCheckpointer
+        assert checkpointer._decode_state(records["key_7"]["state"]) == 7
+
+        # Updates issued while a write is in progress are written together
+        first = asyncio.ensure_future(ck.update("key_0", "first"))
+        await asyncio.sleep(0.005)
+        assert await ck.get("key_0") == "first"
+        await asyncio.gather(
+            first, *(ck.update("key_0", "v%d" % i) for i in range(100))
+        )
+        saves = [r for r in splunkd.requests if r[1].endswith("batch_save")]
+        assert len(saves) == 4
+        assert await ck.get("key_0") == "v99"
+        await ck.close()
+        await splunkd.stop()
+
+    run(main())
+
+
+def test_async_kvstore_checkpointer_get_many():
+    async def main():
+        splunkd, ck = await _start(max_connections=4)
+        ck.query_keys = 10
+        await ck.batch_update({"_key": "key_%d" % i, "state": i} for i in range(100))
+
+        splunkd.requests.clear()
+        states = await ck.get_many("key_%d" % i for i in range(105))
+        assert states["key_42"] == 42
+        assert states["key_104"] is None
+        assert len(splunkd.requests) == 11
+        assert splunkd.max_concurrent == 4
+        await ck.close()
+        await splunkd.stop()
+
+    run(main())
+
+
+def test_async_kvstore_checkpointer_retry(monkeypatch):
+    async def no_sleep(seconds):
+        pass
+
+    async def main():
+        splunkd, ck = await _start()
+        monkeypatch.setattr(asyncio, "sleep", no_sleep)
+        await ck.get("key_1")
+
+        splunkd.fail = 2
+        await ck.update("key_1", 1)
+        assert await ck.get("key_1") == 1
+
+        splunkd.fail = 4
+        with pytest.raises(binding.HTTPError) as e:
+            await ck.update("key_1", 2)
+        assert e.value.status == 503
+        await ck.close()
+        await splunkd.stop()
+
+    run(main())
+
+
+def test_async_kvstore_checkpointer_timeout():
+    async def main():
+        splunkd, ck = await _start(timeout=0.2)
+        await ck.get("key_1")
+
+        splunkd.stall = True
+        with pytest.raises(asyncio.TimeoutError):
+            await ck.update("key_1", 1)
+        splunkd.stall = False
+        # the stalled connection is not reused
+        await ck.update("key_1", 2)
+        assert await ck.get("key_1") == 2
+        assert splunkd.connections == 2
+        await ck.close()
+        await splunkd.stop()
+
+    run(main())
+
+
+def test_async_kvstore_checkpointer_delta_states():
+    def delta(seq, items):
+        return {
+            "_key": checkpointer._delta_key("seen", seq),
+            "state": checkpointer._encode_state({"$delta": "set", "data": items}),
+        }
+
+    def base(seq, items):
+        return {
+            "_key": "seen",
+            "state": checkpointer._encode_state(
+                {"$delta": "set", "base": items, "seq": seq}
+            ),
+        }
+
+    async def main():
+        splunkd, ck = await _start()
+        ck.query_page_size = 1
+        await ck.get("seen")
+        records = splunkd.collections["test_collection"]
+        # deltas 1 and 2 are merged into the base, 3 and 4 are not
+        for record in [
+            base(2, ["id_1", "id_2"]),
+            delta(2, ["id_2"]),
+            delta(3, ["id_3"]),
+            delta(4, ["id_4", "id_1"]),
+        ]:
+            records[record["_key"]] = record
+
+        expected = {"id_1", "id_2", "id_3", "id_4"}
+        assert await ck.get("seen") == expected
+        # a base read before a compaction reads the new base
+        assert await ck._decode_merged(base(0, [])) == expected
+        await ck.close()
+        await splunkd.stop()
+
+    run(main())
+
+
+def test_async_sqlite_checkpointer(tmp_path):
+    async def main():
+        ck = AsyncSQLiteCheckpointer(str(tmp_path))
+        await asyncio.gather(*(ck.update("key_%d" % i, i) for i in range(100)))
+        assert await ck.get("key_7") == 7
+        assert await ck.get_many(["key_1", "missing"]) == {"key_1": 1, "missing": None}
+        await ck.delete("key_1")
+        assert await ck.get("key_1") is None
+        await ck.close()
+
+    run(main())
+    ck = SQLiteCheckpointer(str(tmp_path))
+    assert ck.get("key_99") == 99
+    ck.close()
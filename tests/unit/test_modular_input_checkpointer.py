@@ -16,9 +16,13 @@
 
 import json
 import os
+import sqlite3
 import tempfile
+import threading
+import time
 from unittest import mock
 
+import common
 import pytest
 from fakes.fake_kv_store_collection_data import (
     FakeKVStoreCollectionData,
@@ -26,10 +30,12 @@ from fakes.fake_kv_store_collection_data import (
 )
 from splunklib import client
 
+from solnlib.modular_input import checkpointer
 from solnlib.modular_input import (
     CheckpointerException,
     FileCheckpointer,
     KVStoreCheckpointer,
+    SQLiteCheckpointer,
 )
 
 
@@ -146,6 +152,500 @@ def test_kvstore_checkpointer_batch_update(mock_get_collection_data):
     assert 2 == checkpoint.get("key_with_integer_data")
 
 
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_write_behind(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", write_behind=True, flush_interval=60
+    )
+    for i in range(10):
+        checkpoint.update("key_1", {"offset": i})
+    checkpoint.batch_update([{"_key": "key_2", "state": 2}])
+    assert fake.batch_save_calls == []
+    # served from memory
+    assert checkpoint.get("key_1") == {"offset": 9}
+
+    checkpoint.flush()
+    assert len(fake.batch_save_calls) == 1
+    assert sorted(record["_key"] for record in fake.batch_save_calls[0]) == [
+        "key_1",
+        "key_2",
+    ]
+    assert json.loads(fake.get("key_1")["state"]) == {"offset": 9}
+
+    checkpoint.flush()
+    assert len(fake.batch_save_calls) == 1
+
+    checkpoint.update("key_3", 3)
+    checkpoint.close()
+    assert len(fake.batch_save_calls) == 2
+    assert json.loads(fake.get("key_3")["state"]) == 3
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_write_behind_thresholds(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name",
+        "session_key",
+        "app",
+        write_behind=True,
+        flush_interval=60,
+        flush_count=3,
+    )
+    for i in range(7):
+        checkpoint.update("key_%d" % i, i)
+    assert [len(records) for records in fake.batch_save_calls] == [3, 3]
+    checkpoint.close()
+
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", write_behind=True, flush_interval=0.05
+    )
+    checkpoint.update("key_1", 1)
+    deadline = time.time() + 5
+    while not fake.batch_save_calls and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(fake.batch_save_calls) == 1
+    checkpoint.close()
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_write_behind_delete(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData([{"_key": "key_1", "state": 1}])
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", write_behind=True, flush_interval=60
+    )
+    checkpoint.update("key_1", 2)
+    checkpoint.delete("key_1")
+    assert checkpoint.get("key_1") is None
+    checkpoint.close()
+    assert fake.batch_save_calls == []
+    assert not fake.id_exists("key_1")
+
+
+@mock.patch("solnlib.utils.time.sleep")
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_write_behind_flush_error(
+    mock_get_collection_data, mock_sleep
+):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", write_behind=True, flush_interval=60
+    )
+    checkpoint.update("key_1", 1)
+    with mock.patch.object(
+        fake,
+        "batch_save",
+        side_effect=client.HTTPError(common.make_response_record(b"", status=503)),
+    ):
+        with pytest.raises(client.HTTPError):
+            checkpoint.flush()
+    # kept for the next flush
+    checkpoint.close()
+    assert json.loads(fake.get("key_1")["state"]) == 1
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_get_many(mock_get_collection_data):
+    documents = [{"_key": "key_%d" % i, "state": i} for i in range(5)]
+    fake = FakeKVStoreCollectionData(documents)
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer("collection_name", "session_key", "app")
+    checkpoint.query_keys = 2
+
+    states = checkpoint.get_many(["key_0", "key_1", "key_4", "key_9"])
+    assert states == {"key_0": 0, "key_1": 1, "key_4": 4, "key_9": None}
+    assert len(fake.query_calls) == 2
+
+    # served from the cache
+    with mock.patch.object(fake, "query_by_id", side_effect=AssertionError):
+        assert checkpoint.get("key_4") == 4
+        assert checkpoint.get("key_9") is None
+    assert checkpoint.get_many(["key_0", "key_2"]) == {"key_0": 0, "key_2": 2}
+    assert len(fake.query_calls) == 3
+
+    checkpoint.update("key_0", "updated")
+    assert checkpoint.get("key_0") == "updated"
+    checkpoint.delete("key_1")
+    assert checkpoint.get_many(["key_1"]) == {"key_1": None}
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_preload(mock_get_collection_data):
+    documents = [{"_key": "input_%d" % i, "state": i} for i in range(5)]
+    documents.append({"_key": "other", "state": "other"})
+    fake = FakeKVStoreCollectionData(documents)
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer("collection_name", "session_key", "app")
+    checkpoint.query_page_size = 2
+
+    assert checkpoint.preload("input_") == 5
+    assert len(fake.query_calls) == 3
+    with mock.patch.object(fake, "query_by_id", side_effect=AssertionError):
+        assert checkpoint.get("input_3") == 3
+        # no document under a preloaded prefix
+        assert checkpoint.get("input_9") is None
+        checkpoint.update("input_9", 9)
+        assert checkpoint.get("input_9") == 9
+    assert checkpoint.get("other") == "other"
+
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", cache_ttl=0
+    )
+    assert checkpoint.preload() == 7
+    fake.batch_save({"_key": "input_0", "state": json.dumps("changed")})
+    # expired
+    assert checkpoint.get("input_0") == "changed"
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_preload_slow_pages(mock_get_collection_data):
+    documents = [{"_key": "input_%d" % i, "state": i} for i in range(4)]
+    fake = FakeKVStoreCollectionData(documents)
+    mock_get_collection_data.return_value = fake
+    now = [1000.0]
+    query = fake.query
+
+    def slow_query(**kwargs):
+        now[0] += 5
+        return query(**kwargs)
+
+    with mock.patch.object(checkpointer.time, "time", lambda: now[0]):
+        checkpoint = KVStoreCheckpointer(
+            "collection_name", "session_key", "app", cache_ttl=8
+        )
+        checkpoint.query_page_size = 2
+        with mock.patch.object(fake, "query", side_effect=slow_query):
+            checkpoint.preload("input_")
+        # the documents of the first page expired with the prefix
+        assert checkpoint.get("input_0") == 0
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_batch_update_chunks(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", max_documents_per_batch_save=2
+    )
+    states = [{"_key": "key_%d" % i, "state": {"offset": i}} for i in range(5)]
+    checkpoint.batch_update(states)
+
+    assert [len(records) for records in fake.batch_save_calls] == [2, 2, 1]
+    assert checkpoint.get("key_4") == {"offset": 4}
+    # the documents of the caller are not modified
+    assert states[0] == {"_key": "key_0", "state": {"offset": 0}}
+
+
+@mock.patch("solnlib.conf_manager.ConfManager")
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_batch_update_limit_from_limits_conf(
+    mock_get_collection_data, mock_conf_manager
+):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    limits = mock_conf_manager.return_value.get_conf.return_value
+    limits.get.return_value = {"max_documents_per_batch_save": "3"}
+    checkpoint = KVStoreCheckpointer("collection_name", "session_key", "app")
+
+    checkpoint.batch_update([{"_key": "key_%d" % i, "state": i} for i in range(7)])
+    checkpoint.batch_update([{"_key": "key_%d" % i, "state": i} for i in range(2)])
+
+    assert [len(records) for records in fake.batch_save_calls] == [3, 3, 1, 2]
+    mock_conf_manager.return_value.get_conf.assert_called_once_with("limits")
+    limits.get.assert_called_once_with("kvstore")
+
+
+@mock.patch("solnlib.utils.time.sleep")
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_batch_update_retries_chunks(
+    mock_get_collection_data, mock_sleep
+):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name",
+        "session_key",
+        "app",
+        max_documents_per_batch_save=2,
+        batch_save_workers=3,
+    )
+    batch_save = fake.batch_save
+    failed = []
+
+    def flaky_batch_save(*documents):
+        if documents[0]["_key"] == "key_2" and not failed:
+            failed.append(documents)
+            raise client.HTTPError(common.make_response_record(b"", status=503))
+        batch_save(*documents)
+
+    fake.batch_save = flaky_batch_save
+    checkpoint.batch_update([{"_key": "key_%d" % i, "state": i} for i in range(6)])
+
+    # only the chunk which failed is saved again
+    assert len(failed) == 1
+    assert sorted(records[0]["_key"] for records in fake.batch_save_calls) == [
+        "key_0",
+        "key_2",
+        "key_4",
+    ]
+    assert all(checkpoint.get("key_%d" % i) == i for i in range(6))
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_update_if(mock_get_collection_data, write_behind):
+    fake = FakeKVStoreCollectionData([{"_key": "key_1", "state": "content"}])
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", write_behind=write_behind
+    )
+    assert checkpoint.get_with_version("key_1") == ("content", 0)
+    assert checkpoint.get_with_version("key_2") == (None, 0)
+
+    assert checkpoint.update_if("key_1", 0, "updated")
+    assert checkpoint.get_with_version("key_1") == ("updated", 1)
+    # another worker updated the key
+    assert not checkpoint.update_if("key_1", 0, "stale")
+    assert checkpoint.get("key_1") == "updated"
+    assert checkpoint.update_if("key_2", 0, "created")
+
+    checkpoint.close()
+    assert fake.get("key_1")["version"] == 1
+    assert fake.get("key_2")["version"] == 1
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_update_increments_version(
+    mock_get_collection_data, write_behind
+):
+    fake = FakeKVStoreCollectionData()
+    fake.batch_save({"_key": "key_1", "state": json.dumps("content"), "version": 3})
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", write_behind=write_behind
+    )
+    state, version = checkpoint.get_with_version("key_1")
+    assert version == 3
+    # another caller updated the key between the read and update_if
+    checkpoint.update("key_1", "other")
+    assert not checkpoint.update_if("key_1", version, "stale")
+    assert checkpoint.get_with_version("key_1") == ("other", 4)
+
+    checkpoint.batch_update(
+        [{"_key": "key_1", "state": "batch"}, {"_key": "key_2", "state": "new"}]
+    )
+    assert checkpoint.get_with_version("key_1") == ("batch", 5)
+    assert checkpoint.get_with_version("key_2") == ("new", 1)
+    checkpoint.close()
+    assert fake.get("key_1")["version"] == 5
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_update_if_key_locks(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer("collection_name", "session_key", "app")
+    entered = threading.Event()
+    release = threading.Event()
+    query_by_id = fake.query_by_id
+
+    def slow_query_by_id(key):
+        if key == "slow":
+            entered.set()
+            release.wait(10)
+        return query_by_id(key)
+
+    with mock.patch.object(fake, "query_by_id", side_effect=slow_query_by_id):
+        thread = threading.Thread(target=checkpoint.update_if, args=("slow", 0, 1))
+        thread.start()
+        assert entered.wait(10)
+        # the lock of another key is free
+        assert checkpoint.update_if("fast", 0, 1)
+        release.set()
+        thread.join()
+    assert checkpoint.get_with_version("slow") == (1, 1)
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_update_if_threads(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer("collection_name", "session_key", "app")
+
+    def increment():
+        for _ in range(20):
+            while True:
+                count, version = checkpoint.get_with_version("counter")
+                if checkpoint.update_if("counter", version, (count or 0) + 1):
+                    break
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert checkpoint.get_with_version("counter") == (80, 80)
+
+
+@pytest.mark.parametrize("codec", ["json", "json_zlib", "msgpack"])
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_codec(mock_get_collection_data, codec):
+    if codec == "msgpack":
+        pytest.importorskip("msgpack")
+    fake = FakeKVStoreCollectionData([{"_key": "old", "state": {"ids": [1, 2]}}])
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", codec=codec
+    )
+    state = {"ids": ["id_%d" % i for i in range(1000)], "text": "\u2603"}
+    checkpoint.update("key_1", state)
+    checkpoint.batch_update([{"_key": "key_2", "state": state}])
+
+    stored = fake.get("key_1")["state"]
+    if codec == "json":
+        assert json.loads(stored) == state
+    else:
+        assert stored.startswith("$codec:%s$" % codec)
+        assert len(stored) < len(json.dumps(state))
+    assert checkpoint.get("key_1") == state
+    assert checkpoint.get("key_2") == state
+    # written before the codec was changed
+    assert checkpoint.get("old") == {"ids": [1, 2]}
+    # read whatever the codec of the reader is
+    reader = KVStoreCheckpointer("collection_name", "session_key", "app")
+    assert reader.get("key_1") == state
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_register_state_codec(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    with pytest.raises(ValueError):
+        KVStoreCheckpointer("collection_name", "session_key", "app", codec="reversed")
+    with pytest.raises(ValueError):
+        checkpointer.register_state_codec("re$versed", str, str)
+
+    checkpointer.register_state_codec(
+        "reversed",
+        lambda state: json.dumps(state)[::-1],
+        lambda data: json.loads(data[::-1]),
+    )
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", codec="reversed"
+    )
+    checkpoint.update("key_1", {"k": "v"})
+    assert fake.get("key_1")["state"] == '$codec:reversed$}"v" :"k"{'
+    assert checkpoint.get("key_1") == {"k": "v"}
+
+    fake.batch_save({"_key": "key_2", "state": "$codec:unknown$data"})
+    with pytest.raises(CheckpointerException):
+        checkpoint.get("key_2")
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_delta_set(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", delta_compact_count=1000
+    )
+    checkpoint.add_to_set("seen", ["id_1", "id_2"])
+    checkpoint.add_to_set("seen", ["id_2", "id_3"])
+    checkpoint.add_to_set("seen", [])
+    assert checkpoint.get("seen") == {"id_1", "id_2", "id_3"}
+    assert checkpoint.get_many(["seen"]) == {"seen": {"id_1", "id_2", "id_3"}}
+    # one small document per update, the base is not rewritten
+    assert sorted(record["_key"] for record in fake.query()) == [
+        "seen",
+        "seen#d#000000000001",
+        "seen#d#000000000002",
+    ]
+    assert len(fake.batch_save_calls) == 3
+
+    # another process continues the sequence
+    other = KVStoreCheckpointer("collection_name", "session_key", "app")
+    other.add_to_set("seen", ["id_4"])
+    assert fake.id_exists("seen#d#000000000003")
+    assert other.get("seen") == {"id_1", "id_2", "id_3", "id_4"}
+
+    with pytest.raises(CheckpointerException):
+        other.increment("seen", {"events": 1})
+    checkpoint.update("plain", [1])
+    with pytest.raises(CheckpointerException):
+        checkpoint.add_to_set("plain", [2])
+
+    other.delete("seen")
+    assert fake.query() == [fake.get("plain")]
+    assert other.get("seen") is None
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_delta_compaction(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", delta_compact_count=3
+    )
+    for i in range(7):
+        checkpoint.increment("stats", {"events": i, "polls": 1})
+    checkpoint.close()
+
+    assert checkpoint.get("stats") == {"events": 21, "polls": 7}
+    # compacted in the background, deltas merged into the base are removed
+    # by the next compaction
+    base_seq = json.loads(fake.get("stats")["state"])["seq"]
+    assert 3 <= base_seq <= 7
+    keys = [record["_key"] for record in fake.query()]
+    first_seq = int(keys[1].rsplit("#", 1)[1])
+    assert first_seq <= base_seq + 1
+    assert keys == ["stats"] + ["stats#d#%012d" % seq for seq in range(first_seq, 8)]
+
+    # deltas of a deleted checkpoint are not read back
+    fake.delete_by_id("stats")
+    checkpoint = KVStoreCheckpointer("collection_name", "session_key", "app")
+    assert checkpoint.get("stats") is None
+    checkpoint.increment("stats", {"events": 1})
+    assert checkpoint.get("stats") == {"events": 1}
+
+
+@mock.patch("solnlib._utils.get_collection_data")
+def test_kvstore_checkpointer_delta_read_during_compaction(mock_get_collection_data):
+    fake = FakeKVStoreCollectionData()
+    mock_get_collection_data.return_value = fake
+    checkpoint = KVStoreCheckpointer(
+        "collection_name", "session_key", "app", delta_compact_count=1000
+    )
+    checkpoint.add_to_set("seen", ["id_1"])
+    checkpoint.add_to_set("seen", ["id_2"])
+    # base read by a reader before the compactions
+    old_base = fake.get("seen")
+    log = checkpoint._delta_logs["seen"]
+
+    checkpoint._compact_deltas("seen", log)
+    # the merged deltas are still there for readers of the old base
+    assert checkpoint._decode_merged("seen", old_base) == {"id_1", "id_2"}
+
+    checkpoint.add_to_set("seen", ["id_3"])
+    checkpoint._compact_deltas("seen", log)
+    checkpoint.add_to_set("seen", ["id_4"])
+    assert not fake.id_exists("seen#d#000000000001")
+    # the gap in the sequence makes the reader read the new base
+    assert checkpoint._decode_merged("seen", old_base) == {
+        "id_1",
+        "id_2",
+        "id_3",
+        "id_4",
+    }
+
+
 def test_file_checkpointer_update_when_key_exists():
     with tempfile.TemporaryDirectory() as tmpdirname:
         checkpointer = FileCheckpointer(tmpdirname)
@@ -236,3 +736,92 @@ def test_file_checkpointer_delete_when_key_does_not_exist():
     with tempfile.TemporaryDirectory() as tmpdirname:
         checkpointer = FileCheckpointer(tmpdirname)
         checkpointer.delete("key_that_does_not_exist")
+
+
+def test_sqlite_checkpointer(tmp_path):
+    checkpointer = SQLiteCheckpointer(str(tmp_path))
+    assert checkpointer.get("key_1") is None
+    checkpointer.update("key_1", {"offset": 1})
+    checkpointer.update("key_1", {"offset": 2})
+    assert checkpointer.get("key_1") == {"offset": 2}
+    checkpointer.delete("key_1")
+    checkpointer.delete("key_that_does_not_exist")
+    assert checkpointer.get("key_1") is None
+    checkpointer.close()
+
+    conn = sqlite3.connect(str(tmp_path / "checkpoints.sqlite"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_sqlite_checkpointer_batch_update(tmp_path):
+    checkpointer = SQLiteCheckpointer(str(tmp_path))
+    checkpointer.update("key_0", "content")
+    states = [{"_key": "key_%d" % i, "state": i} for i in range(3)]
+    checkpointer.batch_update(states)
+    assert checkpointer.get("key_0") == 0
+    assert states[0] == {"_key": "key_0", "state": 0}
+
+    # none of the checkpoints is updated when one can not be encoded
+    with pytest.raises(TypeError):
+        checkpointer.batch_update(
+            [
+                {"_key": "key_0", "state": "updated"},
+                {"_key": "key_1", "state": object()},
+            ]
+        )
+    assert checkpointer.get("key_0") == 0
+    checkpointer.close()
+
+
+def test_sqlite_checkpointer_scan(tmp_path):
+    checkpointer = SQLiteCheckpointer(str(tmp_path))
+    checkpointer.batch_update(
+        [
+            {"_key": "input_2", "state": 2},
+            {"_key": "input_1", "state": 1},
+            {"_key": "input_\u2603", "state": 3},
+            {"_key": "inputs", "state": 4},
+            {"_key": "other", "state": 5},
+        ]
+    )
+    assert list(checkpointer.scan("input_")) == [
+        ("input_1", 1),
+        ("input_2", 2),
+        ("input_\u2603", 3),
+    ]
+    assert len(list(checkpointer.scan())) == 5
+    checkpointer.close()
+
+
+def test_sqlite_checkpointer_threads(tmp_path):
+    checkpointer = SQLiteCheckpointer(str(tmp_path))
+
+    def update(n):
+        for i in range(20):
+            checkpointer.update("key_%d" % n, i)
+
+    threads = [threading.Thread(target=update, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [checkpointer.get("key_%d" % n) for n in range(4)] == [19] * 4
+    checkpointer.close()
+
+
+def test_sqlite_checkpointer_import_file_checkpoints(tmp_path):
+    file_dir = tmp_path / "files"
+    file_dir.mkdir()
+    file_checkpointer = FileCheckpointer(str(file_dir))
+    file_checkpointer.update("key_1", {"offset": 1})
+    file_checkpointer.update("key_\u2603", [1, 2])
+    (file_dir / "lock").write_text("not a checkpoint")
+    (file_dir / "a2V5XzM=").write_text("{not json")
+
+    checkpointer = SQLiteCheckpointer(str(tmp_path))
+    assert checkpointer.import_file_checkpoints(str(file_dir), remove=True) == 2
+    assert checkpointer.get("key_1") == {"offset": 1}
+    assert checkpointer.get("key_\u2603") == [1, 2]
+    assert sorted(os.listdir(file_dir)) == ["a2V5XzM=", "lock"]
+    checkpointer.close()
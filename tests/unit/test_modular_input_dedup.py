@@ -0,0 +1,87 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+from solnlib.modular_input import Deduplicator, SQLiteCheckpointer
+from solnlib.modular_input import dedup
+
+
+def test_deduplicator_seen(tmp_path):
+    ck = SQLiteCheckpointer(str(tmp_path))
+    dedup_store = Deduplicator(ck, "dedup", capacity=1000, lru_size=10)
+
+    assert dedup_store.seen(["id_1", "id_2", "id_1"]) == [False, False, True]
+    assert dedup_store.seen(["id_2", "id_3", 4]) == [True, False, False]
+    assert dedup_store.seen(["4", "id_5"], add=False) == [True, False]
+    assert dedup_store.seen(["id_5"]) == [False]
+
+    # older IDs are found in the bloom filter once out of the LRU
+    dedup_store.add("new_%d" % i for i in range(100))
+    assert dedup_store.seen(["id_1", "id_2", "id_3"]) == [True, True, True]
+    ck.close()
+
+
+def test_deduplicator_error_rate(tmp_path):
+    ck = SQLiteCheckpointer(str(tmp_path))
+    dedup_store = Deduplicator(ck, "dedup", capacity=10000, error_rate=0.01, lru_size=0)
+    dedup_store.add("seen_%d" % i for i in range(10000))
+
+    assert all(dedup_store.seen(("seen_%d" % i for i in range(10000)), add=False))
+    false_positives = sum(
+        dedup_store.seen(("new_%d" % i for i in range(10000)), add=False)
+    )
+    assert false_positives < 200
+    ck.close()
+
+
+def test_deduplicator_window(tmp_path, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(dedup.time, "time", lambda: now[0])
+    ck = SQLiteCheckpointer(str(tmp_path))
+    dedup_store = Deduplicator(
+        ck, "dedup", window=100, generations=4, capacity=1000, lru_size=0
+    )
+    dedup_store.add(["id_1"])
+
+    now[0] += 75
+    assert dedup_store.seen(["id_1"], add=False) == [True]
+    dedup_store.add(["id_2"])
+    now[0] += 25
+    # the generation of id_1 is out of the window
+    assert dedup_store.seen(["id_1", "id_2"], add=False) == [False, True]
+    assert len(dedup_store._filters) <= 4
+    ck.close()
+
+
+def test_deduplicator_save(tmp_path):
+    ck = SQLiteCheckpointer(str(tmp_path))
+    dedup_store = Deduplicator(ck, "dedup", capacity=100000, lru_size=5)
+    dedup_store.add("id_%d" % i for i in range(1000))
+    dedup_store.save()
+
+    state = ck.get("dedup")
+    assert state["lru"] == ["id_%d" % i for i in range(995, 1000)]
+    # sparse filters are compressed
+    assert len(json.dumps(state)) < 100000
+
+    dedup_store = Deduplicator(ck, "dedup", capacity=100000, lru_size=5)
+    assert all(dedup_store.seen(("id_%d" % i for i in range(1000)), add=False))
+
+    # filters of another size are reset, the LRU is kept
+    dedup_store = Deduplicator(ck, "dedup", capacity=1000, lru_size=5)
+    assert dedup_store.seen(["id_0", "id_999"], add=False) == [False, True]
+    ck.close()
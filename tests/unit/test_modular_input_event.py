@@ -15,8 +15,13 @@
 #
 
 import json
+from xml.etree import ElementTree as ET  # nosemgrep
 
-from solnlib.modular_input import HECEvent, XMLEvent
+import defusedxml.ElementTree as defused_et
+import pytest
+
+from solnlib.modular_input import HECEvent, XMLEvent, event
+from solnlib.modular_input.event import get_json_serializer
 
 
 def to_sorted_json_string(obj):
@@ -111,6 +116,57 @@ class TestXMLEvent:
         ]
 
 
+def _element_tree_stream(events):
+    # Reference serialization, XMLEvent.format_events used to build a tree
+    stream = ET.Element("stream")
+    for e in events:
+        event = ET.SubElement(stream, "event")
+        if e._stanza:
+            event.set("stanza", e._stanza)
+        if e._unbroken:
+            event.set("unbroken", str(int(e._unbroken)))
+        if e._time is not None:
+            ET.SubElement(event, "time").text = e._time_text()
+        for node in ("index", "host", "source", "sourcetype"):
+            if getattr(e, "_" + node):
+                ET.SubElement(event, node).text = getattr(e, "_" + node)
+        data = e._data if isinstance(e._data, str) else json.dumps(e._data)
+        ET.SubElement(event, "data").text = data
+        if e._done:
+            ET.SubElement(event, "done")
+    return defused_et.tostring(stream, encoding="utf-8", method="xml")
+
+
+class TestXMLEventStreaming:
+    events = [
+        XMLEvent(
+            data="a & b < c > d \"quoted\" 'single'\r\n\t\u2603",
+            time=1372274622.4936,
+            index="main",
+            host='h&<>"',
+            stanza='test://a&b<c>"d"\r\n\t\u2603',
+            unbroken=True,
+            done=True,
+        ),
+        XMLEvent(data="", source="s", sourcetype="st"),
+        XMLEvent(data={"kk": ["<&>", 1.5]}, time=1),
+        XMLEvent(data="lone surrogate \ud800", unbroken=True),
+    ]
+
+    def test_output_is_byte_identical(self):
+        expected = _element_tree_stream(self.events)
+
+        assert b"".join(XMLEvent.iter_chunks(self.events)) == expected
+        assert XMLEvent.format_events(self.events) == [expected.decode("utf-8")]
+
+    def test_chunks(self):
+        chunks = list(XMLEvent.iter_chunks(self.events * 10, chunk_size=200))
+
+        assert len(chunks) > 1
+        assert all(len(chunk) >= 200 for chunk in chunks[:-1])
+        assert b"".join(chunks) == _element_tree_stream(self.events * 10)
+
+
 class TestHECEvent:
     @classmethod
     def setup_class(cls):
@@ -199,3 +255,161 @@ class TestHECEvent:
             == '{"event": "This is a test data3.", "host": "localhost", "index": "main", '
             '"source": "Splunk", "sourcetype": "misc", "time": 1372274622.493}'
         )
+
+    def test_iter_batches_sizes_in_bytes(self, monkeypatch):
+        monkeypatch.setattr(HECEvent, "max_hec_event_length", 1000)
+        events = (HECEvent(data="\u2603" * 50, index="main") for _ in range(20))
+
+        batches = list(HECEvent.iter_batches(events))
+
+        assert len(batches) > 1
+        for batch in batches:
+            assert isinstance(batch, bytes)
+            assert len(batch) <= 1000
+        serialized = [e for batch in batches for e in batch.split(b"\n")]
+        assert len(serialized) == 20
+        assert json.loads(serialized[0]) == {"event": "\u2603" * 50, "index": "main"}
+
+    def test_iter_batches_envelope_is_byte_identical(self):
+        fields = {"Cloud": "AWS", "region": "\u2603"}
+        events = [
+            HECEvent(data="a", time=1372274622.493, index="main", host="h1"),
+            HECEvent(data={"kk": [1, 2.5]}, time=1372274622.493, index="main"),
+            HECEvent(data="b", index="main", host="h1", fields=fields),
+            HECEvent(data="c", index="main", host="h1", fields=fields),
+            HECEvent(data="d", index="main", host="h1", fields={"other": 1}),
+            HECEvent(data="utf-8 \u2603", time=0.5, source="s", sourcetype="st"),
+            HECEvent(data=None),
+            HECEvent(data=[float("nan")], time=float("inf")),
+            HECEvent(data="e", time=1e18, index="main", host="h1"),
+        ]
+
+        for event_field in ["event", "data", "index"]:
+            expected = b"\n".join(e._to_hec(event_field) for e in events)
+            assert list(HECEvent.iter_batches(events, event_field)) == [expected]
+
+    def test_slots_and_lazy_time(self):
+        he = HECEvent(data="x", time=1372274622.4936)
+
+        assert not hasattr(he, "__dict__")
+        assert not hasattr(XMLEvent(data="x"), "__dict__")
+        assert he._time == 1372274622.4936
+        assert he._to_hec("event") == b'{"event": "x", "time": 1372274622.494}'
+        assert HECEvent(data="x", time=1)._to_hec("event") == (
+            b'{"event": "x", "time": 1.0}'
+        )
+        assert HECEvent(data="x", time=0)._to_hec("event") == b'{"event": "x"}'
+
+    def test_serialization_is_cached(self):
+        calls = []
+
+        def dumps(obj):
+            calls.append(obj)
+            return json.dumps(obj).encode("utf-8")
+
+        events = [HECEvent(data="x", index="main") for _ in range(3)]
+        first = list(HECEvent.iter_batches(events, serializer=dumps))
+        assert list(HECEvent.iter_batches(events, serializer=dumps)) == first
+        assert len(calls) == 3
+
+        # another event field or serializer encodes again
+        list(HECEvent.iter_batches(events, "data", serializer=dumps))
+        assert len(calls) == 6
+        enveloped = HECEvent.format_events(events)
+        assert HECEvent.format_events(events) == enveloped
+        assert events[0]._serialized[2] == b'{"event": "x", "index": "main"}'
+
+    def test_iter_batches_oversized_event(self, monkeypatch):
+        monkeypatch.setattr(HECEvent, "max_hec_event_length", 100)
+        events = [
+            HECEvent(data="small"),
+            HECEvent(data="x" * 200),
+            HECEvent(data="small"),
+        ]
+
+        batches = list(HECEvent.iter_batches(events))
+
+        assert [len(batch.split(b"\n")) for batch in batches] == [1, 1, 1]
+
+
+class TestJSONSerializer:
+    events = [
+        {"event": "utf-8 \u2603 data", "time": 1372274622.493, "index": "main"},
+        {"event": {"kk": [1, 2.5, None]}, "time": 1.1, "fields": {1: "x"}},
+        {"event": "nan", "time": float("nan")},
+        {"event": 2**70},
+    ]
+
+    def test_default_serializer_keeps_json_dumps_output(self):
+        he = HECEvent(data="utf-8 \u2603 data", time=1372274622.493, index="main")
+
+        assert he._to_hec("event") == json.dumps(
+            {"event": "utf-8 \u2603 data", "time": 1372274622.493, "index": "main"},
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+    def test_serializers_produce_identical_documents(self):
+        expected = [
+            json.dumps(e, ensure_ascii=False).encode("utf-8") for e in self.events
+        ]
+        for name in event._json_serializers:
+            dumps = get_json_serializer(name)
+            for event_, data in zip(self.events, expected):
+                serialized = dumps(event_)
+                assert isinstance(serialized, bytes)
+                # NaN does not compare equal, compare the re-serialized form
+                assert (
+                    json.dumps(json.loads(serialized)).encode()
+                    == json.dumps(json.loads(data)).encode()
+                )
+
+    def test_orjson_falls_back_for_nan(self):
+        pytest.importorskip("orjson")
+        dumps = get_json_serializer("orjson")
+
+        assert b"NaN" in dumps({"time": float("nan")})
+        assert b"Infinity" in dumps({"time": float("inf")})
+        assert dumps({"event": 2**70}) == b'{"event": 1180591620717411303424}'
+        assert b"-Infinity" in dumps({"event": {"values": [1, (2.5, float("-inf"))]}})
+
+    def test_orjson_keeps_null(self):
+        pytest.importorskip("orjson")
+        dumps = get_json_serializer("orjson")
+
+        # compact orjson output, no fallback to the json module
+        assert dumps({"event": None, "time": 1.5}) == b'{"event":null,"time":1.5}'
+
+    def test_ujson_falls_back_on_overflow(self, monkeypatch):
+        class FakeUJSON:
+            @staticmethod
+            def dumps(obj, **kwargs):
+                raise OverflowError("Maximum recursion level reached")
+
+        monkeypatch.setattr(event, "ujson", FakeUJSON)
+
+        assert (
+            event._ujson_dumps({"event": 2**70})
+            == b'{"event": 1180591620717411303424}'
+        )
+
+    def test_auto_selection(self, monkeypatch):
+        monkeypatch.setattr(event, "_json_serializers", {"json": event._stdlib_dumps})
+        assert get_json_serializer() is event._stdlib_dumps
+
+        monkeypatch.setattr(
+            event,
+            "_json_serializers",
+            {"json": event._stdlib_dumps, "ujson": event._ujson_dumps},
+        )
+        assert get_json_serializer() is event._ujson_dumps
+
+    def test_callable_and_unknown_serializer(self):
+        def dumps(obj):
+            return b"{}"
+
+        assert get_json_serializer(dumps) is dumps
+        assert list(HECEvent.iter_batches([HECEvent(data="x")], serializer=dumps)) == [
+            b"{}"
+        ]
+        with pytest.raises(ValueError):
+            get_json_serializer("simplejson")
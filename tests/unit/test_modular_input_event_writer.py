@@ -14,15 +14,34 @@
 # limitations under the License.
 #
 
+import gzip
+import io
 import json
+import os
+import queue
+import re
 import sys
+import threading
+import time
 
 import common
 import pytest
 from splunklib import binding
 from unittest.mock import patch
 
-from solnlib.modular_input import ClassicEventWriter, HECEventWriter
+from solnlib.modular_input import (
+    AsyncHECEventWriter,
+    EventException,
+    ClassicEventWriter,
+    HECEvent,
+    HECEventWriter,
+    HECEventWriterException,
+    HECSpool,
+    ProcessClassicEventWriter,
+    XMLEvent,
+)
+from solnlib.concurrent import process_pool
+from solnlib.modular_input import event_writer
 from solnlib.modular_input.event_writer import FunctionDeprecated, deprecation_msg
 
 
@@ -88,6 +107,202 @@ def test_classic_event_writer(monkeypatch):
     assert mock_stdout.write_count == 1
 
 
+def test_classic_event_writer_stdout_buffer(monkeypatch):
+    class MockStdout:
+        def __init__(self):
+            self.buffer = io.BytesIO()
+            self.flushed = 0
+
+        def write(self, data):
+            raise AssertionError("text written")
+
+        def flush(self):
+            self.flushed += 1
+
+    mock_stdout = MockStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+    monkeypatch.setattr(XMLEvent, "chunk_size", 100)
+
+    ew = ClassicEventWriter()
+    events = [
+        ew.create_event(data="data \u2603 %d" % i, index="main") for i in range(20)
+    ]
+    ew.write_events(events)
+
+    assert mock_stdout.buffer.getvalue() == XMLEvent.format_events(events)[0].encode(
+        "utf-8"
+    )
+    assert mock_stdout.flushed == 1
+
+
+def test_classic_event_writer_serialize_error(monkeypatch):
+    mock_stdout = io.StringIO()
+    mock_stdout.buffer = io.BytesIO()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+    monkeypatch.setattr(XMLEvent, "chunk_size", 100)
+
+    ew = ClassicEventWriter()
+    events = [ew.create_event(data="data %d" % i) for i in range(20)]
+    events.append(ew.create_event(data="data", index=123))
+    with pytest.raises(TypeError):
+        ew.write_events(events)
+    # nothing of the document was written
+    assert mock_stdout.buffer.getvalue() == b""
+
+
+class MockBufferedStdout:
+    def __init__(self):
+        self.writes = []
+        self.buffer = self
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def flush(self):
+        pass
+
+
+def test_classic_event_writer_buffered(monkeypatch):
+    mock_stdout = MockBufferedStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+
+    ew = ClassicEventWriter(buffered=True, flush_interval=60)
+    events = [ew.create_event(data="data %d" % i, index="main") for i in range(10)]
+    ew.write_events(events[:4])
+    ew.write_events(events[4:])
+    assert mock_stdout.writes == []
+
+    ew.flush()
+    assert mock_stdout.writes == [XMLEvent.format_events(events)[0].encode("utf-8")]
+
+    ew.write_events(events[:1])
+    ew.close()
+    assert len(mock_stdout.writes) == 2
+    assert mock_stdout.writes[1] == XMLEvent.format_events(events[:1])[0].encode(
+        "utf-8"
+    )
+
+    # written right away once closed
+    ew.write_events(events[:1])
+    assert len(mock_stdout.writes) == 3
+
+
+def test_classic_event_writer_buffered_thresholds(monkeypatch):
+    mock_stdout = MockBufferedStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+
+    ew = ClassicEventWriter(buffered=True, flush_events=3, flush_interval=60)
+    events = [ew.create_event(data="data %d" % i) for i in range(7)]
+    ew.write_events(events)
+    assert mock_stdout.writes == [
+        XMLEvent.format_events(events[:3])[0].encode("utf-8"),
+        XMLEvent.format_events(events[3:6])[0].encode("utf-8"),
+    ]
+    ew.close()
+
+    mock_stdout.writes.clear()
+    event_size = len(events[0]._to_xml())
+    ew = ClassicEventWriter(
+        buffered=True, flush_bytes=2 * event_size, flush_interval=60
+    )
+    ew.write_events(events[:5])
+    assert len(mock_stdout.writes) == 2
+    ew.close()
+    assert len(mock_stdout.writes) == 3
+    assert b"".join(mock_stdout.writes).count(b"<event") == 5
+
+
+def test_classic_event_writer_buffered_interval(monkeypatch):
+    mock_stdout = MockBufferedStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+
+    ew = ClassicEventWriter(buffered=True, flush_interval=0.05)
+    ew.write_events([ew.create_event(data="data")])
+    deadline = time.time() + 5
+    while not mock_stdout.writes and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(mock_stdout.writes) == 1
+    ew.close()
+    assert len(mock_stdout.writes) == 1
+
+
+def test_classic_event_writer_buffered_threads(monkeypatch):
+    mock_stdout = MockBufferedStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+
+    ew = ClassicEventWriter(buffered=True, flush_interval=60)
+
+    def write(n):
+        ew.write_events([ew.create_event(data="thread %d" % n) for _ in range(5)])
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ew.close()
+
+    # one stream per thread, events of a thread are not interleaved
+    assert len(mock_stdout.writes) == 4
+    for write in mock_stdout.writes:
+        assert write.count(b"<event") == 5
+        assert len(set(re.findall(rb"thread \d", write))) == 1
+
+
+_worker_event_writer = None
+
+
+def _init_worker(ew):
+    global _worker_event_writer
+    _worker_event_writer = ew
+
+
+def _write_from_worker(n):
+    ew = _worker_event_writer
+    ew.write_events([ew.create_event(data="worker %d" % n) for _ in range(3)])
+    # only the process which created the event writer stops it
+    ew.close()
+    return os.getpid()
+
+
+def test_process_classic_event_writer(monkeypatch):
+    mock_stdout = MockBufferedStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+
+    ew = ProcessClassicEventWriter()
+    pool = process_pool.ProcessPool(size=2, initializer=_init_worker, initargs=(ew,))
+    pids = [pool.apply(_write_from_worker, (n,)) for n in range(5)]
+    pool.tear_down()
+    assert os.getpid() not in pids
+
+    ew.write_events([ew.create_event(data="parent")])
+    ew.close()
+
+    written = b"".join(mock_stdout.writes)
+    assert written.count(b"<stream>") == len(mock_stdout.writes)
+    assert written.count(b"<event>") == 16
+    for n in range(5):
+        assert written.count(b"worker %d" % n) == 3
+    assert b"parent" in written
+
+
+def test_process_classic_event_writer_coalesces(monkeypatch):
+    mock_stdout = MockBufferedStdout()
+    monkeypatch.setattr(sys, "stdout", mock_stdout)
+
+    ew = ProcessClassicEventWriter()
+    events = [ew.create_event(data="data %d" % i) for i in range(6)]
+    with ew._lock:
+        # the writer thread waits for the lock while chunks are queued
+        for event in events:
+            ew.write_events([event])
+        time.sleep(0.2)
+    ew.close()
+
+    assert b"".join(mock_stdout.writes).count(b"<event>") == 6
+    assert len(mock_stdout.writes) <= 2
+
+
 def create_hec_event_writer__create_from_input(hec=False):
     return HECEventWriter.create_from_input(
         "HECTestInput",
@@ -339,3 +554,821 @@ def test_hec_event_writer_create_from_token_deprecation(hec, monkeypatch, caplog
         with pytest.warns(DeprecationWarning, match=deprecation_msg):
             ev = create_hec_event_writer__create_from_token(hec=False)
             assert ev._rest_client.scheme == "https"
+
+
+def _create_events(ew, count):
+    return [
+        ew.create_event(
+            data="DATA" + str(i) + ": This is test data. " * 20,
+            time=1372274622.493,
+            index="main",
+            host="localhost",
+            source="Splunk",
+            sourcetype="misc",
+        )
+        for i in range(count)
+    ]
+
+
+def test_hec_event_writer_max_in_flight(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.append(query["body"])
+
+    monkeypatch.setattr(HECEventWriter, "_get_hec_config", mock_get_hec_config)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    monkeypatch.setattr(HECEvent, "max_hec_event_length", 10000)
+
+    ew = HECEventWriter(
+        "HECTestInput",
+        common.SESSION_KEY,
+        global_settings_schema=False,
+        max_in_flight=4,
+    )
+    events = _create_events(ew, 200)
+    ew.write_events(events)
+
+    expected = list(HECEvent.iter_batches(events, "event", ew._serializer))
+    assert len(expected) > 4
+    assert sorted(posted) == sorted(expected)
+
+
+def test_hec_event_writer_max_in_flight_partial_failure(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if b"DATA0:" in query["body"]:
+            raise binding.HTTPError(common.make_response_record(b"", status=400))
+        posted.append(query["body"])
+
+    monkeypatch.setattr(HECEventWriter, "_get_hec_config", mock_get_hec_config)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    monkeypatch.setattr(HECEvent, "max_hec_event_length", 10000)
+
+    ew = HECEventWriter(
+        "HECTestInput",
+        common.SESSION_KEY,
+        global_settings_schema=False,
+        max_in_flight=4,
+    )
+    events = _create_events(ew, 200)
+    batch_count = len(list(HECEvent.iter_batches(events, "event", ew._serializer)))
+
+    with pytest.raises(HECEventWriterException) as e:
+        ew.write_events(events)
+
+    assert list(e.value.failures) == [0]
+    assert e.value.failures[0].status == 400
+    assert e.value.batch_count == batch_count
+    assert len(posted) == batch_count - 1
+
+
+def _mock_async_hec_event_writer(monkeypatch, mock_post, **kwargs):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    monkeypatch.setattr(HECEventWriter, "_get_hec_config", mock_get_hec_config)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    return AsyncHECEventWriter(
+        "HECTestInput", common.SESSION_KEY, global_settings_schema=False, **kwargs
+    )
+
+
+def test_async_hec_event_writer(monkeypatch):
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.extend(query["body"].decode("utf-8").split("\n"))
+
+    ew = _mock_async_hec_event_writer(monkeypatch, mock_post)
+    events = _create_events(ew, 50)
+    ew.write_events(events[:20])
+    ew.write_events(events[20:])
+    assert ew.flush(timeout=10)
+    assert ew.queued_events == 0
+    assert [json.loads(e)["event"] for e in posted] == [e._data for e in events]
+    assert ew.close(timeout=10)
+
+    with pytest.raises(RuntimeError):
+        ew.write_events(events)
+
+
+def test_async_hec_event_writer_overflow(monkeypatch):
+    release = threading.Event()
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        release.wait(10)
+        posted.extend(query["body"].decode("utf-8").split("\n"))
+
+    ew = _mock_async_hec_event_writer(
+        monkeypatch, mock_post, queue_size=5, overflow_policy="raise"
+    )
+    events = _create_events(ew, 12)
+    ew.write_events(events[:1])
+    # wait until the sender thread picked the first event
+    while ew._in_flight != 1:
+        time.sleep(0.01)
+    ew.write_events(events[1:6])
+    with pytest.raises(queue.Full):
+        ew.write_events(events[6:7])
+    release.set()
+    assert ew.close(timeout=10)
+    assert len(posted) == 6
+    assert ew.failed_events == 0
+
+
+def test_async_hec_event_writer_drop_oldest(monkeypatch):
+    release = threading.Event()
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        release.wait(10)
+        posted.extend(query["body"].decode("utf-8").split("\n"))
+
+    ew = _mock_async_hec_event_writer(
+        monkeypatch, mock_post, queue_size=5, overflow_policy="drop_oldest"
+    )
+    events = _create_events(ew, 12)
+    ew.write_events(events[:1])
+    while ew._in_flight != 1:
+        time.sleep(0.01)
+    ew.write_events(events[1:])
+    assert ew.dropped_events == 6
+    release.set()
+    assert ew.close(timeout=10)
+    assert [json.loads(e)["event"] for e in posted] == [
+        e._data for e in events[:1] + events[7:]
+    ]
+
+
+def test_async_hec_event_writer_close_timeout(monkeypatch, tmp_path):
+    release = threading.Event()
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        release.wait(10)
+        posted.append(query["body"])
+
+    spool = HECSpool(str(tmp_path))
+    ew = _mock_async_hec_event_writer(monkeypatch, mock_post, spool=spool)
+    ew.write_events(_create_events(ew, 3))
+    assert not ew.close(timeout=0.05)
+    # the sender still writes, the spool stays locked until it stops
+    assert spool._lock_file is not None
+    release.set()
+    ew._sender.join(10)
+    assert len(posted) == 1
+    assert spool._lock_file is None
+
+
+def test_async_hec_event_writer_use_ack(monkeypatch):
+    with pytest.raises(ValueError):
+        _mock_async_hec_event_writer(monkeypatch, None, use_ack=True)
+
+
+@pytest.mark.parametrize(
+    "event_count, compressed",
+    [
+        (1, False),
+        (100, True),
+    ],
+)
+def test_hec_event_writer_gzip_compression(monkeypatch, event_count, compressed):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.append((dict(headers), query["body"]))
+
+    monkeypatch.setattr(HECEventWriter, "_get_hec_config", mock_get_hec_config)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+
+    ew = HECEventWriter(
+        "HECTestInput",
+        common.SESSION_KEY,
+        global_settings_schema=False,
+        compression="gzip",
+        compression_threshold=1024,
+    )
+    events = _create_events(ew, event_count)
+    ew.write_events(events)
+
+    assert len(posted) == 1
+    headers, body = posted[0]
+    expected = next(HECEvent.iter_batches(events, serializer=ew._serializer))
+    if compressed:
+        assert headers["Content-Encoding"] == "gzip"
+        assert len(body) < len(expected)
+        assert gzip.decompress(body) == expected
+    else:
+        assert "Content-Encoding" not in headers
+        assert body == expected
+
+
+def test_hec_event_writer_use_ack(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    channels = set()
+    next_ack_id = [0]
+    indexed = set()
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        channels.add(dict(headers)["X-Splunk-Request-Channel"])
+        if path_segment.endswith("/ack"):
+            acks = json.loads(query["body"])["acks"]
+            return common.make_response_record(
+                json.dumps({"acks": {str(i): i in indexed for i in acks}})
+            )
+        ack_id = next_ack_id[0]
+        next_ack_id[0] += 1
+        return common.make_response_record(
+            json.dumps({"text": "Success", "code": 0, "ackId": ack_id})
+        )
+
+    monkeypatch.setattr(HECEventWriter, "_get_hec_config", mock_get_hec_config)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    monkeypatch.setattr(HECEvent, "max_hec_event_length", 10000)
+
+    ew = HECEventWriter(
+        "HECTestInput", common.SESSION_KEY, global_settings_schema=False, use_ack=True
+    )
+    ack_ids = ew.write_events(_create_events(ew, 50))
+
+    assert ack_ids == list(range(len(ack_ids)))
+    assert len(ack_ids) > 1
+    assert ew.pending_acks == set(ack_ids)
+    assert len(channels) == 1
+
+    indexed.add(0)
+    assert ew.poll_acks() == {0}
+    assert ew.pending_acks == set(ack_ids[1:])
+    assert not ew.wait_for_acks(ack_ids, timeout=0, poll_interval=0.01)
+
+    indexed.update(ack_ids)
+    assert ew.wait_for_acks(ack_ids, timeout=1, poll_interval=0.01)
+    assert ew.pending_acks == set()
+
+
+def test_hec_event_writer_write_raw(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+
+    def mock_get_hec_config(
+        self, hec_input_name, session_key, scheme, host, port, **context
+    ):
+        return "8088", "87de04d1-0823-11e6-9c94-a45e60e"
+
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.append((path_segment, dict(headers), query))
+
+    monkeypatch.setattr(HECEventWriter, "_get_hec_config", mock_get_hec_config)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    monkeypatch.setattr(HECEvent, "max_hec_event_length", 100)
+
+    ew = HECEventWriter(
+        "HECTestInput", common.SESSION_KEY, global_settings_schema=False
+    )
+    lines = ["line %02d: some syslog message\n" % i for i in range(6)]
+    lines.append("line 06: \u2603 bytes\r\n".encode())
+    ew.write_raw(iter(lines), sourcetype="syslog", index="main", channel="ch")
+
+    assert len(posted) > 1
+    for path_segment, headers, query in posted:
+        assert path_segment == "/services/collector/raw"
+        assert headers["X-Splunk-Request-Channel"] == "ch"
+        assert query["sourcetype"] == "syslog"
+        assert query["index"] == "main"
+        assert "host" not in query
+        assert len(query["body"]) <= 100
+    body = b"\n".join(query["body"] for _, _, query in posted)
+    assert body.decode("utf-8").split("\n") == [
+        "line %02d: some syslog message" % i for i in range(6)
+    ] + ["line 06: \u2603 bytes"]
+
+
+def _create_multi_endpoint_hec_event_writer(monkeypatch, mock_post, **kwargs):
+    common.mock_splunkhome(monkeypatch)
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    monkeypatch.setattr(HECEvent, "max_hec_event_length", 10000)
+    return HECEventWriter.create_from_token_with_session_key(
+        "https://localhost:8089",
+        common.SESSION_KEY,
+        None,
+        "test_token",
+        hec_uris=[
+            "https://idx1:8088",
+            "https://idx2:8088",
+            "https://idx3:8088",
+        ],
+        **kwargs
+    )
+
+
+def test_hec_event_writer_multiple_endpoints_round_robin(monkeypatch):
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.append(self.host)
+
+    ew = _create_multi_endpoint_hec_event_writer(monkeypatch, mock_post)
+    ew.write_events(_create_events(ew, 100))
+
+    assert len(posted) >= 6
+    assert posted[:6] == ["idx1", "idx2", "idx3", "idx1", "idx2", "idx3"]
+    stats = ew.endpoint_stats()
+    assert sorted(stats) == [
+        "https://idx1:8088",
+        "https://idx2:8088",
+        "https://idx3:8088",
+    ]
+    assert sum(s["events"] for s in stats.values()) == 100
+    assert sum(s["batches"] for s in stats.values()) == len(posted)
+
+
+def test_hec_event_writer_multiple_endpoints_eject_and_recover(monkeypatch):
+    posted = []
+    unavailable = {"idx2"}
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if self.host in unavailable:
+            raise binding.HTTPError(common.make_response_record(b"", status=503))
+        posted.append(self.host)
+
+    ew = _create_multi_endpoint_hec_event_writer(
+        monkeypatch, mock_post, eject_after=2, eject_period=0.2
+    )
+    for _ in range(4):
+        ew.write_events(_create_events(ew, 1))
+
+    stats = ew.endpoint_stats()
+    assert stats["https://idx2:8088"]["ejected"]
+    assert stats["https://idx2:8088"]["failures"] == 2
+    assert stats["https://idx2:8088"]["batches"] == 0
+
+    del posted[:]
+    for _ in range(4):
+        ew.write_events(_create_events(ew, 1))
+    assert "idx2" not in posted
+
+    unavailable.clear()
+    time.sleep(0.2)
+    del posted[:]
+    for _ in range(6):
+        ew.write_events(_create_events(ew, 1))
+    assert "idx2" in posted
+    assert not ew.endpoint_stats()["https://idx2:8088"]["ejected"]
+
+
+def test_hec_event_writer_multiple_endpoints_fail_over(monkeypatch):
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if self.host == "idx1":
+            raise ConnectionError("Connection refused")
+        posted.append(self.host)
+
+    ew = _create_multi_endpoint_hec_event_writer(
+        monkeypatch, mock_post, load_balancing="least_outstanding"
+    )
+    ew.write_events(_create_events(ew, 1))
+
+    assert posted == ["idx2"]
+    assert ew.endpoint_stats()["https://idx1:8088"]["failures"] == 1
+
+
+def test_hec_event_writer_multiple_endpoints_throttled(monkeypatch):
+    posted = []
+    sleeps = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.append(self.host)
+        raise binding.HTTPError(common.make_response_record(b"", status=429))
+
+    ew = _create_multi_endpoint_hec_event_writer(monkeypatch, mock_post)
+    monkeypatch.setattr(event_writer.time, "sleep", sleeps.append)
+    with pytest.raises(binding.HTTPError):
+        ew.write_events(_create_events(ew, 1))
+
+    # fail over without waiting until every endpoint throttled
+    assert posted == ["idx1", "idx2", "idx3", "idx1", "idx2"]
+    assert len(sleeps) == 1
+    assert 10 <= sleeps[0] <= 11
+
+
+def test_hec_event_writer_post_error_releases_endpoint(monkeypatch):
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        raise ValueError("Invalid response")
+
+    ew = _create_multi_endpoint_hec_event_writer(
+        monkeypatch, mock_post, rate_control=True, rate_control_max_in_flight=1
+    )
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            ew.write_events(_create_events(ew, 1))
+    assert [e.in_flight for e in ew._endpoints] == [0, 0, 0]
+    assert all(e.rate_limiter._in_flight == 0 for e in ew._endpoints)
+
+
+def test_hec_event_writer_reserve_endpoint_single_probe(monkeypatch):
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        pass
+
+    ew = _create_multi_endpoint_hec_event_writer(monkeypatch, mock_post)
+    idx1, idx2, idx3 = ew._endpoints
+    # idx1 and idx2 ejection expired, idx3 is ejected for a while
+    idx1.ejected_until = idx2.ejected_until = time.time() - 1
+    idx3.ejected_until = time.time() + 60
+
+    probes = [ew._reserve_endpoint() for _ in range(2)]
+    assert sorted(e.uri for e in probes) == ["https://idx1:8088", "https://idx2:8088"]
+    assert [e.in_flight for e in ew._endpoints] == [1, 1, 0]
+
+    # no endpoint is available, pick the one recovering first
+    idx1.ejected_until = time.time() + 30
+    assert ew._reserve_endpoint() is idx2
+
+    # a concurrent successful probe cleared the ejection after the
+    # availability check
+    monkeypatch.setattr(event_writer._HECEndpoint, "is_available", lambda e, now: False)
+    idx3.ejected_until = None
+    assert ew._reserve_endpoint() is idx3
+
+
+def test_hec_event_writer_rate_control(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+    monkeypatch.setattr(event_writer._AIMDRateLimiter, "_limiters", {})
+    posted = []
+    responses = [429, 429]
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if responses:
+            e = binding.HTTPError(
+                common.make_response_record(b"", status=responses.pop(0))
+            )
+            e.headers = {"Retry-After": "0.1"}
+            raise e
+        posted.append(time.time())
+
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+
+    def create_writer():
+        return HECEventWriter.create_from_token_with_session_key(
+            "https://localhost:8089",
+            common.SESSION_KEY,
+            "https://localhost:8090",
+            "test_token",
+            rate_control=True,
+            rate_control_max_in_flight=8,
+        )
+
+    ew1 = create_writer()
+    ew2 = create_writer()
+    limiter = ew1._endpoints[0].rate_limiter
+    assert limiter is ew2._endpoints[0].rate_limiter
+
+    start = time.time()
+    ew1.write_events(_create_events(ew1, 1))
+    # paused for Retry-After after each 429, instead of 10 + 20 seconds
+    assert 0.2 <= posted[0] - start < 5
+    # the two 429 within decrease_interval halve the window only once
+    assert 4 <= limiter.window < 8
+    assert ew2.endpoint_stats()["https://localhost:8090"]["rate_window"] == (
+        limiter.window
+    )
+
+    window = limiter.window
+    ew2.write_events(_create_events(ew2, 1))
+    assert limiter.window > window
+
+
+def test_aimd_rate_limiter_bounds_in_flight():
+    limiter = event_writer._AIMDRateLimiter(2)
+    limiter.acquire()
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release()
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_aimd_rate_limiter_outcomes(monkeypatch):
+    limiter = event_writer._AIMDRateLimiter(8)
+    limiter.acquire()
+    limiter.release(limiter.THROTTLED, retry_after=0)
+    assert limiter.window == 4
+
+    # connection errors and rejected payloads do not grow the window or
+    # reset the throttling backoff
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.window == 4
+    assert limiter._throttled_count == 1
+
+    limiter.acquire()
+    limiter.release(limiter.SUCCEEDED)
+    assert limiter.window == 4.25
+    assert limiter._throttled_count == 0
+
+
+def test_hec_event_writer_rate_control_errors_are_neutral(monkeypatch):
+    common.mock_splunkhome(monkeypatch)
+    monkeypatch.setattr(event_writer._AIMDRateLimiter, "_limiters", {})
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        raise binding.HTTPError(common.make_response_record(b"", status=400))
+
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    ew = HECEventWriter.create_from_token_with_session_key(
+        "https://localhost:8089",
+        common.SESSION_KEY,
+        "https://localhost:8090",
+        "test_token",
+        rate_control=True,
+        rate_control_max_in_flight=8,
+    )
+    limiter = ew._endpoints[0].rate_limiter
+    limiter.acquire()
+    limiter.release(limiter.THROTTLED, retry_after=0)
+
+    with pytest.raises(binding.HTTPError):
+        ew.write_events(_create_events(ew, 1))
+    assert limiter.window == 4
+    assert limiter._in_flight == 0
+
+
+def test_hec_event_writer_spool(monkeypatch, tmp_path):
+    common.mock_splunkhome(monkeypatch)
+    posted = []
+    available = threading.Event()
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if not available.is_set():
+            raise ConnectionError("Connection refused")
+        posted.append(query["body"])
+
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+
+    ew = HECEventWriter.create_from_token_with_session_key(
+        "https://localhost:8089",
+        common.SESSION_KEY,
+        "https://localhost:8090",
+        "test_token",
+        spool=HECSpool(str(tmp_path)),
+        spool_replay_interval=0.05,
+    )
+    events = _create_events(ew, 3)
+    ew.write_events(events[:2])
+    ew.write_events(events[2:])
+    assert ew.spool_stats()["spooled_events"] == 3
+
+    available.set()
+    deadline = time.time() + 5
+    while ew.spool_stats()["spooled_events"] and time.time() < deadline:
+        time.sleep(0.01)
+    ew.close()
+
+    assert ew.spool_stats()["spooled_events"] == 0
+    assert [json.loads(e)["event"] for e in b"\n".join(posted).split(b"\n")] == [
+        e._data for e in events
+    ]
+
+
+def test_hec_event_writer_spool_use_ack(monkeypatch, tmp_path):
+    common.mock_splunkhome(monkeypatch)
+    available = threading.Event()
+    next_ack_id = [100]
+    indexed = set()
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if path_segment.endswith("/ack"):
+            acks = json.loads(query["body"])["acks"]
+            return common.make_response_record(
+                json.dumps({"acks": {str(i): i in indexed for i in acks}})
+            )
+        if not available.is_set():
+            raise ConnectionError("Connection refused")
+        ack_id = next_ack_id[0]
+        next_ack_id[0] += 1
+        return common.make_response_record(json.dumps({"ackId": ack_id}))
+
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+
+    # a batch spooled by a previous process
+    spool = HECSpool(str(tmp_path))
+    spool.append(b'{"event": "old"}', "/services/collector", events=1, ack_id="x:0")
+    spool.close()
+
+    ew = HECEventWriter.create_from_token_with_session_key(
+        "https://localhost:8089",
+        common.SESSION_KEY,
+        "https://localhost:8090",
+        "test_token",
+        use_ack=True,
+        spool=HECSpool(str(tmp_path)),
+        spool_replay_interval=0.05,
+    )
+    ack_ids = ew.write_events(_create_events(ew, 1))
+
+    assert len(ack_ids) == 1 and ack_ids[0] is not None
+    assert ew.query_acks(ack_ids) == {ack_ids[0]: False}
+    assert not ew.wait_for_acks(ack_ids, timeout=0)
+
+    available.set()
+    deadline = time.time() + 5
+    while ew.spool_stats()["spooled_events"] and time.time() < deadline:
+        time.sleep(0.01)
+    ew.close()
+
+    # the old batch is replayed without registering an acknowledgement
+    assert next_ack_id[0] == 102
+    assert ew.pending_acks == set(ack_ids)
+    assert ew.query_acks(ack_ids) == {ack_ids[0]: False}
+    indexed.add(101)
+    assert ew.wait_for_acks(ack_ids, timeout=1, poll_interval=0.01)
+
+
+def test_hec_event_writer_spool_replay_errors(monkeypatch, tmp_path):
+    common.mock_splunkhome(monkeypatch)
+    statuses = [401, 403, 400, 503]
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        if statuses:
+            raise binding.HTTPError(
+                common.make_response_record(b"", status=statuses.pop(0))
+            )
+        posted.append(query["body"])
+
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+
+    spool = HECSpool(str(tmp_path))
+    spool.append(b'{"event": "invalid"}', "/services/collector", events=1)
+    spool.append(b'{"event": "valid"}', "/services/collector", events=1)
+    spool.close()
+
+    ew = HECEventWriter.create_from_token_with_session_key(
+        "https://localhost:8089",
+        common.SESSION_KEY,
+        "https://localhost:8090",
+        "test_token",
+        spool=HECSpool(str(tmp_path)),
+        spool_replay_interval=0.01,
+    )
+    deadline = time.time() + 5
+    while ew.spool_stats()["spooled_events"] and time.time() < deadline:
+        time.sleep(0.01)
+    ew.close()
+
+    # the first batch is retried after 401 and 403 and dropped on 400
+    assert posted == [b'{"event": "valid"}']
+
+
+def test_classic_event_writer_create_events_bulk(monkeypatch):
+    written = []
+
+    class MockStdout:
+        def write(self, data):
+            written.append(data)
+
+        def flush(self):
+            pass
+
+    monkeypatch.setattr(sys, "stdout", MockStdout())
+
+    ew = ClassicEventWriter()
+    columns = ew.create_events_bulk(
+        data=["data1", {"kk": [1, 2]}],
+        time=[1372274622.493, None],
+        index="main",
+        sourcetype=["misc", "json"],
+        stanza="test_scheme://test",
+    )
+    ew.write_events(columns)
+    ew.write_events(list(columns))
+
+    assert len(written) == 2
+    assert written[0] == written[1]
+
+
+@pytest.mark.parametrize("serializer", [None, "json"])
+def test_hec_event_writer_create_events_bulk(monkeypatch, serializer):
+    common.mock_splunkhome(monkeypatch)
+    posted = []
+
+    def mock_post(
+        self, path_segment, owner=None, app=None, sharing=None, headers=None, **query
+    ):
+        posted.append(query["body"])
+
+    monkeypatch.setattr(binding.Context, "post", mock_post)
+    ew = HECEventWriter.create_from_token_with_session_key(
+        "https://localhost:8089",
+        common.SESSION_KEY,
+        "https://localhost:8090",
+        "test_token",
+        serializer=serializer,
+    )
+    fields = {"Cloud": "AWS"}
+    columns = ew.create_events_bulk(
+        data=["data \u2603", {"kk": [1, 2]}, "data3"],
+        time=[1372274622.4936, 0, 1372274623],
+        index="main",
+        host=["h1", "h1", None],
+        sourcetype="misc",
+        fields=fields,
+    )
+    events = list(columns)
+
+    def mock_init(self, *args, **kwargs):
+        raise AssertionError("HECEvent created")
+
+    monkeypatch.setattr(HECEvent, "__init__", mock_init)
+    ew.write_events(columns)
+    monkeypatch.undo()
+
+    expected = b"\n".join(HECEvent.iter_batches(events, serializer=ew._serializer))
+    assert posted == [expected]
+
+    with pytest.raises(EventException):
+        ew.create_events_bulk(data=["a", "b"], time=[1.0])
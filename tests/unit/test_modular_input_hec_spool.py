@@ -0,0 +1,108 @@
+#
+# Copyright 2025 Splunk Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import pytest
+
+from solnlib.modular_input import HECSpool, HECSpoolException
+
+
+def _drain(spool):
+    bodies = []
+    while True:
+        batch = spool.peek()
+        if batch is None:
+            return bodies
+        bodies.append(batch.body)
+        spool.pop()
+
+
+def test_hec_spool_replays_in_order(tmp_path):
+    spool = HECSpool(str(tmp_path), segment_bytes=100)
+    for i in range(10):
+        assert spool.append(
+            b"batch %d" % i,
+            "/services/collector/raw",
+            query={"sourcetype": "syslog"},
+            channel="ch",
+            events=2,
+        )
+    assert spool.spooled_events == 20
+    assert spool.spooled_bytes == sum(len(b"batch %d" % i) for i in range(10))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".seg")]) > 1
+
+    batch = spool.peek()
+    assert batch.path == "/services/collector/raw"
+    assert batch.query == {"sourcetype": "syslog"}
+    assert batch.channel == "ch"
+    assert batch.events == 2
+
+    assert _drain(spool) == [b"batch %d" % i for i in range(10)]
+    assert spool.stats()["spooled_events"] == 0
+    assert spool.stats()["spooled_bytes"] == 0
+    # only the segment being appended to is left
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".seg")]) == 1
+
+
+def test_hec_spool_resumes_after_restart(tmp_path):
+    spool = HECSpool(str(tmp_path), segment_bytes=100, fsync="always")
+    for i in range(6):
+        spool.append(b"batch %d" % i, "/services/collector", events=1)
+    spool.pop()
+    spool.pop()
+    spool.close()
+
+    spool = HECSpool(str(tmp_path))
+    assert spool.spooled_events == 4
+    spool.append(b"batch 6", "/services/collector", events=1)
+    assert _drain(spool) == [b"batch %d" % i for i in range(2, 7)]
+
+
+def test_hec_spool_ignores_torn_record(tmp_path):
+    spool = HECSpool(str(tmp_path))
+    spool.append(b"batch 0", "/services/collector", events=1)
+    spool.append(b"batch 1", "/services/collector", events=1)
+    spool.close()
+    segment = [name for name in os.listdir(tmp_path) if name.endswith(".seg")][0]
+    with open(os.path.join(tmp_path, segment), "rb+") as fp:
+        fp.truncate(os.path.getsize(os.path.join(tmp_path, segment)) - 3)
+
+    spool = HECSpool(str(tmp_path))
+    assert spool.spooled_events == 1
+    spool.append(b"batch 2", "/services/collector", events=1)
+    assert _drain(spool) == [b"batch 0", b"batch 2"]
+
+
+def test_hec_spool_max_bytes(tmp_path):
+    spool = HECSpool(str(tmp_path), max_bytes=200)
+    assert spool.append(b"x" * 100, "/services/collector", events=1)
+    assert not spool.append(b"x" * 100, "/services/collector", events=1)
+    assert spool.spooled_events == 1
+
+
+def test_hec_spool_invalid_fsync(tmp_path):
+    with pytest.raises(ValueError):
+        HECSpool(str(tmp_path), fsync="sometimes")
+
+
+def test_hec_spool_locks_directory(tmp_path):
+    spool = HECSpool(str(tmp_path))
+    with pytest.raises(HECSpoolException):
+        HECSpool(str(tmp_path))
+
+    spool.close()
+    HECSpool(str(tmp_path)).close()